@@ -0,0 +1,339 @@
+# analytics.py
+## Multi-year spending analytics computed with NumPy.
+##
+## A user's transactions are bulk-loaded once into column arrays (dates as
+## integer days since 1970-01-01, categories as integer codes into a list of
+## names) and kept in an in-process cache, so rolling averages, category
+## deltas, percentiles and anomaly checks are whole-array operations rather
+## than Python loops or repeated queries.
+##
+## Each metric has an *_of_arrays() core taking a TransactionArrays, so
+## history that is not in the database, such as a columnar export
+## (columnar.ColumnarFile.to_arrays()), can be analysed the same way.
+##
+## NumPy is optional for the rest of the application; only this module needs it.
+
+import threading
+from collections import OrderedDict
+
+from budget import add_invalidation_listener
+from database import get_connection
+from instrumentation import timed_operation
+from transactions import add_change_listener
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# How many users' arrays are kept in memory, least recently used dropped first.
+ANALYTICS_CACHE_SIZE = 32
+
+# Robust z-score above which a single expense is flagged as unusual for its
+# category (3.5 is the usual cut-off for the median/MAD score).
+ANOMALY_THRESHOLD = 3.5
+
+
+class TransactionArrays:
+    """
+    One user's transactions as parallel NumPy arrays, oldest first.
+
+    Attributes:
+        ids (int64), days (int64, days since 1970-01-01),
+        months (int64, months since 1970-01), amounts (float64, dollars),
+        is_expense (bool), category_codes (int64): one entry per transaction.
+        categories (list): Category names; category_codes index into it.
+    """
+
+    def __init__(self, ids, days, amounts, is_expense, category_codes, categories):
+        self.ids = ids
+        self.days = days
+        self.months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        self.amounts = amounts
+        self.is_expense = is_expense
+        self.category_codes = category_codes
+        self.categories = categories
+
+    def __len__(self):
+        return len(self.ids)
+
+
+# --- Loading and caching ---
+# Entries are dropped by a change listener when this process writes to the
+# user's transactions, and by budget.invalidate_user_caches() after a restore.
+# Changes made elsewhere (imports, other processes) are caught by comparing a
+# fingerprint of the user's monthly_totals rows, which is a few dozen rows
+# rather than the whole history.
+_cache = OrderedDict()  # user_id -> (fingerprint, TransactionArrays)
+_cache_lock = threading.Lock()
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The 'numpy' package is needed for analytics.")
+
+
+def _fingerprint(user_id):
+    rows = get_connection(user_id).execute(
+        """SELECT year_month, type, category, total, count FROM monthly_totals
+           WHERE user_id = ?""",
+        (user_id,)
+    ).fetchall()
+    return hash(tuple(rows))
+
+
+def _load_arrays(user_id):
+    """Reads every transaction of a user into a TransactionArrays."""
+    rows = get_connection(user_id).execute(
+        """SELECT id, date, type, category, amount FROM all_transactions
+           WHERE user_id = ? ORDER BY date, id""",
+        (user_id,)
+    ).fetchall()
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return TransactionArrays(empty, empty, np.empty(0), np.empty(0, dtype=bool), empty, [])
+
+    ids, dates, types, categories, amounts = zip(*rows)
+    names, codes = np.unique(np.array(categories, dtype=object).astype(str), return_inverse=True)
+    return TransactionArrays(
+        ids=np.array(ids, dtype=np.int64),
+        days=np.array(dates, dtype='datetime64[D]').astype(np.int64),
+        amounts=np.array(amounts, dtype=np.float64) / 100,  # stored as cents
+        is_expense=np.array(types, dtype=object) == 'expense',
+        category_codes=codes.astype(np.int64),
+        categories=names.tolist(),
+    )
+
+
+def load_transactions(user_id):
+    """
+    Returns a user's transactions as arrays, from the cache when it is current.
+
+    Returns:
+        TransactionArrays: The user's full history.
+    """
+    _require_numpy()
+    fingerprint = _fingerprint(user_id)
+    with _cache_lock:
+        entry = _cache.get(user_id)
+        if entry is not None and entry[0] == fingerprint:
+            _cache.move_to_end(user_id)
+            return entry[1]
+
+    arrays = _load_arrays(user_id)
+    with _cache_lock:
+        _cache[user_id] = (fingerprint, arrays)
+        _cache.move_to_end(user_id)
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return arrays
+
+
+def invalidate_analytics_cache(user_id=None):
+    """Drops the cached arrays for one user, or for everyone if user_id is None."""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+add_change_listener(invalidate_analytics_cache)
+add_invalidation_listener(invalidate_analytics_cache)
+
+
+def _month_labels(first_month, count):
+    """'YYYY-MM' labels for `count` months starting at months-since-1970 `first_month`."""
+    months = np.arange(first_month, first_month + count).astype('datetime64[M]')
+    return [str(month) for month in months]
+
+
+def _expense_mask(arrays, category):
+    mask = arrays.is_expense
+    if category is not None:
+        if category not in arrays.categories:
+            return np.zeros(len(arrays), dtype=bool)
+        mask = mask & (arrays.category_codes == arrays.categories.index(category))
+    return mask
+
+
+# --- Metrics ---
+
+@timed_operation('analytics_rolling')
+def rolling_average(user_id, window=3, trans_type='expense'):
+    """
+    Monthly totals and their trailing moving average.
+
+    Every month from the user's first to last transaction is included,
+    months without transactions as 0.
+
+    Args:
+        user_id (int): The ID of the user.
+        window (int): How many months the average covers.
+        trans_type (str): 'expense' or 'income'.
+
+    Returns:
+        dict: {'months': ['YYYY-MM', ...], 'totals': [...],
+               'average': [...]} where 'average' is None until `window`
+               months are available.
+    """
+    return rolling_average_of_arrays(load_transactions(user_id), window, trans_type)
+
+
+def rolling_average_of_arrays(arrays, window=3, trans_type='expense'):
+    """rolling_average() over a TransactionArrays."""
+    _require_numpy()
+    if not len(arrays):
+        return {'months': [], 'totals': [], 'average': []}
+
+    mask = arrays.is_expense if trans_type == 'expense' else ~arrays.is_expense
+    first = arrays.months[0]
+    span = arrays.months[-1] - first + 1
+    totals = np.bincount(arrays.months[mask] - first, weights=arrays.amounts[mask], minlength=span)
+
+    sums = np.cumsum(np.concatenate(([0.0], totals)))
+    average = (sums[window:] - sums[:-window]) / window
+    return {
+        'months': _month_labels(first, span),
+        'totals': totals.tolist(),
+        'average': [None] * min(window - 1, span) + average.tolist(),
+    }
+
+
+@timed_operation('analytics_deltas')
+def category_month_deltas(user_id):
+    """
+    Expenses per category and month, and the change from the previous month.
+
+    Returns:
+        dict: {'months': ['YYYY-MM', ...], 'categories': [...],
+               'totals': {category: [...]}, 'deltas': {category: [...]}}.
+               Each list lines up with 'months'; the first delta is 0.
+    """
+    return category_month_deltas_of_arrays(load_transactions(user_id))
+
+
+def category_month_deltas_of_arrays(arrays):
+    """category_month_deltas() over a TransactionArrays."""
+    _require_numpy()
+    mask = arrays.is_expense
+    if not mask.any():
+        return {'months': [], 'categories': [], 'totals': {}, 'deltas': {}}
+
+    months = arrays.months[mask]
+    codes = arrays.category_codes[mask]
+    first = months.min()
+    span = months.max() - first + 1
+    # One bincount over (category, month) cells builds the whole matrix.
+    cells = codes * span + (months - first)
+    matrix = np.bincount(cells, weights=arrays.amounts[mask],
+                         minlength=len(arrays.categories) * span).reshape(len(arrays.categories), span)
+    deltas = np.diff(matrix, axis=1, prepend=matrix[:, :1])
+
+    used = np.flatnonzero(matrix.any(axis=1))
+    categories = [arrays.categories[code] for code in used]
+    return {
+        'months': _month_labels(first, span),
+        'categories': categories,
+        'totals': {name: matrix[code].tolist() for name, code in zip(categories, used)},
+        'deltas': {name: deltas[code].tolist() for name, code in zip(categories, used)},
+    }
+
+
+@timed_operation('analytics_percentiles')
+def expense_percentiles(user_id, percentiles=(50, 75, 90, 95, 99), category=None):
+    """
+    Percentiles of individual expense amounts.
+
+    Args:
+        user_id (int): The ID of the user.
+        percentiles (tuple): The percentiles to compute, 0-100.
+        category (str): Only look at this category. Defaults to all.
+
+    Returns:
+        dict: Percentile -> amount, or an empty dict without any expenses.
+    """
+    return expense_percentiles_of_arrays(load_transactions(user_id), percentiles, category)
+
+
+def expense_percentiles_of_arrays(arrays, percentiles=(50, 75, 90, 95, 99), category=None):
+    """expense_percentiles() over a TransactionArrays."""
+    _require_numpy()
+    amounts = arrays.amounts[_expense_mask(arrays, category)]
+    if not len(amounts):
+        return {}
+    values = np.percentile(amounts, percentiles)
+    return dict(zip(percentiles, values.tolist()))
+
+
+@timed_operation('analytics_anomalies')
+def find_anomalies(user_id, threshold=ANOMALY_THRESHOLD, since=None):
+    """
+    Flags expenses that are unusually large for their category.
+
+    Each expense is scored against the other expenses in its category with
+    a robust z-score, 0.6745 * (amount - median) / MAD, which a handful of
+    large outliers cannot drag around the way a mean and standard
+    deviation can.
+
+    Args:
+        user_id (int): The ID of the user.
+        threshold (float): Flag expenses scoring above this.
+        since (str): Only report expenses on or after this 'YYYY-MM-DD'.
+                     The whole history is still used for the baseline.
+
+    Returns:
+        list: Dictionaries with 'id', 'date', 'category', 'amount' and
+              'score', highest score first.
+    """
+    return find_anomalies_of_arrays(load_transactions(user_id), threshold, since)
+
+
+def find_anomalies_of_arrays(arrays, threshold=ANOMALY_THRESHOLD, since=None):
+    """find_anomalies() over a TransactionArrays."""
+    _require_numpy()
+    mask = arrays.is_expense
+    if not mask.any():
+        return []
+
+    amounts = arrays.amounts[mask]
+    codes = arrays.category_codes[mask]
+    count = len(arrays.categories)
+
+    # Per-category medians: sort by (category, amount) once, then pick each
+    # category's middle element(s) from the sorted run. Categories without
+    # expenses (income-only ones) have an empty run and keep a median of 0.
+    order = np.lexsort((amounts, codes))
+    sizes = np.bincount(codes, minlength=count)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    present = np.flatnonzero(sizes)
+
+    def run_medians(values):
+        medians = np.zeros(count)
+        low = values[starts[present] + (sizes[present] - 1) // 2]
+        high = values[starts[present] + sizes[present] // 2]
+        medians[present] = (low + high) / 2
+        return medians
+
+    medians = run_medians(amounts[order])
+    deviations = np.abs(amounts - medians[codes])
+    mad = run_medians(deviations[np.lexsort((deviations, codes))])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(mad[codes] > 0, 0.6745 * (amounts - medians[codes]) / mad[codes], 0.0)
+
+    flagged = scores > threshold
+    if since is not None:
+        flagged &= arrays.days[mask] >= np.datetime64(since, 'D').astype(np.int64)
+    hits = np.flatnonzero(flagged)
+    hits = hits[np.argsort(-scores[hits])]
+
+    ids = arrays.ids[mask]
+    days = arrays.days[mask].astype('datetime64[D]')
+    return [{
+        'id': int(ids[i]),
+        'date': str(days[i]),
+        'category': arrays.categories[codes[i]],
+        'amount': float(amounts[i]),
+        'score': float(scores[i]),
+    } for i in hits]
@@ -0,0 +1,114 @@
+# archive.py
+## Moves closed months out of the hot transactions table.
+##
+## Almost all activity touches the current and the previous month, so older
+## rows are moved to transactions_archive. Listings, the update/delete
+## pickers and budget checks then only touch the hot table. monthly_totals
+## keeps covering every month (the archive has its own rollup triggers), so
+## get_monthly_summary() and the range reports read archived months exactly
+## as before. Full-history readers use the all_transactions view.
+##
+## Usage: python archive.py [--keep-months 1] [--batch-size 5000]
+
+import argparse
+import time
+from datetime import date
+
+from database import database_paths, connection_for_path, migrate, month_bounds
+from instrumentation import timed_operation
+
+# The current month plus this many earlier months stay in the hot table.
+DEFAULT_KEEP_MONTHS = 1
+DEFAULT_BATCH_SIZE = 5000
+
+_COLUMNS = 'id, user_id, type, category, amount, date, description'
+
+
+def archive_cutoff(keep_months=DEFAULT_KEEP_MONTHS, today=None):
+    """
+    Returns the first date that stays hot, 'YYYY-MM-DD'.
+
+    With keep_months=1 in March that is February 1st: February and March
+    stay, everything before moves.
+    """
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - keep_months
+    return month_bounds(index // 12, index % 12 + 1)[0]
+
+
+def _archive_file(db, cutoff, batch_size):
+    """Moves every row dated before `cutoff` in one database file. Returns the count."""
+    cursor = db.cursor()
+    moved = 0
+    last_id = 0
+    while True:
+        # Each batch is its own short transaction, so writers are only held
+        # up for one batch at a time. Batches walk the rowid in order.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            # transactions.id is AUTOINCREMENT (migration 8), so moving the
+            # highest ids out does not let SQLite hand them out again.
+            ids = [row[0] for row in cursor.execute(
+                """SELECT id FROM transactions
+                   WHERE id > ? AND date < ?
+                   ORDER BY id LIMIT ?""",
+                (last_id, cutoff, batch_size)
+            )]
+            if not ids:
+                db.commit()
+                return moved
+            predicate = "id BETWEEN ? AND ? AND date < ?"
+            params = (ids[0], ids[-1], cutoff)
+            cursor.execute(
+                f"""INSERT INTO transactions_archive ({_COLUMNS})
+                    SELECT {_COLUMNS} FROM transactions WHERE {predicate}""",
+                params
+            )
+            cursor.execute(f"DELETE FROM transactions WHERE {predicate}", params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        moved += len(ids)
+        last_id = ids[-1]
+
+
+@timed_operation('archive')
+def archive_closed_months(keep_months=DEFAULT_KEEP_MONTHS, batch_size=DEFAULT_BATCH_SIZE, today=None):
+    """
+    Moves transactions from closed months into transactions_archive.
+
+    Safe to run while the application is in use, and again at any time;
+    rows added later with old dates are picked up by the next run. Every
+    shard is archived when sharding is on.
+
+    Args:
+        keep_months (int): How many months before the current one stay hot.
+        batch_size (int): Rows moved per transaction.
+
+    Returns:
+        dict: 'rows' moved, 'cutoff' date and 'seconds' taken.
+    """
+    cutoff = archive_cutoff(keep_months, today)
+    start = time.perf_counter()
+    moved = 0
+    for path in database_paths():
+        db = connection_for_path(path)
+        migrate(db)
+        moved += _archive_file(db, cutoff, batch_size)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Archived {moved:,} transactions dated before {cutoff} in {elapsed:.2f}s.")
+    return {'rows': moved, 'cutoff': cutoff, 'seconds': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move closed months to the archive table.')
+    parser.add_argument('--keep-months', type=int, default=DEFAULT_KEEP_MONTHS,
+                        help='months before the current one that stay in the hot table')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+    archive_closed_months(args.keep_months, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# async_api.py
+## asyncio front end for the transaction, budget, report and auth functions.
+##
+## SQLite work runs in threads: reads go to a pool of reader threads (each
+## with its own pooled connection, WAL lets them run alongside the writer)
+## and writes go through a write_queue.WriteQueue, which groups writes that
+## arrive close together into one commit. Registration and login run in
+## auth's password-hashing pool (auth.submit_register/submit_login).
+##
+## Usage:
+##   async with FinanceService() as service:
+##       user_id = await service.login_user('alice', 'secret')
+##       result = await service.add_transaction(user_id, 'expense', 'Food', 12.5, 'Lunch')
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import auth
+from budget import check_spending_against_budget, get_budgets_with_spending
+from reports import get_monthly_summary, get_range_report
+from transactions import get_transactions_page
+from write_queue import DEFAULT_BATCH_WINDOW, DEFAULT_MAX_BATCH, WriteQueue
+
+DEFAULT_READERS = 4
+
+
+class FinanceService:
+    """
+    Async API mirroring the synchronous functions.
+
+    Reads run concurrently on `readers` threads; writes go to a WriteQueue
+    that commits them in batches of up to `max_batch` operations (waiting at
+    most `batch_window` seconds for a batch to fill).
+    """
+
+    def __init__(self, readers=DEFAULT_READERS, max_batch=DEFAULT_MAX_BATCH,
+                 batch_window=DEFAULT_BATCH_WINDOW):
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='finance-reader')
+        self._writes = WriteQueue(max_batch, batch_window)
+
+    @property
+    def batches_committed(self):
+        return self._writes.batches_committed
+
+    @property
+    def writes_committed(self):
+        return self._writes.writes_committed
+
+    async def close(self):
+        """Finishes queued writes and shuts the reader threads down."""
+        # Both wait for threads to finish, so they run off the event loop.
+        await asyncio.to_thread(self._writes.close)
+        await asyncio.to_thread(self._readers.shutdown)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    # --- Plumbing ---
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: func(*args, **kwargs))
+
+    async def _write(self, future):
+        return await asyncio.wrap_future(future)
+
+    # --- Auth ---
+
+    async def register_user(self, username, password):
+        """Registers a user. Returns True, or False if the username is taken."""
+        return await asyncio.wrap_future(auth.submit_register(username, password))
+
+    async def login_user(self, username, password):
+        """Returns the user's ID, or None if the credentials are wrong."""
+        return await asyncio.wrap_future(auth.submit_login(username, password))
+
+    # --- Transactions ---
+
+    async def add_transaction(self, user_id, trans_type, category, amount, description):
+        """
+        Adds a transaction dated today.
+
+        Returns:
+            dict: 'id' of the new row, and 'over_budget' / 'amount_over'
+                  for the category after this expense.
+        """
+        return await self._write(self._writes.add_transaction(user_id, trans_type, category,
+                                                              amount, description))
+
+    async def delete_transaction(self, transaction_id, user_id):
+        """Returns True if the transaction existed and was deleted."""
+        return await self._write(self._writes.delete_transaction(transaction_id, user_id))
+
+    async def update_transaction(self, transaction_id, user_id, new_amount, new_category, new_desc):
+        """Returns True if the transaction existed and was updated."""
+        return await self._write(self._writes.update_transaction(transaction_id, user_id, new_amount,
+                                                                 new_category, new_desc))
+
+    async def get_transactions_page(self, user_id, page_size=20, cursor=None, **filters):
+        """See transactions.get_transactions_page()."""
+        return await self._read(get_transactions_page, user_id, page_size, cursor, **filters)
+
+    # --- Budgets ---
+
+    async def set_budget(self, user_id, category, limit):
+        return await self._write(self._writes.set_budget(user_id, category, limit))
+
+    async def check_spending_against_budget(self, user_id, category, year_month=None):
+        return await self._read(check_spending_against_budget, user_id, category, year_month)
+
+    async def get_budgets_with_spending(self, user_id):
+        return await self._read(get_budgets_with_spending, user_id)
+
+    # --- Reports ---
+
+    async def get_monthly_summary(self, user_id, year, month):
+        return await self._read(get_monthly_summary, user_id, year, month)
+
+    async def get_range_report(self, user_id, start_year, start_month, end_year, end_month):
+        return await self._read(get_range_report, user_id, start_year, start_month,
+                                end_year, end_month)
@@ -2,41 +2,214 @@
 
 import sqlite3  # to work with database
 import hashlib  # secure password , it's like encoding
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from database import get_connection
+import queries
+from instrumentation import timed_operation
+
+# --- Password hashing settings ---
+# New hashes are made with these settings. Stored hashes record the settings
+# they were made with, so changing them here only affects new hashes; older
+# ones are upgraded the next time their owner logs in.
+KDF_SETTINGS = {
+    'algorithm': 'scrypt',          # 'scrypt' or 'pbkdf2_sha256'
+    'scrypt_n': 2 ** 14,            # CPU/memory cost (memory is ~128 * n * r bytes)
+    'scrypt_r': 8,
+    'scrypt_p': 1,
+    'pbkdf2_iterations': 600_000,
+    'salt_bytes': 16,
+}
+
+ALGORITHMS = ('scrypt', 'pbkdf2_sha256')
+
+
+def configure_kdf(**settings):
+    """
+    Changes the cost settings used for new password hashes.
+
+    Example: configure_kdf(algorithm='pbkdf2_sha256', pbkdf2_iterations=300_000)
+    """
+    unknown = set(settings) - set(KDF_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown KDF setting(s): {', '.join(sorted(unknown))}")
+    if settings.get('algorithm', KDF_SETTINGS['algorithm']) not in ALGORITHMS:
+        raise ValueError(f"Algorithm must be one of {ALGORITHMS}")
+    KDF_SETTINGS.update(settings)
+    _login_cache.clear()
+
+
+def _scrypt(password, salt, n, r, p):
+    # Allow twice the memory scrypt needs; hashlib's default cap is 32 MB.
+    maxmem = 2 * 128 * r * (n + p) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem)
+
 
 def hash_password(password):
     """
     Hashes a password for secure storage.
+
+    A random salt is generated for every hash. The result records the
+    algorithm and its parameters, e.g. 'scrypt$16384$8$1$<salt>$<hash>' or
+    'pbkdf2_sha256$600000$<salt>$<hash>' (salt and hash in hex).
     """
-    return hashlib.sha256(password.encode()).hexdigest()
+    salt = secrets.token_bytes(KDF_SETTINGS['salt_bytes'])
+    if KDF_SETTINGS['algorithm'] == 'scrypt':
+        n, r, p = KDF_SETTINGS['scrypt_n'], KDF_SETTINGS['scrypt_r'], KDF_SETTINGS['scrypt_p']
+        digest = _scrypt(password, salt, n, r, p)
+        return f"scrypt${n}${r}${p}${salt.hex()}${digest.hex()}"
+
+    iterations = KDF_SETTINGS['pbkdf2_iterations']
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+
+def verify_password(password, stored_hash):
+    """
+    Checks a password against a stored hash.
+
+    Understands both hash formats made by hash_password() and the legacy
+    unsalted SHA-256 hex digests made by earlier versions.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    parts = stored_hash.split('$')
+    if parts[0] == 'scrypt' and len(parts) == 6:
+        n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+        digest = _scrypt(password, bytes.fromhex(parts[4]), n, r, p)
+        expected = parts[5]
+    elif parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(),
+                                     bytes.fromhex(parts[2]), int(parts[1]))
+        expected = parts[3]
+    else:
+        # Legacy: a single unsalted SHA-256 round.
+        digest = hashlib.sha256(password.encode()).digest()
+        expected = stored_hash
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+def needs_rehash(stored_hash):
+    """Returns True if a stored hash is legacy or was made with other settings than KDF_SETTINGS."""
+    parts = stored_hash.split('$')
+    if KDF_SETTINGS['algorithm'] == 'scrypt':
+        current = ['scrypt', str(KDF_SETTINGS['scrypt_n']),
+                   str(KDF_SETTINGS['scrypt_r']), str(KDF_SETTINGS['scrypt_p'])]
+        return parts[:4] != current
+    return parts[:2] != ['pbkdf2_sha256', str(KDF_SETTINGS['pbkdf2_iterations'])]
+
+
+# --- Verified-login cache ---
+# Remembers recent successful logins so a user logging in again within
+# LOGIN_CACHE_TTL seconds skips the slow KDF. Only a keyed HMAC of the
+# password is kept (the key is random and never leaves this process), and an
+# entry is only used while the stored hash in the database is unchanged, so
+# a password change invalidates it.
+LOGIN_CACHE_TTL = 300
+LOGIN_CACHE_SIZE = 10_000
+_cache_key = secrets.token_bytes(32)
+_login_cache = OrderedDict()  # username -> (stored_hash, password_mac, expires_at)
+_login_cache_lock = threading.Lock()
+
+
+def _password_mac(password):
+    return hmac.new(_cache_key, password.encode(), hashlib.sha256).digest()
+
+
+def _cache_check(username, password, stored_hash):
+    with _login_cache_lock:
+        entry = _login_cache.get(username)
+    if entry is None:
+        return False
+    cached_hash, mac, expires_at = entry
+    return (cached_hash == stored_hash and time.monotonic() < expires_at
+            and hmac.compare_digest(mac, _password_mac(password)))
+
+
+def _cache_store(username, password, stored_hash):
+    if LOGIN_CACHE_TTL <= 0:
+        return
+    entry = (stored_hash, _password_mac(password), time.monotonic() + LOGIN_CACHE_TTL)
+    with _login_cache_lock:
+        _login_cache[username] = entry
+        _login_cache.move_to_end(username)
+        while len(_login_cache) > LOGIN_CACHE_SIZE:
+            _login_cache.popitem(last=False)
+
+
+def clear_login_cache():
+    """Forgets every cached login."""
+    with _login_cache_lock:
+        _login_cache.clear()
+
+
+# --- Worker pool ---
+# scrypt and PBKDF2 release the GIL while they run, so a thread pool spreads
+# concurrent logins over the CPU cores without blocking the caller.
+HASH_WORKERS = os.cpu_count() or 4
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def _get_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS,
+                                            thread_name_prefix='auth-hash')
+        return _hash_pool
+
+
+def submit_register(username, password):
+    """Runs register_user() in the hashing pool. Returns a Future with True, or False if the name is taken."""
+    return _get_hash_pool().submit(register_user, username, password)
+
+
+def submit_login(username, password):
+    """Runs login_user() in the hashing pool. Returns a Future with the user ID or None."""
+    return _get_hash_pool().submit(login_user, username, password)
 
 
 # Register user function
 def register_user(username , password):
-    """Register a new user in the database."""
-    db = sqlite3.connect('finance.db')
+    """
+    Register a new user in the database.
+
+    Returns:
+        bool: True if the user was created, False if the username is taken.
+    """
+    db = get_connection()
     cursor = db.cursor()
 
     try:
-        cursor.execute(
-            "INSERT INTO users(username , password_hash) VALUES (?,?)",
-            (username , hash_password(password))
-        )
+        queries.execute(cursor, 'users.insert', (username , hash_password(password)))
         db.commit()
         print(f"✅ User '{username}' registered successfully!")
+        return True
     except sqlite3.IntegrityError:
+        db.rollback()
         print(f"❌ Error: Username '{username}' already exists.")
-    finally:
-        db.close()
+        return False
 
 
 """Add the Login Function to auth.py
 This will allow registered users to sign in to their accounts.
 """
 
+@timed_operation('login')
 def login_user(username , password):
     """
     Authenticates a user by checking their username and password.
 
+    A hash made with older settings (or the legacy SHA-256 format) is
+    replaced with a fresh one using KDF_SETTINGS after a successful login.
+
     Args:
         username (str): The username entered by the user.
         password (str): The password entered by the user.
@@ -45,24 +218,25 @@ def login_user(username , password):
         int: The user's ID from the database if login is successful.
         None: If the username does not exist or the password is incorrect.
     """
-       
-    db = sqlite3.connect('finance.db')
+
+    db = get_connection()
     cursor = db.cursor()
 
     # Find the user by username
-    cursor.execute(
-        "SELECT id, password_hash FROM users WHERE username = ?",
-        (username,)
-    )
+    queries.execute(cursor, 'users.by_username', (username,))
     user_record = cursor.fetchone() # Fetch one matching record
-    db.close()
 
     if user_record:
         user_id, stored_hash = user_record
-        # Hash the provided password and compare it to the stored hash
-        if hash_password(password) == stored_hash:
+        # Check the cache first, then hash the provided password and compare
+        if _cache_check(username, password, stored_hash) or verify_password(password, stored_hash):
+            if needs_rehash(stored_hash):
+                stored_hash = hash_password(password)
+                queries.execute(cursor, 'users.set_password_hash', (stored_hash, user_id))
+                db.commit()
+            _cache_store(username, password, stored_hash)
             print(f"✅ Login successful! Welcome, {username}.")
             return user_id # Return the user's ID for future use
-    
+
     print("❌ Error: Invalid username or password.")
     return None # Return None if login fails
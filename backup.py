@@ -1,56 +1,417 @@
 # backup.py
 
+import gzip
+import hashlib
+import os
+import re
 import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import os
+from budget import invalidate_user_caches
+from instrumentation import timed_operation
+from database import (get_database_path, connection_for_path, database_paths,
+                      get_shard_count, shard_path, migrate, rebuild_monthly_totals)
+
+try:  # zstd compresses better and faster than gzip, when it is installed
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BACKUP_DIR = 'backups'
+BACKUP_EXTENSIONS = ('.db', '.db.gz', '.db.zst')
+
+# How many database pages the backup API copies per step. Between steps the
+# source database is unlocked, so writers can keep going during a backup.
+BACKUP_PAGES_PER_STEP = 256
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def backup_timestamp(moment=None):
+    """
+    Returns the timestamp backup and snapshot names carry, 'YYYY-MM-DD_HH-MM-SS-mmm'.
+
+    It goes down to the millisecond, so two backups of a file taken within
+    the same second get different names.
+    """
+    moment = moment or datetime.now()
+    return moment.strftime('%Y-%m-%d_%H-%M-%S-') + f"{moment.microsecond // 1000:03d}"
+
+
+class BackupError(Exception):
+    """Raised when a backup fails verification and cannot be restored."""
+
+
+class _HashingWriter:
+    """File wrapper that feeds everything written through it into a SHA-256."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def _compress_writer(f):
+    """Returns (writer, extension) that compresses into the open file `f`."""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor().stream_writer(f, closefd=False), '.db.zst'
+    return gzip.GzipFile(fileobj=f, mode='wb'), '.db.gz'
+
+
+def _open_backup(path):
+    """Opens a backup file for reading, decompressing it on the fly."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("The 'zstandard' package is needed to read .zst backups.")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def _file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _write_checksum(path, checksum):
+    """Writes '<path>.sha256' in the same format as the sha256sum tool."""
+    tmp_path = path + '.sha256.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+    os.replace(tmp_path, path + '.sha256')
+
 
-def create_backup(db_file='finance.db'):
+def snapshot_database(db_file, target_path, pages=BACKUP_PAGES_PER_STEP, progress=None):
     """
-    Creates a timestamped backup of the database file.
+    Copies a live database into `target_path` with the SQLite backup API.
+
+    The copy is a consistent snapshot even while other connections write,
+    and includes anything still in the write-ahead log. In WAL mode the
+    copy runs inside one read transaction: writers are not blocked by it,
+    and their commits do not make the backup start over between steps, so
+    a slow (throttled) copy of a busy database still finishes.
 
     Args:
-        db_file (str): The path to the database file to back up.
+        db_file (str): The database to copy.
+        target_path (str): Where to write the copy.
+        pages (int): Pages copied per step.
+        progress (callable): Passed to sqlite3.Connection.backup(); called
+                             as progress(status, remaining, total) after each step.
     """
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(target_path)
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # starts the read
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+        source.close()
+
+
+@timed_operation('backup')
+def create_backup(db_file=None, pages=BACKUP_PAGES_PER_STEP, progress=None, name=None, quiet=False):
+    """
+    Creates a timestamped, compressed backup of the database.
+
+    The database is copied with the SQLite backup API, a few pages at a
+    time, then compressed as a stream (zstd if installed, otherwise gzip)
+    while its SHA-256 is computed. The file is written under a temporary
+    name and renamed into place, so a crash never leaves a half-written
+    backup behind. The checksum is saved next to it as '<backup>.sha256'.
+
+    Args:
+        db_file (str): The path to the database file to back up. Defaults to
+                       the database the application is configured to use.
+        pages (int): Pages copied per backup step.
+        progress (callable): See snapshot_database().
+        name (str): The backup's file name without extension. Defaults to
+                    'finance_backup_<timestamp>'. An existing backup of
+                    that name is never overwritten; the call fails instead.
+        quiet (bool): Do not print the success message (errors are still printed).
+
+    Returns:
+        str: The path of the new backup, or None if it failed.
+    """
+    if db_file is None:
+        db_file = get_database_path()
     if not os.path.exists(db_file):
         print(f"❌ Error: Database file '{db_file}' not found.")
-        return
+        return None
 
     # Create a 'backups' directory if it doesn't exist
-    backup_dir = 'backups'
-    if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
+    os.makedirs(BACKUP_DIR, exist_ok=True)
 
     # Generate a filename with a precise timestamp
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    backup_filename = f"finance_backup_{timestamp}.db"
-    backup_path = os.path.join(backup_dir, backup_filename)
+    created = datetime.now()
+    if name is None:
+        name = f"finance_backup_{backup_timestamp(created)}"
+    base_path = os.path.join(BACKUP_DIR, name)
+    snapshot_path = base_path + '.snapshot.tmp'
+    compressed_tmp = base_path + '.compress.tmp'
+
+    # Neither a finished backup nor one still being written under this name
+    # (creating its snapshot file claims the name) may be overwritten.
+    if any(os.path.exists(base_path + extension) for extension in BACKUP_EXTENSIONS):
+        print(f"❌ Error: A backup named '{name}' already exists.")
+        return None
+    try:
+        open(snapshot_path, 'x').close()
+    except FileExistsError:
+        print(f"❌ Error: A backup named '{name}' is already being written.")
+        return None
 
     try:
-        # shutil.copyfile is perfect for copying a single file
-        shutil.copyfile(db_file, backup_path)
-        print(f"✅ Backup created successfully: {backup_path}")
+        snapshot_database(db_file, snapshot_path, pages=pages, progress=progress)
+
+        with open(snapshot_path, 'rb') as src, open(compressed_tmp, 'wb') as raw:
+            hashing = _HashingWriter(raw)
+            writer, extension = _compress_writer(hashing)
+            with writer:
+                shutil.copyfileobj(src, writer, CHUNK_SIZE)
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        backup_path = base_path + extension
+        os.replace(compressed_tmp, backup_path)
+        _write_checksum(backup_path, hashing.sha256.hexdigest())
+        _catalog_backup(backup_path, db_file, created, snapshot_path, hashing.sha256.hexdigest())
+        if not quiet:
+            print(f"✅ Backup created successfully: {backup_path}")
+        return backup_path
     except Exception as e:
         print(f"❌ An error occurred while creating the backup: {e}")
+        return None
+    finally:
+        for tmp_path in (snapshot_path, compressed_tmp):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _catalog_backup(backup_path, db_file, created, snapshot_path, checksum):
+    """Records a new backup in the catalog (see backup_catalog.py)."""
+    # Imported here because backup_catalog builds on this module.
+    import backup_catalog
+    try:
+        version, users = backup_catalog.read_contents(snapshot_path)
+        backup_catalog.record_backup(os.path.basename(backup_path), 'full',
+                                     backup_catalog.target_label(db_file), created,
+                                     os.path.getsize(backup_path), checksum, version, users)
+    except (OSError, sqlite3.Error) as e:
+        # The backup itself is fine; rebuild_catalog() can add it later.
+        print(f"⚠️  Could not add {backup_path} to the backup catalog: {e}")
+
+
+def backup_set_jobs(timestamp=None):
+    """
+    Returns (database file, backup name) for every file of a backup set.
+
+    Args:
+        timestamp (str): The set's timestamp. Defaults to now.
+    """
+    timestamp = timestamp or backup_timestamp()
+    jobs = [(get_database_path(), f"finance_backup_{timestamp}")]
+    jobs += [(shard_path(index), f"finance_backup_{timestamp}_shard{index}")
+             for index in range(get_shard_count())]
+    return jobs
+
+
+def create_backup_set(pages=BACKUP_PAGES_PER_STEP):
+    """
+    Backs up the main database and, with sharding on, every shard.
+
+    The files are backed up in parallel, one thread each; the backup API
+    releases the GIL while copying, and each shard has its own lock. All
+    files of a set share a timestamp, and shard backups are named
+    'finance_backup_<timestamp>_shard<n>' so a restore knows where they go.
+
+    Returns:
+        list: The paths of the new backups (None for any that failed).
+    """
+    jobs = backup_set_jobs()
+    if len(jobs) == 1:
+        return [create_backup(jobs[0][0], pages, name=jobs[0][1])]
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(create_backup, db_file, pages, None, name) for db_file, name in jobs]
+        return [future.result() for future in futures]
+
+
+def backup_shard(backup_path):
+    """
+    Returns the shard index a backup's name carries, or None for the main database.
+
+    Backups and snapshots of shard <n> end in '_shard<n>' before their
+    extension ('.db...' or '.json').
+    """
+    match = re.search(r'_shard(\d+)\.(?:db|json)', os.path.basename(backup_path))
+    return int(match.group(1)) if match else None
+
+
+def backup_target(backup_path):
+    """Returns the database file a backup belongs to: its shard, or the main database."""
+    index = backup_shard(backup_path)
+    return get_database_path() if index is None else shard_path(index)
+
+
+def verify_backup(backup_path):
+    """
+    Checks a backup against its '.sha256' file, reading it as a stream.
+
+    Returns:
+        bool: True if the checksum matches, or if the backup predates
+              checksums (plain '.db' copies without a '.sha256' file).
+    """
+    checksum_path = backup_path + '.sha256'
+    if not os.path.exists(checksum_path):
+        return backup_path.endswith('.db')
+    with open(checksum_path) as f:
+        expected = f.read().split()[0]
+    return _file_sha256(backup_path) == expected
+
+
+def load_database_file(source_path, db_file=None):
+    """
+    Overwrites a database with the contents of an uncompressed database file.
+
+    The file is integrity-checked first, then copied in through the SQLite
+    backup API, so open connections and the write-ahead log stay consistent.
+
+    Raises:
+        BackupError: If the integrity check fails.
+    """
+    if db_file is None:
+        db_file = get_database_path()
+
+    source = sqlite3.connect(source_path)
+    try:
+        result = source.execute("PRAGMA quick_check").fetchone()[0]
+        if result != 'ok':
+            raise BackupError(f"'{source_path}' is corrupt: {result}")
+        if db_file in database_paths():
+            source.backup(connection_for_path(db_file), pages=BACKUP_PAGES_PER_STEP)
+        else:
+            target = sqlite3.connect(db_file)
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP)
+            finally:
+                target.close()
+    finally:
+        source.close()
+
+    if db_file in database_paths():
+        # The copy may predate newer migrations; bring it up to date and
+        # recompute the monthly rollup from its transactions.
+        db = connection_for_path(db_file)
+        migrate(db)
+        rebuild_monthly_totals(db)
+        invalidate_user_caches()
+
+
+def extract_backup(backup_path, target_path):
+    """
+    Verifies a backup file and decompresses it into `target_path`, as a stream.
+
+    Backups in the catalog are checked against their catalog entry, others
+    against their '.sha256' file.
+
+    Raises:
+        BackupError: If the checksum does not match.
+    """
+    # Imported here because backup_catalog builds on this module.
+    from backup_catalog import verify_against_catalog
+
+    name = os.path.relpath(backup_path, BACKUP_DIR)
+    if verify_against_catalog(name, backup_path) is None and not verify_backup(backup_path):
+        raise BackupError(f"Checksum mismatch for '{backup_path}'.")
+    with _open_backup(backup_path) as src, open(target_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+@timed_operation('restore')
+def restore_backup_file(backup_path, db_file=None):
+    """
+    Restores the database from a backup file, without prompting.
+
+    The backup is verified and decompressed into a temporary file before
+    anything is touched (extract_backup()), then loaded with
+    load_database_file(). Unless `db_file` is given, a shard backup goes
+    back to its shard.
+
+    Raises:
+        BackupError: If the checksum or the integrity check fails.
+    """
+    if db_file is None:
+        db_file = backup_target(backup_path)
+
+    restore_tmp = db_file + '.restore.tmp'
+    try:
+        extract_backup(backup_path, restore_tmp)
+        load_database_file(restore_tmp, db_file)
+    finally:
+        if os.path.exists(restore_tmp):
+            os.remove(restore_tmp)
+
+
+def list_backups():
+    """Returns the backup file names in BACKUP_DIR, oldest first."""
+    if not os.path.exists(BACKUP_DIR):
+        return []
+    return sorted(f for f in os.listdir(BACKUP_DIR) if f.endswith(BACKUP_EXTENSIONS))
+
+
+def restore_single_user(user_id, backup_path):
+    """Asks for confirmation, then restores one user's data with selective_restore.restore_user()."""
+    # Imported here because selective_restore builds on this module.
+    from selective_restore import restore_user
+
+    confirm = input(f"\n⚠️ WARNING: This will replace the transactions and budgets of user {user_id} "
+                    f"with their copy in '{os.path.relpath(backup_path, BACKUP_DIR)}'. "
+                    f"Other users are not affected.\nAre you sure you want to continue? (yes/no): ").lower()
+    if confirm != 'yes':
+        print("Restore cancelled.")
+        return
+    result = restore_user(user_id, backup_path)
+    print(f"✅ Restored {result['transactions'] + result['archived']:,} transactions and "
+          f"{result['budgets']} budgets of user {user_id} in {result['seconds']:.2f}s.")
 
-# backup.py
 
 def restore_from_backup():
     """
     Lists available backups and restores the database from a chosen file.
+
+    Both full backups and incremental snapshots are listed, oldest first,
+    from the backup catalog rather than the directory.
     """
-    backup_dir = 'backups'
-    if not os.path.exists(backup_dir):
+    # Imported here because incremental_backup and backup_catalog build on this module.
+    from incremental_backup import restore_snapshot
+    from backup_catalog import list_cataloged_backups
+
+    if not os.path.exists(BACKUP_DIR):
         print("❌ No backup directory found.")
         return
 
-    backups = [f for f in os.listdir(backup_dir) if f.endswith('.db')]
+    entries = list_cataloged_backups()
+    backups = [entry['name'] for entry in entries]
     if not backups:
-        print("❌ No backup files found in the 'backups' directory.")
+        print(f"❌ No backup files found in the '{BACKUP_DIR}' directory.")
         return
 
     print("\n--- Available Backups ---")
-    for i, filename in enumerate(backups, 1):
-        print(f"{i}. {filename}")
+    for i, entry in enumerate(entries, 1):
+        print(f"{i}. {entry['created_at']}  {entry['target']:<8}{entry['size']:>14,} bytes  {entry['name']}")
 
     try:
         choice = int(input("\nEnter the number of the backup to restore (or 0 to cancel): "))
@@ -62,18 +423,28 @@ def restore_from_backup():
             return
 
         selected_backup = backups[choice - 1]
-        backup_path = os.path.join(backup_dir, selected_backup)
+        backup_path = os.path.join(BACKUP_DIR, selected_backup)
+
+        user = input("Enter a user ID to restore only that user's data, or press Enter to restore everything: ").strip()
+        if user:
+            restore_single_user(int(user), backup_path)
+            return
 
         # --- CRUCIAL: Get user confirmation ---
         confirm = input(f"\n⚠️ WARNING: This will overwrite ALL current data with the contents of '{selected_backup}'.\nAre you sure you want to continue? (yes/no): ").lower()
 
         if confirm == 'yes':
-            shutil.copyfile(backup_path, 'finance.db')
+            if selected_backup.endswith('.json'):
+                restore_snapshot(os.path.basename(selected_backup))
+            else:
+                restore_backup_file(backup_path)
             print(f"✅ Database restored successfully from {selected_backup}.")
         else:
             print("Restore cancelled.")
 
     except ValueError:
         print("❌ Invalid input. Please enter a number.")
+    except BackupError as e:
+        print(f"❌ Restore aborted: {e}")
     except Exception as e:
-        print(f"❌ An error occurred during restore: {e}")
\ No newline at end of file
+        print(f"❌ An error occurred during restore: {e}")
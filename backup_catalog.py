@@ -0,0 +1,395 @@
+# backup_catalog.py
+## An index of every backup, kept in backups/catalog.sqlite.
+##
+## Each full backup and incremental snapshot is recorded when it is made:
+## when it was taken, which database file it is of, its size and checksum,
+## the schema version it was taken at, and how many rows each user has in
+## it. Listing backups, finding the latest one before a point in time, and
+## finding the backups that hold a given user are then index lookups on the
+## catalog instead of directory listings and file-name sorting, and restores
+## check a backup against its catalog entry before loading it.
+##
+## Backups made before the catalog existed are added by rebuild_catalog(),
+## which runs automatically when the catalog is created.
+##
+## Usage: python backup_catalog.py [--rebuild] [--user ID] [--before 'YYYY-MM-DD HH:MM:SS']
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from backup import BACKUP_DIR, CHUNK_SIZE, BackupError, _file_sha256, _open_backup, backup_shard, list_backups
+from database import MIGRATIONS, database_paths
+
+# Not '.db': list_backups() treats those as backups.
+CATALOG_PATH = os.path.join(BACKUP_DIR, 'catalog.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,          -- path relative to BACKUP_DIR
+    kind TEXT NOT NULL,                 -- 'full' or 'incremental'
+    target TEXT NOT NULL,               -- 'main' or 'shard<n>'
+    created_at TEXT NOT NULL,           -- 'YYYY-MM-DD HH:MM:SS', local time
+    size INTEGER NOT NULL,              -- bytes on disk (the manifest's database size for snapshots)
+    sha256 TEXT NOT NULL,               -- of the file (of the database for snapshots)
+    schema_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_backups_created ON backups(created_at);
+CREATE INDEX IF NOT EXISTS idx_backups_target_created ON backups(target, created_at);
+
+CREATE TABLE IF NOT EXISTS backup_users (
+    user_id INTEGER NOT NULL,
+    backup_id INTEGER NOT NULL,
+    transactions INTEGER NOT NULL,
+    archived INTEGER NOT NULL,
+    budgets INTEGER NOT NULL,
+    PRIMARY KEY (user_id, backup_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_backup_users_backup ON backup_users(backup_id);
+"""
+
+_COLUMNS = 'b.id, b.name, b.kind, b.target, b.created_at, b.size, b.sha256, b.schema_version'
+_FIELDS = ('id', 'name', 'kind', 'target', 'created_at', 'size', 'sha256', 'schema_version')
+
+
+def _connect():
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    db = sqlite3.connect(CATALOG_PATH, timeout=30)
+    db.executescript(_SCHEMA)
+    # user_version 0 means the directory was never scanned: catalog the
+    # backups that were already there before the catalog existed.
+    if db.execute("PRAGMA user_version").fetchone()[0] == 0:
+        db.execute("PRAGMA user_version = 1")
+        rebuild_catalog()
+    return db
+
+
+def _entries(rows):
+    return [dict(zip(_FIELDS, row)) for row in rows]
+
+
+def target_label(db_file):
+    """Returns 'shard<n>' for a shard file, otherwise 'main'."""
+    paths = [os.path.abspath(path) for path in database_paths()]
+    path = os.path.abspath(db_file)
+    if path in paths[1:]:
+        return f"shard{paths.index(path) - 1}"
+    return 'main'
+
+
+def _target_from_name(name):
+    """Returns the target a backup's name carries: 'shard<n>' for a '_shard<n>' suffix, else 'main'."""
+    index = backup_shard(name)
+    return 'main' if index is None else f"shard{index}"
+
+
+def read_contents(db_path):
+    """
+    Reads what a catalog entry records about an uncompressed database file.
+
+    Returns:
+        tuple: (schema_version, {user_id: (transactions, archived, budgets)}).
+               Users in the users table without any rows are included with zeros.
+    """
+    db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        users = {}
+        if 'users' in tables:
+            for (user_id,) in db.execute("SELECT id FROM users"):
+                users[user_id] = [0, 0, 0]
+        for slot, table in enumerate(('transactions', 'transactions_archive', 'budgets')):
+            if table not in tables:
+                continue
+            for user_id, count in db.execute(f"SELECT user_id, COUNT(*) FROM {table} GROUP BY user_id"):
+                users.setdefault(user_id, [0, 0, 0])[slot] = count
+    finally:
+        db.close()
+    return version, {user_id: tuple(counts) for user_id, counts in users.items()}
+
+
+def record_backup(name, kind, target, created_at, size, sha256, schema_version, users):
+    """
+    Adds a backup to the catalog, replacing any entry with the same name.
+
+    Args:
+        name (str): The backup's path relative to BACKUP_DIR.
+        kind (str): 'full' or 'incremental'.
+        target (str): 'main' or 'shard<n>', see target_label().
+        created_at (datetime or str): When the backup was taken.
+        size (int), sha256 (str): What restores check the file against.
+        schema_version (int): The database's user_version at backup time.
+        users (dict): user_id -> (transactions, archived, budgets).
+
+    Returns:
+        int: The backup's catalog ID.
+    """
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    db = _connect()
+    try:
+        with db:
+            db.execute("DELETE FROM backup_users WHERE backup_id IN (SELECT id FROM backups WHERE name = ?)",
+                       (name,))
+            db.execute("DELETE FROM backups WHERE name = ?", (name,))
+            backup_id = db.execute(
+                """INSERT INTO backups (name, kind, target, created_at, size, sha256, schema_version)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (name, kind, target, created_at, size, sha256, schema_version)
+            ).lastrowid
+            db.executemany(
+                """INSERT INTO backup_users (user_id, backup_id, transactions, archived, budgets)
+                   VALUES (?, ?, ?, ?, ?)""",
+                ((user_id, backup_id) + tuple(counts) for user_id, counts in users.items())
+            )
+    finally:
+        db.close()
+    return backup_id
+
+
+def forget_backups(names):
+    """Removes backups (names relative to BACKUP_DIR) from the catalog."""
+    db = _connect()
+    try:
+        with db:
+            for name in names:
+                db.execute("DELETE FROM backup_users WHERE backup_id IN (SELECT id FROM backups WHERE name = ?)",
+                           (name,))
+                db.execute("DELETE FROM backups WHERE name = ?", (name,))
+    finally:
+        db.close()
+
+
+def _query(sql, params=()):
+    db = _connect()
+    try:
+        return _entries(db.execute(sql, params).fetchall())
+    finally:
+        db.close()
+
+
+def get_backup(name):
+    """Returns the catalog entry of a backup (name relative to BACKUP_DIR), or None."""
+    entries = _query(f"SELECT {_COLUMNS} FROM backups b WHERE b.name = ?", (name,))
+    return entries[0] if entries else None
+
+
+def list_cataloged_backups(target=None):
+    """
+    Returns catalog entries, oldest first.
+
+    Args:
+        target (str): Only backups of this file ('main', 'shard<n>').
+
+    Returns:
+        list: Dictionaries with the fields of the backups table.
+    """
+    if target is None:
+        return _query(f"SELECT {_COLUMNS} FROM backups b ORDER BY b.created_at, b.id")
+    return _query(f"SELECT {_COLUMNS} FROM backups b WHERE b.target = ? ORDER BY b.created_at, b.id",
+                  (target,))
+
+
+def latest_backup_before(when, target='main', kind=None):
+    """
+    Returns the newest backup taken before `when`, or None.
+
+    Args:
+        when (datetime or str): The point in time ('YYYY-MM-DD HH:MM:SS').
+        target (str): Which file's backups to look at; None for any.
+        kind (str): Only 'full' or only 'incremental' backups.
+    """
+    if isinstance(when, datetime):
+        when = when.strftime('%Y-%m-%d %H:%M:%S')
+    conditions, params = ["b.created_at < ?"], [when]
+    if target is not None:
+        conditions.append("b.target = ?")
+        params.append(target)
+    if kind is not None:
+        conditions.append("b.kind = ?")
+        params.append(kind)
+    entries = _query(
+        f"""SELECT {_COLUMNS} FROM backups b WHERE {' AND '.join(conditions)}
+            ORDER BY b.created_at DESC, b.id DESC LIMIT 1""",
+        params
+    )
+    return entries[0] if entries else None
+
+
+def backups_containing_user(user_id, with_data=False):
+    """
+    Returns the backups that hold a user, newest first.
+
+    Args:
+        user_id (int): The user.
+        with_data (bool): Only backups with at least one of the user's
+                          transactions or budgets (the user's shard, when
+                          sharded), not just the user's account.
+
+    Returns:
+        list: Catalog entries, each with the user's 'transactions',
+              'archived' and 'budgets' counts added.
+    """
+    having = "AND u.transactions + u.archived + u.budgets > 0" if with_data else ""
+    db = _connect()
+    try:
+        rows = db.execute(
+            f"""SELECT {_COLUMNS}, u.transactions, u.archived, u.budgets
+                FROM backup_users u JOIN backups b ON b.id = u.backup_id
+                WHERE u.user_id = ? {having}
+                ORDER BY b.created_at DESC, b.id DESC""",
+            (user_id,)
+        ).fetchall()
+    finally:
+        db.close()
+    return [dict(zip(_FIELDS + ('transactions', 'archived', 'budgets'), row)) for row in rows]
+
+
+def backup_user_counts(name, user_id):
+    """
+    Returns what the catalog recorded about one user in one backup.
+
+    Returns:
+        tuple: (transactions, archived, budgets); zeros when the backup
+               holds none of the user's rows. None when the backup is not
+               cataloged or has no per-user counts (snapshots cataloged by
+               rebuild_catalog()).
+    """
+    db = _connect()
+    try:
+        row = db.execute(
+            """SELECT b.id, u.transactions, u.archived, u.budgets
+               FROM backups b LEFT JOIN backup_users u ON u.backup_id = b.id AND u.user_id = ?
+               WHERE b.name = ?
+                 AND EXISTS (SELECT 1 FROM backup_users a WHERE a.backup_id = b.id)""",
+            (user_id, name)
+        ).fetchone()
+    finally:
+        db.close()
+    if row is None:
+        return None
+    return tuple(count or 0 for count in row[1:])
+
+
+def verify_against_catalog(name, path):
+    """
+    Checks a backup file against its catalog entry.
+
+    Returns:
+        bool: True if it matches, None if the backup is not in the catalog.
+
+    Raises:
+        BackupError: If the size or checksum differs, or the backup was made
+                     by a newer schema than this version of the application knows.
+    """
+    entry = get_backup(name)
+    if entry is None:
+        return None
+    if entry['schema_version'] > len(MIGRATIONS):
+        raise BackupError(f"'{name}' was made with a newer schema (version {entry['schema_version']}).")
+    if not os.path.exists(path):
+        raise BackupError(f"'{name}' is in the catalog but its file is missing.")
+
+    if entry['kind'] == 'incremental':
+        # The manifest must still describe the database that was cataloged;
+        # restore_snapshot() checks the rebuilt file against the manifest.
+        with open(path) as f:
+            manifest = json.load(f)
+        size, checksum = manifest['size'], manifest['sha256']
+    else:
+        size = os.path.getsize(path)
+        checksum = _file_sha256(path) if size == entry['size'] else None
+    if size != entry['size'] or checksum != entry['sha256']:
+        raise BackupError(f"'{name}' does not match its catalog entry.")
+    return True
+
+
+def rebuild_catalog():
+    """
+    Catalogs every backup in BACKUP_DIR that is not in the catalog yet, and
+    drops entries whose files are gone.
+
+    Each uncataloged full backup is decompressed once to read its contents.
+    Incremental snapshots are cataloged from their manifests, without
+    per-user counts.
+
+    Returns:
+        int: The number of backups added.
+    """
+    # Imported here because incremental_backup builds on this module.
+    from incremental_backup import _catalog_name, list_snapshots, load_manifest
+
+    db = _connect()
+    try:
+        known = {row[0] for row in db.execute("SELECT name FROM backups")}
+    finally:
+        db.close()
+
+    present = set()
+    added = 0
+    for filename in list_backups():
+        present.add(filename)
+        if filename in known:
+            continue
+        path = os.path.join(BACKUP_DIR, filename)
+        fd, tmp_path = tempfile.mkstemp(suffix='.catalog.tmp', dir=BACKUP_DIR)
+        try:
+            with _open_backup(path) as src, os.fdopen(fd, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            version, users = read_contents(tmp_path)
+        except (OSError, sqlite3.Error, RuntimeError) as e:
+            print(f"⚠️  Skipped '{filename}': {e}")
+            continue
+        finally:
+            os.remove(tmp_path)
+        record_backup(filename, 'full', _target_from_name(filename),
+                      datetime.fromtimestamp(os.path.getmtime(path)),
+                      os.path.getsize(path), _file_sha256(path), version, users)
+        added += 1
+
+    for manifest_name in list_snapshots():
+        name = _catalog_name(manifest_name)
+        present.add(name)
+        if name in known:
+            continue
+        manifest = load_manifest(manifest_name)
+        target = _target_from_name(manifest_name)
+        if target == 'main' and manifest.get('source'):
+            # Snapshots from before shard snapshots were named '_shard<n>'.
+            target = target_label(manifest['source'])
+        record_backup(name, 'incremental', target, manifest['created'].replace('T', ' '),
+                      manifest['size'], manifest['sha256'], manifest.get('schema_version', 0), {})
+        added += 1
+
+    forget_backups(known - present)
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query or rebuild the backup catalog.')
+    parser.add_argument('--rebuild', action='store_true', help='catalog backups that are missing from it')
+    parser.add_argument('--user', type=int, help='list the backups that hold this user')
+    parser.add_argument('--before', help="show the latest backup before 'YYYY-MM-DD HH:MM:SS'")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        print(f"✅ Added {rebuild_catalog()} backup(s) to the catalog.")
+    if args.user is not None:
+        entries = backups_containing_user(args.user)
+    elif args.before:
+        entry = latest_backup_before(args.before, target=None)
+        entries = [entry] if entry else []
+    else:
+        entries = list_cataloged_backups()
+    for entry in entries:
+        print(f"{entry['created_at']}  {entry['target']:<8}{entry['size']:>14,}  {entry['name']}")
+
+
+if __name__ == '__main__':
+    main()
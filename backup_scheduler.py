@@ -0,0 +1,230 @@
+# backup_scheduler.py
+## Takes backups in the background on a fixed interval.
+##
+## A daemon thread wakes up every `interval` seconds and backs up each
+## database file (the main database and, with sharding on, every shard)
+## that changed since its last backup. A file counts as changed when its
+## PRAGMA data_version, read on a connection the scheduler keeps open, has
+## moved: SQLite bumps it whenever another connection commits to the file.
+##
+## The copy is throttled from the backup API's progress callback. After each
+## step the thread sleeps long enough to stay under max_read_bytes_per_sec,
+## and for longer while the application is committing, so the backup takes
+## the idle time rather than competing with user-facing writes.
+##
+## Start it from the application with FINANCE_BACKUP_INTERVAL=<seconds>, or
+## run it on its own: python backup_scheduler.py --interval 3600 [--max-read-mb 8]
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from backup import BACKUP_PAGES_PER_STEP, backup_set_jobs, create_backup
+
+DEFAULT_INTERVAL = 3600
+# Reads from the live database are kept under this many bytes per second.
+DEFAULT_MAX_READ_BYTES_PER_SEC = 8 * 1024 * 1024
+# Pages per backup step. Smaller than a foreground backup's, so each step
+# is short and the pauses between them come often.
+SCHEDULED_PAGES_PER_STEP = BACKUP_PAGES_PER_STEP // 4
+# Pause after every step, and after a step during which the application committed.
+STEP_PAUSE = 0.001
+BUSY_PAUSE = 0.05
+
+log = logging.getLogger('finance.backup_scheduler')
+
+
+class _Throttle:
+    """Backup progress callback that paces the copy of one database file."""
+
+    def __init__(self, watch, max_bytes_per_sec):
+        self.watch = watch
+        self.page_size = watch.execute("PRAGMA page_size").fetchone()[0]
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.data_version = watch.execute("PRAGMA data_version").fetchone()[0]
+        self.start = time.perf_counter()
+        self.pages = 0
+        self.busy_pauses = 0
+
+    def __call__(self, status, remaining, total):
+        self.pages = total - remaining
+        pause = STEP_PAUSE
+        if self.max_bytes_per_sec:
+            ahead = self.pages * self.page_size / self.max_bytes_per_sec - (time.perf_counter() - self.start)
+            pause = max(pause, ahead)
+        # A moved data_version means the application committed during the last step.
+        version = self.watch.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            self.data_version = version
+            self.busy_pauses += 1
+            pause = max(pause, BUSY_PAUSE)
+        time.sleep(pause)
+
+
+class BackupScheduler:
+    """
+    Runs backups of changed database files every `interval` seconds on a daemon thread.
+
+    Args:
+        interval (float): Seconds between runs.
+        max_read_bytes_per_sec (int): Read budget for copying the live
+                                      database; 0 or None for no limit.
+        pages (int): Pages copied per backup step.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, max_read_bytes_per_sec=DEFAULT_MAX_READ_BYTES_PER_SEC,
+                 pages=SCHEDULED_PAGES_PER_STEP):
+        self.interval = interval
+        self.max_read_bytes_per_sec = max_read_bytes_per_sec
+        self.pages = pages
+        self.runs = 0
+        self.skipped_runs = 0
+        self._last_run = None
+        self._watch = {}           # path -> connection used to read data_version
+        self._backed_up = {}       # path -> data_version of its last backup
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def last_run(self):
+        """
+        What the most recent run did, or None before the first one.
+
+        Returns:
+            dict: 'started' (epoch seconds), 'seconds', 'skipped' (nothing
+                  had changed), 'backups' (paths written), 'bytes' (their
+                  size on disk), 'pages' read, 'busy_pauses' (steps that
+                  waited for the application) and 'errors' (files that failed).
+        """
+        with self._lock:
+            return None if self._last_run is None else dict(self._last_run)
+
+    def _data_version(self, path):
+        db = self._watch.get(path)
+        if db is None:
+            db = self._watch[path] = sqlite3.connect(path, check_same_thread=False)
+        return db.execute("PRAGMA data_version").fetchone()[0]
+
+    def run_once(self):
+        """
+        Backs up every database file that changed since its last backup.
+
+        Returns:
+            dict: The run's statistics, see last_run.
+        """
+        started = time.time()
+        start = time.perf_counter()
+        stats = {'started': started, 'skipped': True, 'backups': [], 'bytes': 0,
+                 'pages': 0, 'busy_pauses': 0, 'errors': []}
+        for db_file, name in backup_set_jobs():
+            if not os.path.exists(db_file):
+                continue
+            version = self._data_version(db_file)
+            if self._backed_up.get(db_file) == version:
+                continue
+            stats['skipped'] = False
+            throttle = _Throttle(self._watch[db_file], self.max_read_bytes_per_sec)
+            path = create_backup(db_file, self.pages, throttle, name, quiet=True)
+            stats['pages'] += throttle.pages
+            stats['busy_pauses'] += throttle.busy_pauses
+            if path is None:
+                stats['errors'].append(db_file)
+                continue
+            # The version was read before the copy started, so a commit that
+            # raced with it only causes one extra backup next time.
+            self._backed_up[db_file] = version
+            stats['backups'].append(path)
+            stats['bytes'] += os.path.getsize(path)
+        stats['seconds'] = time.perf_counter() - start
+
+        with self._lock:
+            self.runs += 1
+            self.skipped_runs += stats['skipped']
+            self._last_run = stats
+        if stats['skipped']:
+            log.info("backup skipped: no changes")
+        else:
+            log.info("backed up %d file(s), %d bytes in %.2fs", len(stats['backups']),
+                     stats['bytes'], stats['seconds'])
+        return stats
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("scheduled backup failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts the background thread; the first run happens right away."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the thread after the current run and closes its connections."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for db in self._watch.values():
+            db.close()
+        self._watch.clear()
+
+
+_scheduler = None
+
+
+def start_from_environment():
+    """
+    Starts a shared BackupScheduler when FINANCE_BACKUP_INTERVAL is set.
+
+    FINANCE_BACKUP_MAX_READ_MB optionally sets the read budget in MB/s.
+
+    Returns:
+        BackupScheduler: The running scheduler, or None when not configured.
+    """
+    global _scheduler
+    interval = os.environ.get('FINANCE_BACKUP_INTERVAL')
+    if not interval:
+        return None
+    if _scheduler is None:
+        max_read_mb = os.environ.get('FINANCE_BACKUP_MAX_READ_MB')
+        _scheduler = BackupScheduler(
+            float(interval),
+            int(float(max_read_mb) * 1024 * 1024) if max_read_mb else DEFAULT_MAX_READ_BYTES_PER_SEC,
+        )
+    _scheduler.start()
+    return _scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Back up the finance database on an interval.')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='seconds between runs')
+    parser.add_argument('--max-read-mb', type=float, default=DEFAULT_MAX_READ_BYTES_PER_SEC / 1024 / 1024,
+                        help='read budget in MB/s (0 for no limit)')
+    parser.add_argument('--once', action='store_true', help='run once and exit')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    scheduler = BackupScheduler(args.interval, int(args.max_read_mb * 1024 * 1024))
+    if args.once:
+        scheduler.run_once()
+        return
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# batch_reports.py
+## Monthly statements for every user, one file per user.
+##
+## A month is read in one grouped pass per database file: the
+## monthly_totals.month_all_users query returns that month's rollup rows of
+## every user in user_id order (through idx_monthly_totals_year_month). The
+## users are listed in id order, a page at a time, and merged with those
+## rows, so there are no per-user queries at all. Reads happen in this
+## process, in reporting mode (from the replica when one is running).
+##
+## Chunks of users are handed to a process pool, which builds each user's
+## summary (reports.summarize_month), formats it and writes
+## statements/<YYYY-MM>/user-<id>.txt. Only a few chunks are in flight at a
+## time, so memory stays flat however many users there are.
+##
+## Usage: python batch_reports.py [--month YYYY-MM ...] [--output DIR] [--workers N]
+
+import argparse
+import heapq
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, datetime
+from operator import itemgetter
+
+import queries
+from database import get_connection, get_shard_connection, get_shard_count
+from instrumentation import timed_operation
+from replica import reporting
+from reports import summarize_month
+
+STATEMENT_DIR = 'statements'
+# Users per task sent to the pool.
+DEFAULT_CHUNK_SIZE = 500
+# Users read per page of the users table.
+USER_PAGE_SIZE = 1000
+# Chunks queued per worker before the reader waits for one to finish.
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def _iter_users():
+    """Yields (id, username) of every user in id order, a page at a time."""
+    cursor = get_connection().cursor()
+    last_id = 0
+    while True:
+        page = queries.execute(cursor, 'users.page', (last_id, USER_PAGE_SIZE)).fetchall()
+        yield from page
+        if len(page) < USER_PAGE_SIZE:
+            return
+        last_id = page[-1][0]
+
+
+def _iter_month_rows(year_month):
+    """Yields (user_id, type, category, total) of every user for one month, in user_id order."""
+    shard_count = get_shard_count()
+    cursors = [
+        queries.execute(get_shard_connection(index).cursor(), 'monthly_totals.month_all_users', (year_month,))
+        for index in ([None] if not shard_count else range(shard_count))
+    ]
+    # Each file is already ordered by user_id; merging keeps it that way.
+    return heapq.merge(*cursors, key=itemgetter(0))
+
+
+def _iter_statements(year_month):
+    """Yields (user_id, username, rows) for every user; rows are their (type, category, total)."""
+    rows = _iter_month_rows(year_month)
+    pending = next(rows, None)
+    for user_id, username in _iter_users():
+        user_rows = []
+        while pending is not None and pending[0] <= user_id:
+            if pending[0] == user_id:
+                user_rows.append(pending[1:])
+            pending = next(rows, None)
+        yield user_id, username, user_rows
+
+
+def format_statement(username, year_month, summary):
+    """
+    Formats a get_monthly_summary() report as a plain-text statement.
+
+    Args:
+        username (str): Whose statement it is.
+        year_month (str): The month, 'YYYY-MM'.
+        summary (dict): The report.
+
+    Returns:
+        str: The statement.
+    """
+    lines = [
+        f"Monthly Statement for {username} - {year_month}",
+        "",
+        f"Total Income:   ${summary['income']:>10,.2f}",
+        f"Total Expenses: ${summary['expenses']:>10,.2f}",
+        "-" * 30,
+        f"Net Savings:    ${summary['savings']:>10,.2f}",
+        "",
+    ]
+    if summary['expense_breakdown']:
+        lines.append("Expense Breakdown by Category")
+        lines.extend(f"{category:<20} ${amount:>10,.2f}" for category, amount in summary['expense_breakdown'])
+    else:
+        lines.append("No expenses this month.")
+    return "\n".join(lines) + "\n"
+
+
+def _write_statements(month_dir, year_month, chunk):
+    """
+    Pool task: formats and writes the statements of a chunk of users.
+
+    Returns:
+        tuple: (statements written, bytes written).
+    """
+    written = 0
+    for user_id, username, rows in chunk:
+        text = format_statement(username, year_month, summarize_month(rows)).encode('utf-8')
+        with open(os.path.join(month_dir, f"user-{user_id}.txt"), 'wb') as f:
+            f.write(text)
+        written += len(text)
+    return len(chunk), written
+
+
+@timed_operation('batch_reports')
+def generate_statements(months, output_dir=STATEMENT_DIR, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                        progress=None):
+    """
+    Writes a statement for every user for each of the given months.
+
+    Args:
+        months (list): Months as 'YYYY-MM'.
+        output_dir (str): Statements go to <output_dir>/<YYYY-MM>/user-<id>.txt.
+        workers (int): Processes formatting and writing; defaults to the CPU count.
+        chunk_size (int): Users per pool task.
+        progress (callable): Called as progress(done, total, seconds) as chunks finish.
+
+    Returns:
+        dict: 'months', 'statements' written, 'bytes' written, 'seconds'
+              taken and 'per_second' (statements per second).
+    """
+    start = time.perf_counter()
+    stats = {'months': list(months), 'statements': 0, 'bytes': 0}
+    workers = workers or os.cpu_count() or 1
+    total = queries.execute(get_connection(), 'users.count').fetchone()[0] * len(months)
+    in_flight = set()
+
+    def collect(done):
+        for future in done:
+            statements, written = future.result()
+            stats['statements'] += statements
+            stats['bytes'] += written
+        if progress:
+            progress(stats['statements'], total, time.perf_counter() - start)
+
+    with ProcessPoolExecutor(workers) as pool, reporting():
+        for year_month in months:
+            month_dir = os.path.join(output_dir, year_month)
+            os.makedirs(month_dir, exist_ok=True)
+            chunk = []
+            for statement in _iter_statements(year_month):
+                chunk.append(statement)
+                if len(chunk) < chunk_size:
+                    continue
+                in_flight.add(pool.submit(_write_statements, month_dir, year_month, chunk))
+                chunk = []
+                if len(in_flight) >= workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+            if chunk:
+                in_flight.add(pool.submit(_write_statements, month_dir, year_month, chunk))
+        collect(wait(in_flight).done)
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['per_second'] = stats['statements'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def _year_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').strftime('%Y-%m')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a month (YYYY-MM): {value!r}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write monthly statements for every user.')
+    parser.add_argument('--month', type=_year_month, action='append', dest='months',
+                        help='YYYY-MM, may be repeated (default: the current month)')
+    parser.add_argument('--output', default=STATEMENT_DIR, help='directory to write statements to')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='users per task')
+    args = parser.parse_args()
+    months = args.months or [date.today().strftime('%Y-%m')]
+
+    def show_progress(done, total, seconds):
+        rate = done / seconds if seconds else 0.0
+        print(f"\r  {done:,}/{total:,} statements ({rate:,.0f}/s)", end='', flush=True)
+
+    try:
+        stats = generate_statements(months, args.output, args.workers, args.chunk_size, show_progress)
+    except (sqlite3.Error, OSError) as e:
+        print(f"\n❌ Batch reports failed: {e}")
+        return
+    print(f"\n✅ Wrote {stats['statements']:,} statements ({stats['bytes'] / 1024 / 1024:.1f} MB) "
+          f"for {', '.join(months)} to '{args.output}' in {stats['seconds']:.2f}s "
+          f"({stats['per_second']:,.0f} statements/s).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# bench_auth.py
+## Measures login throughput for different password-hashing cost settings.
+##
+## Usage: python bench_auth.py [--logins 200] [--workers 8] [--json]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+import auth
+import database
+
+# (label, settings passed to auth.configure_kdf)
+COST_SETTINGS = [
+    ('scrypt n=2^12', {'algorithm': 'scrypt', 'scrypt_n': 2 ** 12}),
+    ('scrypt n=2^13', {'algorithm': 'scrypt', 'scrypt_n': 2 ** 13}),
+    ('scrypt n=2^14', {'algorithm': 'scrypt', 'scrypt_n': 2 ** 14}),
+    ('scrypt n=2^15', {'algorithm': 'scrypt', 'scrypt_n': 2 ** 15}),
+    ('pbkdf2 100k', {'algorithm': 'pbkdf2_sha256', 'pbkdf2_iterations': 100_000}),
+    ('pbkdf2 300k', {'algorithm': 'pbkdf2_sha256', 'pbkdf2_iterations': 300_000}),
+    ('pbkdf2 600k', {'algorithm': 'pbkdf2_sha256', 'pbkdf2_iterations': 600_000}),
+]
+
+
+def benchmark_logins(settings, logins=200, workers=None, users=20):
+    """
+    Registers `users` accounts with the given KDF settings, then times
+    `logins` concurrent logins through the hashing pool.
+
+    The login cache is disabled so every login pays for the full KDF.
+
+    Returns:
+        dict: The settings, pool size, elapsed seconds and logins/second.
+    """
+    auth.configure_kdf(**settings)
+    if workers:
+        auth.HASH_WORKERS = workers
+    auth._hash_pool = None
+    cache_ttl, auth.LOGIN_CACHE_TTL = auth.LOGIN_CACHE_TTL, 0
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(users):
+                auth.register_user(f"bench_user_{i}", f"password-{i}")
+
+            start = time.perf_counter()
+            futures = [auth.submit_login(f"bench_user_{i % users}", f"password-{i % users}")
+                       for i in range(logins)]
+            failed = sum(1 for future in futures if future.result() is None)
+            elapsed = time.perf_counter() - start
+    finally:
+        auth.LOGIN_CACHE_TTL = cache_ttl
+        auth._get_hash_pool().shutdown()
+        auth._hash_pool = None
+
+    return {
+        'settings': settings,
+        'workers': auth.HASH_WORKERS,
+        'logins': logins,
+        'failed': failed,
+        'seconds': elapsed,
+        'logins_per_second': logins / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput per password-hashing cost setting.')
+    parser.add_argument('--logins', type=int, default=200, help='logins per cost setting')
+    parser.add_argument('--workers', type=int, default=None, help='hashing pool size')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    defaults = dict(auth.KDF_SETTINGS)
+    for label, settings in COST_SETTINGS:
+        # Each setting gets a fresh scratch database.
+        with tempfile.TemporaryDirectory() as scratch:
+            database.set_database_path(os.path.join(scratch, 'bench_auth.db'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                database.initialize_database()
+            result = benchmark_logins(settings, args.logins, args.workers)
+            database.close_connections()
+        auth.configure_kdf(**defaults)
+        result['label'] = label
+        results.append(result)
+        if not args.json:
+            print(f"{label:<16} {result['logins_per_second']:>10,.1f} logins/sec "
+                  f"({result['workers']} workers, {result['seconds']:.2f}s)")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
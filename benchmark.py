@@ -0,0 +1,350 @@
+# benchmark.py
+## Benchmark suite for the finance engine.
+##
+## Generates a synthetic dataset into a scratch database, times the public
+## functions and writes the results as JSON so runs can be compared between
+## commits.
+##
+## Usage:
+##   python benchmark.py --users 20 --transactions 5000 --output results.json
+##   python benchmark.py --compare results.json      # compare against an earlier run
+##   python benchmark.py --shard-writes 1,2,4,8       # write throughput per shard count
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import auth
+import backup
+import database
+from budget import check_spending_against_budget, get_budgets_with_spending, set_budget
+from importer import import_transactions
+from reports import get_monthly_summary
+from transactions import add_transaction, get_transactions_page, view_transactions
+
+EXPENSE_CATEGORIES = [
+    # (category, relative frequency, typical amount)
+    ('Food', 30, 25), ('Groceries', 20, 80), ('Transport', 15, 15),
+    ('Entertainment', 10, 40), ('Utilities', 5, 120), ('Rent', 3, 1200),
+    ('Health', 5, 60), ('Shopping', 12, 70),
+]
+INCOME_CATEGORIES = [('Salary', 80, 3000), ('Freelance', 15, 500), ('Interest', 5, 20)]
+BUDGET_CATEGORIES = ['Food', 'Groceries', 'Transport', 'Entertainment', 'Shopping']
+PASSWORD = 'benchmark-password'
+
+
+def _quiet():
+    """Silences the print() feedback of the functions being timed."""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _synthetic_transactions(rng, count, years, today):
+    """Yields `count` random (type, category, amount, date, description) tuples."""
+    expense_names = [c[0] for c in EXPENSE_CATEGORIES]
+    expense_weights = [c[1] for c in EXPENSE_CATEGORIES]
+    expense_amounts = dict((c[0], c[2]) for c in EXPENSE_CATEGORIES)
+    income_names = [c[0] for c in INCOME_CATEGORIES]
+    income_weights = [c[1] for c in INCOME_CATEGORIES]
+    income_amounts = dict((c[0], c[2]) for c in INCOME_CATEGORIES)
+    span_days = int(365 * years)
+
+    for _ in range(count):
+        trans_date = (today - timedelta(days=rng.randrange(span_days))).isoformat()
+        if rng.random() < 0.1:
+            category = rng.choices(income_names, income_weights)[0]
+            amount = round(rng.uniform(0.5, 1.5) * income_amounts[category], 2)
+            yield ('income', category, amount, trans_date, 'synthetic income')
+        else:
+            category = rng.choices(expense_names, expense_weights)[0]
+            amount = round(rng.uniform(0.2, 1.8) * expense_amounts[category], 2)
+            yield ('expense', category, amount, trans_date, 'synthetic expense')
+
+
+def generate_dataset(users=10, transactions_per_user=1000, years=3, seed=42):
+    """
+    Fills the current database with synthetic users, transactions and budgets.
+
+    Every user is named 'bench_user_<n>' with the password PASSWORD, and
+    gets `transactions_per_user` transactions spread over the last `years`
+    years, plus budgets for BUDGET_CATEGORIES.
+
+    Returns:
+        list: The new users' IDs.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    user_ids = []
+    with _quiet():
+        for n in range(users):
+            username = f"bench_user_{n}"
+            auth.register_user(username, PASSWORD)
+            user_id = database.get_connection().execute(
+                "SELECT id FROM users WHERE username = ?", (username,)
+            ).fetchone()[0]
+            user_ids.append(user_id)
+            import_transactions(user_id, _synthetic_transactions(rng, transactions_per_user, years, today),
+                                batch_size=5000, check_budgets=False)
+            for category in BUDGET_CATEGORIES:
+                set_budget(user_id, category, rng.choice([100, 250, 500, 1000]))
+    return user_ids
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def time_function(func, iterations, setup=None):
+    """
+    Calls func() `iterations` times and summarises the latencies.
+
+    Args:
+        func (callable): The call to time. Its output is silenced.
+        iterations (int): How many timed calls to make.
+        setup (callable): Called, untimed, before each call.
+
+    Returns:
+        dict: Latency statistics in milliseconds.
+    """
+    timings = []
+    with _quiet():
+        for _ in range(iterations):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': sum(timings) / len(timings),
+        'min_ms': timings[0],
+        'p50_ms': percentile(timings, 50),
+        'p90_ms': percentile(timings, 90),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+        'max_ms': timings[-1],
+    }
+
+
+def run_benchmarks(user_ids, iterations=200, rng=None):
+    """
+    Times each public function against users picked at random from `user_ids`.
+
+    Returns:
+        dict: Function name -> latency statistics.
+    """
+    rng = rng or random.Random(7)
+    today = date.today()
+    pick = lambda: rng.choice(user_ids)
+    username = lambda user_id: f"bench_user_{user_ids.index(user_id)}"
+
+    # Each entry: (name, function to time, setup run before each call or None, iterations)
+    cases = [
+        ('add_transaction',
+         lambda: add_transaction(pick(), 'expense', rng.choice(BUDGET_CATEGORIES), 12.5, 'bench'),
+         None, iterations),
+        ('view_transactions',
+         lambda: view_transactions(pick()),
+         None, max(1, iterations // 10)),
+        ('get_transactions_page',
+         lambda: get_transactions_page(pick()),
+         None, iterations),
+        ('get_monthly_summary',
+         lambda: get_monthly_summary(pick(), today.year, rng.randint(1, today.month)),
+         None, iterations),
+        ('get_budgets_with_spending',
+         lambda: get_budgets_with_spending(pick()),
+         None, iterations),
+        ('check_spending_against_budget',
+         lambda: check_spending_against_budget(pick(), rng.choice(BUDGET_CATEGORIES)),
+         None, iterations),
+        # Cold logins pay for the full KDF; cached logins hit the verified-login cache.
+        ('login_user',
+         lambda: auth.login_user(username(pick()), PASSWORD),
+         auth.clear_login_cache, max(1, iterations // 10)),
+        ('login_user_cached',
+         lambda: auth.login_user(username(user_ids[0]), PASSWORD),
+         None, iterations),
+        ('create_backup',
+         lambda: backup.create_backup(),
+         None, 3),
+    ]
+
+    results = {}
+    for name, func, setup, count in cases:
+        results[name] = time_function(func, count, setup)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def benchmark(users=10, transactions_per_user=1000, years=3, iterations=200, seed=42):
+    """
+    Builds a scratch database, generates a dataset and runs the benchmarks.
+
+    The application's database path and backup directory are pointed at a
+    temporary directory for the duration and restored afterwards.
+
+    Returns:
+        dict: Run metadata and per-function results, ready for json.dump().
+    """
+    original_db = database.get_database_path()
+    original_backup_dir = backup.BACKUP_DIR
+    with tempfile.TemporaryDirectory() as scratch:
+        database.set_database_path(os.path.join(scratch, 'benchmark.db'))
+        backup.BACKUP_DIR = os.path.join(scratch, 'backups')
+        try:
+            with _quiet():
+                database.initialize_database()
+            start = time.perf_counter()
+            user_ids = generate_dataset(users, transactions_per_user, years, seed)
+            generate_seconds = time.perf_counter() - start
+            results = run_benchmarks(user_ids, iterations)
+        finally:
+            database.set_database_path(original_db)
+            backup.BACKUP_DIR = original_backup_dir
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'dataset': {
+            'users': users,
+            'transactions_per_user': transactions_per_user,
+            'years': years,
+            'seed': seed,
+            'generate_seconds': generate_seconds,
+        },
+        'results': results,
+    }
+
+
+def benchmark_shard_writes(shard_counts=(1, 2, 4, 8), writers=8, writes_per_writer=500):
+    """
+    Measures concurrent write throughput as the number of shards grows.
+
+    For each shard count a scratch database is sharded that many ways and
+    `writers` threads, one user each, call add_transaction() (one commit per
+    call) as fast as they can. A count of 0 is the unsharded layout.
+
+    Returns:
+        dict: Shard count -> {'writes', 'seconds', 'writes_per_second'}.
+    """
+    original_db = database.get_database_path()
+    original_shards = database.get_shard_count()
+    results = {}
+    try:
+        for shard_count in shard_counts:
+            with tempfile.TemporaryDirectory() as scratch:
+                database.set_database_path(os.path.join(scratch, 'shards.db'))
+                database.set_shard_count(shard_count)
+                with _quiet():
+                    database.initialize_database()
+                db = database.get_connection()
+                user_ids = []
+                for n in range(writers):
+                    # The password is never checked here, so skip the KDF.
+                    user_ids.append(db.execute(
+                        "INSERT INTO users (username, password_hash) VALUES (?, '-') RETURNING id",
+                        (f"shard_writer_{n}",)
+                    ).fetchone()[0])
+                db.commit()
+
+                def write(user_id):
+                    for _ in range(writes_per_writer):
+                        add_transaction(user_id, 'expense', 'Food', 1.0, 'shard bench')
+
+                threads = [threading.Thread(target=write, args=(user_id,)) for user_id in user_ids]
+                with _quiet():
+                    start = time.perf_counter()
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                    seconds = time.perf_counter() - start
+                database.close_connections()
+
+            writes = writers * writes_per_writer
+            results[shard_count] = {'writes': writes, 'seconds': seconds,
+                                    'writes_per_second': writes / seconds}
+    finally:
+        database.set_database_path(original_db)
+        database.set_shard_count(original_shards)
+    return results
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    Prints the p50 and p95 change per function between two runs.
+
+    Changes larger than `threshold` (a fraction) are flagged.
+    """
+    print(f"{'Function':<32}{'p50 before':>12}{'p50 now':>12}{'change':>9}{'p95 now':>12}")
+    print("-" * 77)
+    for name, now in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<32}{'-':>12}{now['p50_ms']:>12.3f}{'new':>9}{now['p95_ms']:>12.3f}")
+            continue
+        change = (now['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0.0
+        flag = '  <-- slower' if change > threshold else ('  faster' if change < -threshold else '')
+        print(f"{name:<32}{before['p50_ms']:>12.3f}{now['p50_ms']:>12.3f}{change:>+9.1%}"
+              f"{now['p95_ms']:>12.3f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the finance engine on synthetic data.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=1000, help='transactions per user')
+    parser.add_argument('--years', type=float, default=3)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='a previous JSON result to compare against')
+    parser.add_argument('--shard-writes', metavar='COUNTS',
+                        help='only measure write throughput for these comma-separated shard counts')
+    args = parser.parse_args()
+
+    if args.shard_writes:
+        counts = [int(count) for count in args.shard_writes.split(',')]
+        print(f"{'Shards':>6}{'Writes':>10}{'Seconds':>10}{'Writes/sec':>12}")
+        for shard_count, r in benchmark_shard_writes(counts).items():
+            print(f"{shard_count:>6}{r['writes']:>10}{r['seconds']:>10.2f}{r['writes_per_second']:>12,.0f}")
+        return
+
+    result = benchmark(args.users, args.transactions, args.years, args.iterations, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+    if not args.output and not args.compare:
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
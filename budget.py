@@ -1,6 +1,124 @@
 # budget.py
 
-import sqlite3
+import threading
+from database import get_connection, get_thread_reader
+import queries
+from instrumentation import timed_operation
+from money import Money, to_cents
+
+# --- In-process budget state cache ---
+# For each user it holds the current month's budget limits and month-to-date
+# expense totals per category, so checking a budget after every expense is a
+# dictionary lookup rather than two queries. The transaction functions report
+# their changes with record_spending_change() after they commit, set_budget()
+# updates the limits, and the state is reloaded when the month changes.
+# Writes made by other processes are not seen; call invalidate_budget_state()
+# after changing the database behind the application's back.
+_budget_state = {}  # user_id -> {'month': 'YYYY-MM', 'limits': {...}, 'spent': {...}}
+# Bumped by every recorded change, cached or not. A state loaded while a
+# change was recorded may or may not include it, so it is not installed.
+_budget_versions = {}  # user_id -> int
+_budget_state_lock = threading.Lock()
+# Loads retried before giving up on caching while changes keep arriving.
+BUDGET_LOAD_ATTEMPTS = 3
+
+
+def _load_budget_state(user_id, year_month):
+    """Reads a user's limits and month-to-date spending from the database."""
+    db = get_connection(user_id)
+    limits = {category: Money(limit) for category, limit in
+              queries.execute(db, 'budgets.limits', (user_id,))}
+    spent = {category: Money(total) for category, total in
+             queries.execute(db, 'monthly_totals.month_expenses', (user_id, year_month))}
+    return {'month': year_month, 'limits': limits, 'spent': spent}
+
+
+def _get_budget_state(user_id):
+    """Returns the cached state for the current month, loading it if needed."""
+    current_month_str = date.today().strftime('%Y-%m')
+    if get_thread_reader() is not None:
+        # Reading from a replica (see replica.py): a snapshot may be behind,
+        # so it must not become the base the live changes are added to.
+        return _load_budget_state(user_id, current_month_str)
+    for _ in range(BUDGET_LOAD_ATTEMPTS):
+        with _budget_state_lock:
+            state = _budget_state.get(user_id)
+            if state is not None and state['month'] == current_month_str:
+                return state
+            version = _budget_versions.get(user_id, 0)
+        state = _load_budget_state(user_id, current_month_str)
+        with _budget_state_lock:
+            # Another thread recorded a change during the load: the delta
+            # was not applied to this state, so read it again.
+            if _budget_versions.get(user_id, 0) == version:
+                _budget_state[user_id] = state
+                return state
+    # The user is being written to continuously: use the fresh read uncached.
+    return state
+
+
+def record_spending_change(user_id, category, year_month, delta):
+    """
+    Adjusts the cached month-to-date spending after a committed change.
+
+    Changes to months other than the cached one are ignored, as are users
+    with nothing cached yet (their state is loaded fresh when needed; a
+    load already under way is discarded and done again).
+
+    Args:
+        user_id (int): The ID of the user.
+        category (str): The expense category that changed.
+        year_month (str): The month of the transaction, 'YYYY-MM'.
+        delta (Money): The amount added (negative when removed).
+    """
+    with _budget_state_lock:
+        _budget_versions[user_id] = _budget_versions.get(user_id, 0) + 1
+        state = _budget_state.get(user_id)
+        if state is not None and state['month'] == year_month:
+            state['spent'][category] = state['spent'].get(category, Money(0)) + delta
+
+
+def record_budget_limit(user_id, category, limit):
+    """Updates the cached limit after a committed budget change."""
+    with _budget_state_lock:
+        _budget_versions[user_id] = _budget_versions.get(user_id, 0) + 1
+        state = _budget_state.get(user_id)
+        if state is not None:
+            state['limits'][category] = limit
+
+
+def invalidate_budget_state(user_id=None):
+    """Drops the cached state for one user, or for everyone if user_id is None."""
+    with _budget_state_lock:
+        if user_id is None:
+            _budget_state.clear()
+            for key in _budget_versions:
+                _budget_versions[key] += 1
+        else:
+            _budget_state.pop(user_id, None)
+            _budget_versions[user_id] = _budget_versions.get(user_id, 0) + 1
+
+
+# Callables run with a user_id (or None for everyone) by invalidate_user_caches(),
+# for caches other than the budget one (see analytics.py).
+_invalidation_listeners = []
+
+
+def add_invalidation_listener(callback):
+    """Registers callback(user_id) to run from invalidate_user_caches()."""
+    _invalidation_listeners.append(callback)
+
+
+def invalidate_user_caches(user_id=None):
+    """
+    Drops every in-process cache of a user's data, or of everyone's if
+    user_id is None. For after the database was changed behind the
+    application's back, e.g. by a restore.
+    """
+    invalidate_budget_state(user_id)
+    for callback in _invalidation_listeners:
+        callback(user_id)
+
 
 def set_budget(user_id, category, limit):
     """
@@ -9,21 +127,20 @@ def set_budget(user_id, category, limit):
     Args:
         user_id (int): The ID of the user.
         category (str): The category to set the budget for (e.g., 'Food').
-        limit (float): The budget limit amount.
+        limit (Money or float): The budget limit amount; anything but Money
+                                is read as dollars.
     """
-    db = sqlite3.connect('finance.db')
+    limit = to_cents(limit)
+    db = get_connection(user_id)
     cursor = db.cursor()
 
     # 'INSERT OR REPLACE' is a handy SQLite command.
     # If a budget for this user/category exists, it updates it.
     # If not, it inserts a new one.
-    cursor.execute(
-        "INSERT OR REPLACE INTO budgets (user_id, category, limit_amount) VALUES (?, ?, ?)",
-        (user_id, category, limit)
-    )
+    queries.execute(cursor, 'budgets.upsert', (user_id, category, limit))
 
     db.commit()
-    db.close()
+    record_budget_limit(user_id, category, limit)
     print(f"✅ Budget for '{category}' set to ${limit:,.2f}.")
 
     # budget.py
@@ -32,44 +149,50 @@ from datetime import date # Make sure this import is at the top
 
 # ... (set_budget function is here) ...
 
-def check_spending_against_budget(user_id, category):
+@timed_operation('budget_check')
+def check_spending_against_budget(user_id, category, year_month=None):
     """
     Checks current monthly spending against the budget for a category.
 
     Args:
         user_id (int): The ID of the user.
         category (str): The category to check.
+        year_month (str): The month to check as 'YYYY-MM'. Defaults to the
+                          current month.
 
     Returns:
         tuple: A tuple containing (is_over_budget, amount_over) or (False, 0)
                if no budget is set or not over budget.
     """
-    db = sqlite3.connect('finance.db')
+    # The current month is answered from the in-process cache.
+    if year_month is None or year_month == date.today().strftime('%Y-%m'):
+        state = _get_budget_state(user_id)
+        limit_amount = state['limits'].get(category)
+        if limit_amount is None:
+            return (False, 0)
+        total_spent = state['spent'].get(category, Money(0))
+        if total_spent > limit_amount:
+            return (True, total_spent - limit_amount)
+        return (False, 0)
+
+    db = get_connection(user_id)
     cursor = db.cursor()
 
     # 1. Get the budget limit for the category
-    cursor.execute(
-        "SELECT limit_amount FROM budgets WHERE user_id = ? AND category = ?",
-        (user_id, category)
-    )
+    queries.execute(cursor, 'budgets.limit', (user_id, category))
     result = cursor.fetchone()
 
     # If no budget is set for this category, we can't check it.
     if result is None:
-        db.close()
         return (False, 0)
 
-    limit_amount = result[0]
+    limit_amount = Money(result[0])
 
-    # 2. Calculate total spending for the current month in that category
-    current_month_str = date.today().strftime('%Y-%m')
-    cursor.execute(
-        """SELECT SUM(amount) FROM transactions
-           WHERE user_id = ? AND category = ? AND type = 'expense' AND strftime('%Y-%m', date) = ?""",
-        (user_id, category, current_month_str)
-    )
-    total_spent = cursor.fetchone()[0] or 0
-    db.close()
+    # 2. Calculate total spending for that month in that category
+    # (read from the monthly_totals rollup, a single-row lookup)
+    queries.execute(cursor, 'monthly_totals.category_expense', (user_id, year_month, category))
+    row = cursor.fetchone()
+    total_spent = Money(row[0] if row else 0)
 
     # 3. Compare and return the result
     if total_spent > limit_amount:
@@ -80,6 +203,7 @@ def check_spending_against_budget(user_id, category):
     
 # budget.py
 
+@timed_operation('budget_view')
 def get_budgets_with_spending(user_id):
     """
     Retrieves all budgets for a user and calculates current spending for each.
@@ -87,38 +211,21 @@ def get_budgets_with_spending(user_id):
     Returns:
         list: A list of dictionaries, each containing budget details and spending.
     """
-    db = sqlite3.connect('finance.db')
+    db = get_connection(user_id)
     cursor = db.cursor()
     current_month_str = date.today().strftime('%Y-%m')
 
-    # This SQL query joins the budgets table with the transactions table.
-    # A LEFT JOIN ensures that all budgets are shown, even if there's no spending yet.
-    # COALESCE(SUM(t.amount), 0) turns NULL (no spending) into 0.
-    cursor.execute("""
-        SELECT 
-            b.category, 
-            b.limit_amount,
-            COALESCE(SUM(t.amount), 0) AS total_spent
-        FROM 
-            budgets b
-        LEFT JOIN 
-            transactions t ON b.category = t.category 
-            AND t.user_id = b.user_id 
-            AND t.type = 'expense' 
-            AND strftime('%Y-%m', t.date) = ?
-        WHERE 
-            b.user_id = ?
-        GROUP BY 
-            b.category
-    """, (current_month_str, user_id))
+    # This SQL query joins the budgets table with the monthly_totals rollup
+    # (see 'budgets.with_spending' in queries.py).
+    queries.execute(cursor, 'budgets.with_spending', (current_month_str, user_id))
 
     results = cursor.fetchall()
-    db.close()
 
     # Process the results into a more usable list of dictionaries
     budgets_overview = []
     for row in results:
         category, limit, spent = row
+        limit, spent = Money(limit), Money(spent)
         remaining = limit - spent
         budgets_overview.append({
             'category': category,
@@ -0,0 +1,410 @@
+# columnar.py
+## Compact columnar export and import of a user's transactions.
+##
+## One file per user ('.fcol'). Every column is a fixed-width little-endian
+## array, 8-byte aligned, so a file can be memory-mapped and read in place:
+##
+##   ids            int64    transaction IDs
+##   day_deltas     int32    days since the previous row (the first row: since base_day)
+##   amounts_cents  int64    amounts in integer cents
+##   category_codes uint32   index into the category dictionary
+##   types          uint8    0 = expense, 1 = income, | 0x80 when description is NULL
+##   category_offsets / category_blob        the dictionary, UTF-8
+##   description_offsets / description_blob  descriptions, UTF-8
+##
+## Rows are sorted by date, so the day deltas are small and never negative.
+##
+## Usage:
+##   python columnar.py export <user_id> <file> [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+##   python columnar.py import <file> [--user <user_id>]
+
+import argparse
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+from datetime import date, timedelta
+
+from budget import invalidate_budget_state
+from database import get_connection
+from instrumentation import timed_operation
+from money import Money
+
+MAGIC = b'FCOL'
+FORMAT_VERSION = 1
+EPOCH = date(1970, 1, 1)
+
+# magic, version, reserved, user_id, rows, base_day, category count
+_HEADER = struct.Struct('<4sHHqqiI')
+_SECTION = struct.Struct('<QQ')  # offset, length in bytes
+SECTIONS = [
+    # (name, array typecode)
+    ('ids', 'q'),
+    ('day_deltas', 'i'),
+    ('amounts_cents', 'q'),
+    ('category_codes', 'I'),
+    ('types', 'B'),
+    ('category_offsets', 'I'),
+    ('category_blob', 'B'),
+    ('description_offsets', 'I'),
+    ('description_blob', 'B'),
+]
+
+TYPE_CODES = {'expense': 0, 'income': 1}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+NULL_DESCRIPTION = 0x80
+TYPE_MASK = 0x7F
+
+IMPORT_BATCH_SIZE = 10_000
+
+
+class ColumnarFormatError(Exception):
+    """Raised when a file is not a columnar export this version can read."""
+
+
+def _little_endian(values):
+    """Returns the bytes of an array.array in little-endian order."""
+    if sys.byteorder == 'big' and values.itemsize > 1:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _pad(length):
+    return (-length) % 8
+
+
+# --- Export ---
+
+def _collect_columns(rows):
+    """Builds the column arrays from (id, date, type, category, amount, description) rows."""
+    columns = {name: array(typecode) for name, typecode in SECTIONS}
+    categories = {}
+    descriptions = bytearray()
+    columns['description_offsets'].append(0)
+    base_day = previous_day = None
+
+    for transaction_id, trans_date, trans_type, category, amount, description in rows:
+        day = (date.fromisoformat(trans_date) - EPOCH).days
+        if base_day is None:
+            base_day = previous_day = day
+        columns['ids'].append(transaction_id)
+        columns['day_deltas'].append(day - previous_day)
+        previous_day = day
+        columns['amounts_cents'].append(amount)
+        columns['category_codes'].append(categories.setdefault(category, len(categories)))
+        flags = TYPE_CODES[trans_type]
+        if description is None:
+            flags |= NULL_DESCRIPTION
+        else:
+            descriptions += description.encode()
+        columns['types'].append(flags)
+        columns['description_offsets'].append(len(descriptions))
+
+    columns['description_blob'].frombytes(bytes(descriptions))
+    blob = bytearray()
+    columns['category_offsets'].append(0)
+    for name in categories:  # dicts keep insertion order, which is the code order
+        blob += name.encode()
+        columns['category_offsets'].append(len(blob))
+    columns['category_blob'].frombytes(bytes(blob))
+    return columns, base_day or 0, len(categories)
+
+
+def write_columnar(path, user_id, rows):
+    """
+    Writes rows to a columnar file, under a temporary name renamed into place.
+
+    Args:
+        path (str): The file to write.
+        user_id (int): Recorded in the header.
+        rows (iterable): (id, date, type, category, amount, description)
+                         tuples, sorted by date, amounts in cents.
+
+    Returns:
+        int: The number of rows written.
+    """
+    columns, base_day, category_count = _collect_columns(rows)
+    row_count = len(columns['ids'])
+
+    payloads = [_little_endian(columns[name]) for name, _ in SECTIONS]
+    offset = _HEADER.size + _SECTION.size * len(SECTIONS)
+    offset += _pad(offset)
+    table = []
+    for payload in payloads:
+        table.append((offset, len(payload)))
+        offset += len(payload) + _pad(len(payload))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, user_id, row_count, base_day, category_count))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        f.write(b'\0' * _pad(f.tell()))
+        for payload in payloads:
+            f.write(payload)
+            f.write(b'\0' * _pad(len(payload)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return row_count
+
+
+@timed_operation('columnar_export')
+def export_user(user_id, path, start_date=None, end_date=None):
+    """
+    Exports a user's transactions, optionally only a date range.
+
+    Args:
+        user_id (int): The ID of the user.
+        path (str): The file to write.
+        start_date (str): First date to include, 'YYYY-MM-DD'.
+        end_date (str): Exclusive end date, 'YYYY-MM-DD'; for a whole year
+                        use ('2023-01-01', '2024-01-01').
+
+    Returns:
+        int: The number of transactions exported.
+    """
+    sql = """SELECT id, date, type, category, amount, description FROM all_transactions
+             WHERE user_id = ?"""
+    params = [user_id]
+    if start_date:
+        sql += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        sql += " AND date < ?"
+        params.append(end_date)
+    sql += " ORDER BY date, id"
+    cursor = get_connection(user_id).execute(sql, params)
+    return write_columnar(path, user_id, cursor)
+
+
+# --- Reading ---
+
+class ColumnarFile:
+    """
+    A memory-mapped columnar export.
+
+    The fixed-width columns are exposed as memoryviews over the mapping, so
+    nothing is copied until it is used. Close it (or use it as a context
+    manager) when done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ColumnarFormatError(f"'{path}' is empty")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        if len(self._map) < _HEADER.size:
+            raise ColumnarFormatError(f"'{self.path}' is too short")
+        (magic, version, _, self.user_id, self.rows,
+         self.base_day, self.category_count) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ColumnarFormatError(f"'{self.path}' is not a columnar export")
+        if version != FORMAT_VERSION:
+            raise ColumnarFormatError(f"'{self.path}' has unsupported version {version}")
+        if sys.byteorder != 'little':
+            raise ColumnarFormatError("columnar files can only be mapped on little-endian machines")
+
+        view = memoryview(self._map)
+        self._views = []
+        for index, (name, typecode) in enumerate(SECTIONS):
+            offset, length = _SECTION.unpack_from(self._map, _HEADER.size + index * _SECTION.size)
+            if offset + length > len(self._map):
+                raise ColumnarFormatError(f"'{self.path}' is truncated")
+            section = view[offset:offset + length].cast(typecode)
+            self._views.append(section)
+            setattr(self, name, section)
+        self.categories = [bytes(self.category_blob[start:end]).decode()
+                           for start, end in zip(self.category_offsets, self.category_offsets[1:])]
+
+    def close(self):
+        """
+        Releases the mapping. Arrays returned by to_arrays() keep using it,
+        in which case it is unmapped once they are gone.
+        """
+        try:
+            for section in getattr(self, '_views', []):
+                section.release()
+            self._map.close()
+        except BufferError:
+            pass
+        self._views = []
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.rows
+
+    def days(self):
+        """Yields each row's date as days since 1970-01-01 (the delta prefix sum)."""
+        day = self.base_day
+        for delta in self.day_deltas:
+            day += delta
+            yield day
+
+    def description(self, index):
+        """Returns row `index`'s description, or None."""
+        if self.types[index] & NULL_DESCRIPTION:
+            return None
+        start, end = self.description_offsets[index], self.description_offsets[index + 1]
+        return bytes(self.description_blob[start:end]).decode()
+
+    def iter_rows(self):
+        """Yields (id, date, type, category, amount, description) like the transactions table, amount as Money."""
+        for index, day in enumerate(self.days()):
+            flags = self.types[index]
+            yield (self.ids[index], (EPOCH + timedelta(days=day)).isoformat(),
+                   TYPE_NAMES[flags & TYPE_MASK], self.categories[self.category_codes[index]],
+                   Money(self.amounts_cents[index]), self.description(index))
+
+    def monthly_totals(self):
+        """
+        Sums the file the way the monthly_totals rollup does, without SQLite.
+
+        Returns:
+            list: (year_month, type, category, total, count) tuples, sorted.
+        """
+        totals = {}
+        month_of_day = {}
+        for index, day in enumerate(self.days()):
+            year_month = month_of_day.get(day)
+            if year_month is None:
+                year_month = month_of_day[day] = (EPOCH + timedelta(days=day)).isoformat()[:7]
+            key = (year_month, self.types[index] & TYPE_MASK, self.category_codes[index])
+            cents, count = totals.get(key, (0, 0))
+            totals[key] = (cents + self.amounts_cents[index], count + 1)
+        return sorted((year_month, TYPE_NAMES[type_code], self.categories[code], Money(cents), count)
+                      for (year_month, type_code, code), (cents, count) in totals.items())
+
+    def to_arrays(self):
+        """
+        Returns the file as analytics.TransactionArrays (needs NumPy), for
+        the analytics *_of_arrays() functions.
+
+        The IDs, amounts and category codes are read straight from the mapping.
+        """
+        import numpy as np
+        from analytics import TransactionArrays
+
+        days = np.cumsum(np.frombuffer(self.day_deltas, dtype='<i4').astype(np.int64)) + self.base_day
+        types = np.frombuffer(self.types, dtype=np.uint8)
+        return TransactionArrays(
+            ids=np.frombuffer(self.ids, dtype='<i8'),
+            days=days,
+            amounts=np.frombuffer(self.amounts_cents, dtype='<i8') / 100,
+            is_expense=(types & TYPE_MASK) == TYPE_CODES['expense'],
+            category_codes=np.frombuffer(self.category_codes, dtype='<u4').astype(np.int64),
+            categories=list(self.categories),
+        )
+
+
+# --- Import ---
+
+@timed_operation('columnar_import')
+def import_columnar(path, user_id=None):
+    """
+    Loads a columnar export back into the transactions table.
+
+    Everything goes in with executemany() in one transaction. Imported into
+    the user it was exported from, rows keep their original IDs (the import
+    fails without changes if any of them are taken, in the hot or the
+    archive table); imported into another user, they get new IDs.
+
+    Args:
+        path (str): The columnar file.
+        user_id (int): The user to import into. Defaults to the exporting user.
+
+    Returns:
+        dict: 'rows' imported, 'seconds' and 'rows_per_second'.
+    """
+    start = time.perf_counter()
+    with ColumnarFile(path) as source:
+        if user_id is None:
+            user_id = source.user_id
+        keep_ids = user_id == source.user_id
+        db = get_connection(user_id)
+        cursor = db.cursor()
+        rows = source.iter_rows()
+        imported = 0
+        try:
+            cursor.execute("BEGIN")
+            while True:
+                batch = []
+                for transaction_id, trans_date, trans_type, category, amount, description in rows:
+                    batch.append((transaction_id if keep_ids else None, user_id, trans_type,
+                                  category, amount, trans_date, description))
+                    if len(batch) == IMPORT_BATCH_SIZE:
+                        break
+                if not batch:
+                    break
+                cursor.executemany(
+                    """INSERT INTO transactions (id, user_id, type, category, amount, date, description)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    batch
+                )
+                imported += len(batch)
+            if keep_ids and cursor.execute(
+                    """SELECT EXISTS (SELECT 1 FROM transactions t
+                       JOIN transactions_archive a ON a.id = t.id WHERE t.user_id = ?)""",
+                    (user_id,)).fetchone()[0]:
+                raise sqlite3.IntegrityError("some of the transaction IDs are already archived")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            invalidate_budget_state(user_id)
+
+    elapsed = time.perf_counter() - start
+    rate = imported / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Imported {imported:,} transactions from '{path}' in {elapsed:.2f}s ({rate:,.0f} rows/sec).")
+    return {'rows': imported, 'seconds': elapsed, 'rows_per_second': rate}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar export and import of transactions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="write a user's transactions to a file")
+    export_parser.add_argument('user_id', type=int)
+    export_parser.add_argument('path')
+    export_parser.add_argument('--start', help='first date, YYYY-MM-DD')
+    export_parser.add_argument('--end', help='exclusive end date, YYYY-MM-DD')
+    import_parser = commands.add_parser('import', help='load a file back into the database')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--user', type=int, help='import into this user instead')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        rows = export_user(args.user_id, args.path, args.start, args.end)
+        print(f"✅ Exported {rows:,} transactions to {args.path} ({os.path.getsize(args.path):,} bytes).")
+    else:
+        try:
+            import_columnar(args.path, args.user)
+        except (ColumnarFormatError, OSError) as e:
+            print(f"❌ Import failed: {e}")
+        except sqlite3.IntegrityError as e:
+            print(f"❌ Import failed, nothing was imported: {e}. "
+                  "Were these transactions imported already? Use --user to import them as new rows.")
+
+
+if __name__ == '__main__':
+    main()
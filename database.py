@@ -1,18 +1,219 @@
 ## Create the Database and users Table
+import os
 import sqlite3
+import threading
+import instrumentation
+import queries
 
-def initialize_database():
+# The database file can be overridden with the FINANCE_DB environment
+# variable or at runtime with set_database_path().
+DEFAULT_DB_PATH = 'finance.db'
+_db_path = os.environ.get('FINANCE_DB', DEFAULT_DB_PATH)
+
+# Optional sharding. When the shard count (FINANCE_SHARDS, or
+# set_shard_count()) is above 0, each user's transactions, budgets and rollups
+# live in one of N shard files next to the main database, picked by
+# user_id % N, so users on different shards do not share a write lock. The
+# main database becomes the directory and keeps the users table. Every file
+# gets the full schema, so the same queries run against whichever file holds
+# the user. Changing the count needs the data to be split again; see sharding.py.
+_shard_count = int(os.environ.get('FINANCE_SHARDS') or 0)
+
+# PRAGMAs applied once, when a connection is first opened.
+# WAL lets readers keep going while a writer commits, NORMAL synchronous is
+# safe under WAL, cache_size is negative so it is read as KiB (~20 MB), and
+# mmap_size maps up to 256 MB of the file for reads.
+CONNECTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+}
+
+# Each thread gets its own connection per database file (sqlite3 connections
+# must not be shared between threads while in use). They are kept open and reused.
+_local = threading.local()
+_connections_lock = threading.Lock()
+_open_connections = []
+# Bumped by close_connections() so every thread drops its stale connection.
+_generation = 0
+
+
+def get_database_path():
+    """Returns the path of the database file currently in use."""
+    return _db_path
+
+
+def set_database_path(path):
     """
-    Initializes the database and creates the necessary tables
-    if they don't already exist.
+    Points the application at a different database file.
+
+    Every pooled connection is closed, so the next call to get_connection()
+    opens the new file.
+
+    Args:
+        path (str): The path to the SQLite database file.
     """
+    global _db_path
+    close_connections()
+    _db_path = path
 
-    # connect() will create 'finance.db' file if it doesn't exist
-    db = sqlite3.connect('finance.db')
 
-    # A cursor is used to execute SQL commands
-    cursor = db.cursor()
+def get_shard_count():
+    """Returns the number of shard files, 0 when sharding is off."""
+    return _shard_count
+
+
+def set_shard_count(count):
+    """
+    Turns sharding on with `count` shard files, or off with 0.
+
+    Every pooled connection is closed, like set_database_path().
+    """
+    global _shard_count
+    close_connections()
+    _shard_count = count
+
+
+def shard_path(index):
+    """Returns the file of shard `index`: 'finance.db' -> 'finance.shard<index>.db'."""
+    base, extension = os.path.splitext(_db_path)
+    return f"{base}.shard{index}{extension or '.db'}"
+
+
+def shard_for_user(user_id):
+    """Returns the shard index holding a user's data, or None when it is the main database."""
+    if not _shard_count or user_id is None:
+        return None
+    return user_id % _shard_count
+
+
+def database_paths():
+    """Returns the main database followed by every shard file."""
+    return [_db_path] + [shard_path(index) for index in range(_shard_count)]
+
+
+def _open_connection(path):
+    """Opens a new connection and applies CONNECTION_PRAGMAS to it."""
+    # check_same_thread=False only so close_connections() can close it from
+    # another thread; each connection is still used by a single thread.
+    # The statement cache holds every named query (see queries.py) plus room
+    # for the ones built at runtime, so none is prepared twice.
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                         factory=instrumentation.connection_factory(),
+                         cached_statements=queries.STATEMENT_CACHE_SIZE)
+    for name, value in CONNECTION_PRAGMAS.items():
+        db.execute(f"PRAGMA {name} = {value}")
+    return db
+
+
+def connection_for_path(path):
+    """Returns the calling thread's pooled connection to the database file `path`."""
+    if getattr(_local, 'generation', None) != _generation:
+        _local.connections = {}
+        _local.generation = _generation
+    db = _local.connections.get(path)
+    if db is not None:
+        return db
+
+    db = _open_connection(path)
+    with _connections_lock:
+        _open_connections.append(db)
+    _local.connections[path] = db
+    return db
+
+
+def get_connection(user_id=None):
+    """
+    Returns a reusable connection to the database for the calling thread.
+
+    The connection is opened on first use and kept open. Callers should
+    commit their own writes but must not close the connection.
+
+    Args:
+        user_id (int): Whose data the caller is about to touch. With
+                       sharding on, this picks the user's shard; without a
+                       user_id (or without sharding) it is the main database.
+
+    Returns:
+        sqlite3.Connection: The calling thread's connection.
+    """
+    return get_shard_connection(shard_for_user(user_id))
+
+
+def get_shard_connection(index):
+    """Returns the calling thread's connection to shard `index` (None for the main database)."""
+    path = _db_path if index is None else shard_path(index)
+    reader = getattr(_local, 'reader', None)
+    if reader is not None:
+        return reader(path)
+    return connection_for_path(path)
+
+
+def set_thread_reader(reader):
+    """
+    Routes the calling thread's get_connection() calls through reader(path).
+
+    Used by replica.reporting() to serve reads from a snapshot. Pass None
+    to go back to the live database.
+
+    Returns:
+        callable: The reader that was set before, or None.
+    """
+    previous = getattr(_local, 'reader', None)
+    _local.reader = reader
+    return previous
+
+
+def get_thread_reader():
+    """Returns the calling thread's reader set with set_thread_reader(), or None."""
+    return getattr(_local, 'reader', None)
+
+
+def close_connections():
+    """Closes every pooled connection, in all threads."""
+    global _generation
+    with _connections_lock:
+        connections = list(_open_connections)
+        _open_connections.clear()
+        _generation += 1
+    for db in connections:
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
 
+
+def month_bounds(year, month):
+    """
+    Returns the half-open date range covering one month.
+
+    Queries compare the 'date' column against these bounds
+    (date >= start AND date < end) instead of wrapping it in strftime(),
+    so SQLite can use the date indexes.
+
+    Args:
+        year (int): The year, e.g. 2025.
+        month (int): The month, 1-12.
+
+    Returns:
+        tuple: (start, end) as 'YYYY-MM-DD' strings.
+    """
+    start = f"{year:04d}-{month:02d}-01"
+    if month == 12:
+        end = f"{year + 1:04d}-01-01"
+    else:
+        end = f"{year:04d}-{month + 1:02d}-01"
+    return start, end
+
+
+# --- Schema migrations ---
+# Each migration is applied once, in order. The number of migrations already
+# applied is kept in the database's PRAGMA user_version, so adding a schema
+# change means appending a new function to MIGRATIONS (never editing an old one).
+
+def _create_base_tables(cursor):
+    """Migration 1: the users, transactions and budgets tables."""
     # Create the 'users' table.
     # 'IF NOT EXISTS' prevents an error if the table is already there.
     #  # 'IF NOT EXISTS' prevents an error if the table is already there.
@@ -40,8 +241,6 @@ def initialize_database():
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     ''')
-    
-    print("Database initialized and 'users' table is ready.")
 
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS budgets (
@@ -54,8 +253,426 @@ def initialize_database():
     )
 ''')
 
-    # Commit the changes and close the connection
-    db.commit()
-    db.close()
 
+def _add_transaction_indexes(cursor):
+    """Migration 2: a generated year-month column and the query indexes."""
+    # 'year_month' is computed from 'date' ('2025-03-14' -> '2025-03').
+    # It is VIRTUAL, so it takes no space in the table itself, only in the
+    # index built on it.
+    cursor.execute('''
+        ALTER TABLE transactions
+        ADD COLUMN year_month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL
+    ''')
+
+    # Budget checks: one user's expenses in one category over a date range.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_type_category_date
+        ON transactions (user_id, type, category, date)
+    ''')
+
+    # Transaction listings and reports: one user's rows over a date range.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+        ON transactions (user_id, date)
+    ''')
+
+    # Grouping a user's rows by month.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_year_month
+        ON transactions (user_id, year_month, type, category)
+    ''')
+
+
+# Rebuilds monthly_totals from the raw transactions (as of migration 3).
+_ROLLUP_REBUILD_SQL = '''
+    INSERT INTO monthly_totals (user_id, year_month, type, category, total, count)
+    SELECT user_id, year_month, type, category, SUM(amount), COUNT(*)
+    FROM transactions
+    GROUP BY user_id, year_month, type, category
+'''
+
+
+def _add_monthly_totals(cursor):
+    """Migration 3: the monthly_totals rollup and the triggers that maintain it."""
+    # One row per (user, month, type, category) holding the running total and
+    # the number of transactions behind it. Reports and budget checks read
+    # these rows instead of summing the raw transactions.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_totals (
+            user_id INTEGER NOT NULL,
+            year_month TEXT NOT NULL, -- 'YYYY-MM'
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year_month, type, category)
+        ) WITHOUT ROWID
+    ''')
+
+    # The triggers run inside the same transaction as the statement that
+    # fired them, so the rollup can never disagree with committed data.
+    # A row is removed once its last transaction is gone.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_insert
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO monthly_totals (user_id, year_month, type, category, total, count)
+            VALUES (NEW.user_id, NEW.year_month, NEW.type, NEW.category, NEW.amount, 1)
+            ON CONFLICT (user_id, year_month, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_delete
+        AFTER DELETE ON transactions
+        BEGIN
+            UPDATE monthly_totals
+            SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category;
+            DELETE FROM monthly_totals
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category AND count <= 0;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_rollup_update
+        AFTER UPDATE OF user_id, type, category, amount, date ON transactions
+        BEGIN
+            UPDATE monthly_totals
+            SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category;
+            DELETE FROM monthly_totals
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category AND count <= 0;
+            INSERT INTO monthly_totals (user_id, year_month, type, category, total, count)
+            VALUES (NEW.user_id, NEW.year_month, NEW.type, NEW.category, NEW.amount, 1)
+            ON CONFLICT (user_id, year_month, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    # Fill the rollup from the transactions that already exist.
+    cursor.execute("DELETE FROM monthly_totals")
+    cursor.execute(_ROLLUP_REBUILD_SQL)
+
+
+def _add_import_progress(cursor):
+    """Migration 4: bookkeeping that lets an interrupted bulk import resume."""
+    # rows_done is updated in the same transaction as each imported batch,
+    # so after a crash it always matches what was actually committed.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            source TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (source, user_id)
+        )
+    ''')
+
+
+# Rebuilds monthly_totals from the hot and archived transactions.
+_ROLLUP_REBUILD_ALL_SQL = '''
+    INSERT INTO monthly_totals (user_id, year_month, type, category, total, count)
+    SELECT user_id, year_month, type, category, SUM(amount), COUNT(*)
+    FROM all_transactions
+    GROUP BY user_id, year_month, type, category
+'''
+
+
+def _add_transactions_archive(cursor):
+    """Migration 5: the archive table for closed months, and a view over both tables."""
+    # Same columns as transactions. archive.py moves whole closed months here,
+    # so the hot table (and its indexes) only holds recent activity.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT,
+            year_month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_archive_user_date
+        ON transactions_archive (user_id, date)
+    ''')
+
+    # Archived rows count towards monthly_totals just like hot ones. Moving a
+    # row inserts it here (+1) and deletes it from transactions (-1), so the
+    # rollup ends up where it started. Archived rows are not updated.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_archive_rollup_insert
+        AFTER INSERT ON transactions_archive
+        BEGIN
+            INSERT INTO monthly_totals (user_id, year_month, type, category, total, count)
+            VALUES (NEW.user_id, NEW.year_month, NEW.type, NEW.category, NEW.amount, 1)
+            ON CONFLICT (user_id, year_month, type, category)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_transactions_archive_rollup_delete
+        AFTER DELETE ON transactions_archive
+        BEGIN
+            UPDATE monthly_totals
+            SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category;
+            DELETE FROM monthly_totals
+            WHERE user_id = OLD.user_id AND year_month = OLD.year_month
+              AND type = OLD.type AND category = OLD.category AND count <= 0;
+        END
+    ''')
+
+    # Full-history readers (exports, analytics) read this view.
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS all_transactions AS
+        SELECT id, user_id, type, category, amount, date, description, year_month
+        FROM transactions
+        UNION ALL
+        SELECT id, user_id, type, category, amount, date, description, year_month
+        FROM transactions_archive
+    ''')
+
+
+# Rows converted per UPDATE when amounts are moved to cents.
+CENTS_BATCH_SIZE = 50_000
+
+# (table, REAL column) pairs converted to integer cents by migration 6.
+_MONEY_COLUMNS = [
+    ('transactions', 'amount'),
+    ('transactions_archive', 'amount'),
+    ('budgets', 'limit_amount'),
+]
+
+
+def _convert_amounts_to_cents(cursor):
+    """Migration 6: amounts and budget limits as INTEGER cents instead of REAL dollars."""
+    # The triggers and the view read the columns being replaced, so they are
+    # dropped first and re-created from their saved SQL at the end.
+    saved = cursor.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view')"
+    ).fetchall()
+    for kind, name, _ in saved:
+        cursor.execute(f"DROP {kind.upper()} {name}")
+
+    for table, column in _MONEY_COLUMNS:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column}_cents INTEGER NOT NULL DEFAULT 0")
+        # Converted a rowid range at a time, so no single statement has to
+        # touch the whole table.
+        last = cursor.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+        for low in range(0, last + 1, CENTS_BATCH_SIZE):
+            cursor.execute(
+                f"""UPDATE {table} SET {column}_cents = CAST(round({column} * 100) AS INTEGER)
+                    WHERE rowid >= ? AND rowid < ?""",
+                (low, low + CENTS_BATCH_SIZE)
+            )
+        cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        cursor.execute(f"ALTER TABLE {table} RENAME COLUMN {column}_cents TO {column}")
+
+    # The rollup is derived data: recreate it with an INTEGER total.
+    cursor.execute("DROP TABLE monthly_totals")
+    cursor.execute('''
+        CREATE TABLE monthly_totals (
+            user_id INTEGER NOT NULL,
+            year_month TEXT NOT NULL, -- 'YYYY-MM'
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total INTEGER NOT NULL, -- cents
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year_month, type, category)
+        ) WITHOUT ROWID
+    ''')
+
+    for _, _, sql in saved:
+        cursor.execute(sql)
+    cursor.execute(_ROLLUP_REBUILD_ALL_SQL)
+
+
+def _add_monthly_totals_month_index(cursor):
+    """Migration 7: an index for reading one month of every user's rollup rows."""
+    # batch_reports.py reads a month for all users in one pass. Only the key
+    # columns are indexed, so the trigger updates of 'total' that come with
+    # every transaction write leave the index alone.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_monthly_totals_year_month
+        ON monthly_totals (year_month)
+    ''')
+
+
+def reseed_transaction_ids(cursor):
+    """
+    Makes the next transaction id start above every id in the file, archived ones included.
+
+    Inserting rows with explicit ids only moves the AUTOINCREMENT counter
+    up to the largest id inserted into transactions itself, so anything
+    that copies rows into a file (migration 8, sharding.split_database())
+    calls this afterwards.
+
+    Args:
+        cursor (sqlite3.Cursor): Cursor or connection on the file, inside
+                                 the caller's transaction.
+    """
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'transactions'")
+    cursor.execute('''
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'transactions', MAX(COALESCE((SELECT MAX(id) FROM transactions), 0),
+                                   COALESCE((SELECT MAX(id) FROM transactions_archive), 0))
+    ''')
+
+
+def _never_reuse_transaction_ids(cursor):
+    """Migration 8: transactions.id as AUTOINCREMENT, so ids of archived rows never come back."""
+    # A plain INTEGER PRIMARY KEY hands out max(id) + 1, which reuses the ids
+    # of rows archive.py moved to transactions_archive once the hot rows
+    # above them are gone. AUTOINCREMENT needs a table rebuild; the triggers,
+    # views and indexes are saved, dropped and re-created around it, as in
+    # migration 6.
+    saved = cursor.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view')"
+    ).fetchall()
+    indexes = [sql for (sql,) in cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions' AND sql IS NOT NULL"
+    )]
+    for kind, name, _ in saved:
+        cursor.execute(f"DROP {kind.upper()} {name}")
+
+    cursor.execute('''
+        CREATE TABLE transactions_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            type TEXT NOT NULL, -- 'income' or 'expense'
+            category TEXT NOT NULL,
+            date TEXT NOT NULL,
+            description TEXT,
+            year_month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL,
+            amount INTEGER NOT NULL DEFAULT 0, -- cents
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO transactions_new (id, user_id, type, category, date, description, amount)
+        SELECT id, user_id, type, category, date, description, amount FROM transactions
+    ''')
+    cursor.execute("DROP TABLE transactions")
+    cursor.execute("ALTER TABLE transactions_new RENAME TO transactions")
+
+    reseed_transaction_ids(cursor)
+
+    for sql in indexes:
+        cursor.execute(sql)
+    for _, _, sql in saved:
+        cursor.execute(sql)
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_transaction_indexes,
+    _add_monthly_totals,
+    _add_import_progress,
+    _add_transactions_archive,
+    _convert_amounts_to_cents,
+    _add_monthly_totals_month_index,
+    _never_reuse_transaction_ids,
+]
+
+
+def get_schema_version(db=None):
+    """Returns how many migrations have been applied to the database."""
+    db = db or get_connection()
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db=None):
+    """
+    Applies every migration the database has not seen yet.
+
+    Each migration runs in its own transaction together with the
+    user_version bump, so a failed migration leaves the database at the
+    previous version.
+
+    Args:
+        db (sqlite3.Connection): The connection to migrate. Defaults to the
+                                 calling thread's pooled connection.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    db = db or get_connection()
+    version = get_schema_version(db)
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = db.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    return len(MIGRATIONS)
+
+
+def rebuild_monthly_totals(db=None):
+    """
+    Recomputes the monthly_totals rollup from scratch, from both the hot
+    and the archived transactions.
+
+    The triggers keep the rollup current during normal use; this is for
+    after a restore or any other change made outside the application.
+
+    Args:
+        db (sqlite3.Connection): The connection to use. Defaults to the
+                                 calling thread's pooled connection.
+
+    Returns:
+        int: The number of rollup rows written.
+    """
+    db = db or get_connection()
+    cursor = db.cursor()
+    try:
+        cursor.execute("DELETE FROM monthly_totals")
+        cursor.execute(_ROLLUP_REBUILD_ALL_SQL)
+        rows = cursor.rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows
+
+
+def initialize_database():
+    """
+    Initializes the database and creates the necessary tables
+    if they don't already exist, then brings the schema up to date.
+    With sharding on, every shard file is migrated too. Every named query
+    is then checked against the schema (queries.validate_queries()).
+    """
+
+    # The connection manager will create the database file if it doesn't exist
+    for path in database_paths():
+        version = migrate(connection_for_path(path))
+        queries.validate_queries(path)
+
+    shards = f", {_shard_count} shards" if _shard_count else ""
+    print(f"Database initialized and 'users' table is ready (schema version {version}{shards}).")
+
+
+if __name__ == '__main__':
+    import sys
 
+    initialize_database()
+    if '--rebuild-totals' in sys.argv[1:]:
+        rows = sum(rebuild_monthly_totals(connection_for_path(path)) for path in database_paths())
+        print(f"Rebuilt monthly totals: {rows} rows.")
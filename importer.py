@@ -0,0 +1,264 @@
+# importer.py
+## Bulk loading of transactions from CSV and OFX bank exports.
+
+import csv
+import html
+import os
+import re
+import time
+from datetime import date, datetime
+from itertools import islice
+from database import get_connection
+from budget import check_spending_against_budget, invalidate_budget_state
+from instrumentation import timed_operation
+from money import to_cents
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CATEGORY = 'Uncategorized'
+
+
+def _normalize_record(record):
+    """
+    Turns one input record into the values stored in the transactions table.
+
+    A record is either a dict with 'date', 'amount' and optionally 'type',
+    'category' and 'description' keys, or a (type, category, amount, date,
+    description) tuple. When the type is missing it is taken from the sign
+    of the amount: negative amounts are expenses, the rest income.
+    Amounts are read as dollars (exactly, when given as strings).
+
+    Returns:
+        tuple: (type, category, amount, date, description), amount as Money.
+    """
+    if isinstance(record, dict):
+        trans_type = record.get('type')
+        category = record.get('category')
+        amount = record.get('amount')
+        trans_date = record.get('date')
+        description = record.get('description')
+    else:
+        trans_type, category, amount, trans_date, description = record
+
+    amount = to_cents(amount)
+    if trans_type:
+        trans_type = trans_type.strip().lower()
+        if trans_type not in ('income', 'expense'):
+            raise ValueError(f"unknown transaction type '{trans_type}'")
+    else:
+        trans_type = 'expense' if amount < 0 else 'income'
+    amount = abs(amount)
+
+    if isinstance(trans_date, (date, datetime)):
+        trans_date = trans_date.strftime('%Y-%m-%d')
+    else:
+        # Validates the date and drops any time part ('2025-03-14T09:30').
+        trans_date = date.fromisoformat(str(trans_date).strip()[:10]).isoformat()
+
+    return (trans_type, (category or '').strip() or DEFAULT_CATEGORY, amount,
+            trans_date, description or '')
+
+
+def _load_progress(cursor, source, user_id):
+    """Returns (rows_done, completed) for a previous import of `source`."""
+    cursor.execute(
+        "SELECT rows_done, completed FROM import_progress WHERE source = ? AND user_id = ?",
+        (source, user_id)
+    )
+    return cursor.fetchone() or (0, 0)
+
+
+def _save_progress(cursor, source, user_id, rows_done, completed=0):
+    cursor.execute(
+        """INSERT OR REPLACE INTO import_progress (source, user_id, rows_done, completed, updated_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        (source, user_id, rows_done, completed, datetime.now().isoformat(timespec='seconds'))
+    )
+
+
+@timed_operation('bulk_import')
+def import_transactions(user_id, records, source=None, batch_size=DEFAULT_BATCH_SIZE,
+                        check_budgets=True, restart=False):
+    """
+    Inserts many transactions for a user in batched transactions.
+
+    `records` is consumed lazily, so a generator over a large file is held in
+    memory one batch at a time. Each batch is written with executemany() and
+    committed once. Budget checks run after the import, once per expense
+    category and month that received rows, rather than once per row.
+
+    When `source` is given, the number of records committed so far is saved
+    with every batch. Calling this again with the same source after a failure
+    skips the records that were already imported; a finished source is not
+    imported twice unless `restart` is True.
+
+    Args:
+        user_id (int): The ID of the user the transactions belong to.
+        records (iterable): Dicts or (type, category, amount, date,
+                            description) tuples; see _normalize_record().
+        source (str): A key identifying the input, used for resuming.
+        batch_size (int): How many rows to insert per commit.
+        check_budgets (bool): Whether to check budgets once the rows are in.
+        restart (bool): Ignore saved progress and import from the beginning.
+
+    Returns:
+        dict: 'rows' imported, 'skipped' (already imported earlier),
+              'seconds', 'rows_per_second' and budget 'warnings'.
+    """
+    db = get_connection(user_id)
+    cursor = db.cursor()
+
+    skipped = 0
+    if source is not None and not restart:
+        skipped, completed = _load_progress(cursor, source, user_id)
+        if completed:
+            print(f"Nothing to do: '{source}' was already imported ({skipped:,} rows).")
+            return {'rows': 0, 'skipped': skipped, 'seconds': 0.0,
+                    'rows_per_second': 0.0, 'warnings': []}
+
+    records = islice(iter(records), skipped, None)
+    imported = 0
+    affected = set()  # (category, 'YYYY-MM') pairs that received expenses
+    start = time.perf_counter()
+
+    while True:
+        batch = []
+        for record in islice(records, batch_size):
+            try:
+                values = _normalize_record(record)
+            except (TypeError, ValueError) as e:
+                row_number = skipped + imported + len(batch) + 1
+                raise ValueError(f"record {row_number}: {e}") from e
+            trans_type, category, amount, trans_date, description = values
+            batch.append((user_id, trans_type, category, amount, trans_date, description))
+            if trans_type == 'expense':
+                affected.add((category, trans_date[:7]))
+        if not batch:
+            break
+
+        try:
+            cursor.executemany(
+                """INSERT INTO transactions (user_id, type, category, amount, date, description)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                batch
+            )
+            if source is not None:
+                _save_progress(cursor, source, user_id, skipped + imported + len(batch))
+            db.commit()
+        except Exception:
+            db.rollback()
+            invalidate_budget_state(user_id)
+            print(f"❌ Import stopped after {skipped + imported:,} rows. "
+                  "Run it again with the same source to resume.")
+            raise
+        imported += len(batch)
+
+    if source is not None:
+        _save_progress(cursor, source, user_id, skipped + imported, completed=1)
+        db.commit()
+
+    elapsed = time.perf_counter() - start
+    rate = imported / elapsed if elapsed > 0 else 0.0
+    # Reload the user's cached budget state rather than replaying every row.
+    invalidate_budget_state(user_id)
+
+    warnings = []
+    if check_budgets:
+        for category, year_month in sorted(affected):
+            is_over, amount_over = check_spending_against_budget(user_id, category, year_month)
+            if is_over:
+                warnings.append((category, year_month, amount_over))
+                print(f"⚠️  Warning: Budget for '{category}' exceeded by ${amount_over:,.2f} in {year_month}.")
+
+    print(f"✅ Imported {imported:,} transactions in {elapsed:.2f}s ({rate:,.0f} rows/sec).")
+    return {'rows': imported, 'skipped': skipped, 'seconds': elapsed,
+            'rows_per_second': rate, 'warnings': warnings}
+
+
+def _source_key(path):
+    """Identifies a file by path, size and modification time for resuming."""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# --- CSV ---
+
+def read_csv(path):
+    """
+    Yields transaction records from a CSV file, one row at a time.
+
+    The file needs a header row with 'date' and 'amount' columns; 'type',
+    'category' and 'description' are optional. Header names are matched
+    case-insensitively.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+
+def import_csv(user_id, path, **options):
+    """Imports a CSV file for a user. Options are passed to import_transactions()."""
+    return import_transactions(user_id, read_csv(path), source=_source_key(path), **options)
+
+
+# --- OFX ---
+
+# Matches '<TAG>text' and '</TAG>'. OFX 1.x (SGML) leaves leaf elements
+# unclosed, so the text of a leaf runs up to the next '<'.
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+
+def _iter_ofx_tags(f, chunk_size=65536):
+    """Yields (is_closing, TAG, text) from an OFX file, reading it in chunks."""
+    buffer = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        # Everything from the last '<' onwards may be an incomplete tag, so
+        # keep it for the next round. Text before the first tag is the OFX
+        # header, which is not needed.
+        cut = buffer.rfind('<')
+        if cut == -1:
+            buffer = ''
+            continue
+        complete, buffer = buffer[:cut], buffer[cut:]
+        for match in _OFX_TAG.finditer(complete):
+            yield match.group(1) == '/', match.group(2).upper(), html.unescape(match.group(3).strip())
+    for match in _OFX_TAG.finditer(buffer):
+        yield match.group(1) == '/', match.group(2).upper(), html.unescape(match.group(3).strip())
+
+
+def read_ofx(path, category=DEFAULT_CATEGORY):
+    """
+    Yields transaction records from an OFX/QFX statement, one <STMTTRN> at a time.
+
+    OFX has no categories, so every record gets `category`. The type comes
+    from the sign of TRNAMT and the description from NAME and MEMO.
+    """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        current = None
+        for is_closing, tag, text in _iter_ofx_tags(f):
+            if tag == 'STMTTRN':
+                if not is_closing:
+                    current = {}
+                elif current is not None:
+                    posted = current.get('DTPOSTED', '')
+                    description = ' - '.join(
+                        part for part in (current.get('NAME'), current.get('MEMO')) if part
+                    )
+                    yield {
+                        'date': f"{posted[0:4]}-{posted[4:6]}-{posted[6:8]}",
+                        'amount': current.get('TRNAMT'),
+                        'category': category,
+                        'description': description,
+                    }
+                    current = None
+            elif current is not None and not is_closing:
+                current[tag] = text
+
+
+def import_ofx(user_id, path, category=DEFAULT_CATEGORY, **options):
+    """Imports an OFX/QFX file for a user. Options are passed to import_transactions()."""
+    return import_transactions(user_id, read_ofx(path, category),
+                               source=_source_key(path), **options)
@@ -0,0 +1,351 @@
+# incremental_backup.py
+## Incremental backups built on a content-addressed chunk store.
+##
+## Every snapshot copies the live database with the SQLite backup API and cuts
+## the copy into page-aligned chunks. Each chunk is stored once, under the
+## SHA-256 of its contents, in backups/chunks/. A snapshot itself is just a
+## small JSON manifest listing its chunks, so only chunks that changed since
+## any earlier snapshot take new space. Manifests do not depend on each other:
+## any snapshot can be restored, or pruned, on its own.
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from backup import (BACKUP_DIR, BackupError, backup_shard, backup_target, backup_timestamp,
+                    create_backup, load_database_file, snapshot_database)
+from backup_catalog import (forget_backups, read_contents, record_backup, target_label,
+                            verify_against_catalog)
+from database import database_paths, get_database_path
+from instrumentation import timed_operation
+
+SNAPSHOT_DIR = os.path.join(BACKUP_DIR, 'snapshots')
+CHUNK_DIR = os.path.join(BACKUP_DIR, 'chunks')
+
+# Database pages per chunk. Chunks are page-aligned, so a changed page only
+# changes the one chunk it falls in. 16 pages of 4 KB make 64 KB chunks.
+CHUNK_PAGES = 16
+
+# How many snapshots to keep per period; see prune_snapshots().
+RETENTION_POLICY = {'hourly': 24, 'daily': 7, 'weekly': 4}
+
+# Held by a snapshot from its first chunk until its manifest is written, and
+# by pruning, so a prune never deletes a chunk a new manifest is about to list.
+_chunk_store_lock = threading.Lock()
+
+
+def _chunk_path(digest):
+    # Fan out into 256 subdirectories so no single directory gets huge.
+    return os.path.join(CHUNK_DIR, digest[:2], digest)
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _page_size(db_path):
+    """Reads the page size from the SQLite file header (offset 16, big-endian)."""
+    with open(db_path, 'rb') as f:
+        header = f.read(18)
+    size = int.from_bytes(header[16:18], 'big')
+    return 65536 if size == 1 else size
+
+
+def _catalog_name(name):
+    """A snapshot's name in the backup catalog, relative to BACKUP_DIR."""
+    return os.path.join(os.path.basename(SNAPSHOT_DIR), name)
+
+
+def list_snapshots():
+    """Returns the snapshot manifest names, oldest first."""
+    if not os.path.exists(SNAPSHOT_DIR):
+        return []
+    return sorted(f for f in os.listdir(SNAPSHOT_DIR) if f.endswith('.json'))
+
+
+def load_manifest(name):
+    """Reads a snapshot manifest by name."""
+    with open(os.path.join(SNAPSHOT_DIR, name)) as f:
+        return json.load(f)
+
+
+@timed_operation('incremental_backup')
+def create_incremental_backup(db_file=None, apply_retention=True):
+    """
+    Takes an incremental snapshot of the database.
+
+    Args:
+        db_file (str): The database to back up. Defaults to the database the
+                       application is configured to use.
+        apply_retention (bool): Prune old snapshots with RETENTION_POLICY afterwards.
+
+    Returns:
+        dict: 'manifest' name, 'chunks' total, 'new_chunks', 'bytes_written'
+              (compressed bytes of new chunks), 'size' of the database and
+              'seconds' taken. None if the backup failed.
+    """
+    if db_file is None:
+        db_file = get_database_path()
+    if not os.path.exists(db_file):
+        print(f"❌ Error: Database file '{db_file}' not found.")
+        return None
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    os.makedirs(CHUNK_DIR, exist_ok=True)
+
+    start = time.perf_counter()
+    created = datetime.now()
+    # Shard snapshots carry the same '_shard<n>' suffix as create_backup_set()'s files.
+    target = target_label(db_file)
+    suffix = '' if target == 'main' else f"_{target}"
+    name = f"snapshot_{backup_timestamp(created)}{suffix}.json"
+    snapshot_path = os.path.join(SNAPSHOT_DIR, name + '.db.tmp')
+    # As in create_backup(), an existing snapshot of this name is never replaced.
+    if os.path.exists(os.path.join(SNAPSHOT_DIR, name)):
+        print(f"❌ Error: A snapshot named '{name}' already exists.")
+        return None
+    try:
+        open(snapshot_path, 'x').close()
+    except FileExistsError:
+        print(f"❌ Error: A snapshot named '{name}' is already being written.")
+        return None
+
+    try:
+        snapshot_database(db_file, snapshot_path)
+        chunk_size = _page_size(snapshot_path) * CHUNK_PAGES
+        schema_version, users = read_contents(snapshot_path)
+
+        # Chunks are reused from earlier snapshots, so pruning must wait
+        # until this manifest lists them.
+        with _chunk_store_lock:
+            chunks = []
+            new_chunks = 0
+            bytes_written = 0
+            whole_file = hashlib.sha256()
+            with open(snapshot_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    whole_file.update(chunk)
+                    digest = hashlib.sha256(chunk).hexdigest()
+                    chunks.append(digest)
+                    path = _chunk_path(digest)
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        data = zlib.compress(chunk, 6)
+                        _write_atomic(path, data)
+                        new_chunks += 1
+                        bytes_written += len(data)
+
+            size = os.path.getsize(snapshot_path)
+            manifest = {
+                'created': created.isoformat(timespec='seconds'),
+                'source': os.path.abspath(db_file),
+                'size': size,
+                'chunk_size': chunk_size,
+                'sha256': whole_file.hexdigest(),
+                'schema_version': schema_version,
+                'chunks': chunks,
+            }
+            _write_atomic(os.path.join(SNAPSHOT_DIR, name), json.dumps(manifest).encode())
+        record_backup(_catalog_name(name), 'incremental', target, created,
+                      size, manifest['sha256'], schema_version, users)
+    except Exception as e:
+        print(f"❌ An error occurred while creating the incremental backup: {e}")
+        return None
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Incremental backup created: {name} "
+          f"({new_chunks} of {len(chunks)} chunks new, {bytes_written:,} bytes written, {elapsed:.2f}s)")
+
+    if apply_retention:
+        prune_snapshots()
+
+    return {'manifest': name, 'chunks': len(chunks), 'new_chunks': new_chunks,
+            'bytes_written': bytes_written, 'size': size, 'seconds': elapsed}
+
+
+def create_incremental_backup_set(apply_retention=True):
+    """
+    Takes an incremental snapshot of the main database and, with sharding
+    on, of every shard, like backup.create_backup_set() does for full backups.
+
+    Retention is applied once, after all of them; it keeps snapshots per shard.
+
+    Returns:
+        list: create_incremental_backup()'s result for each file (None for any that failed).
+    """
+    results = [create_incremental_backup(path, apply_retention=False) for path in database_paths()]
+    if apply_retention:
+        prune_snapshots()
+    return results
+
+
+def extract_snapshot(name, target_path):
+    """
+    Rebuilds the database file of a snapshot from its chunks into `target_path`.
+
+    Raises:
+        BackupError: If the manifest does not match its catalog entry, a
+                     chunk is missing or the rebuilt file does not match
+                     the manifest's checksum.
+    """
+    verify_against_catalog(_catalog_name(name), os.path.join(SNAPSHOT_DIR, name))
+    manifest = load_manifest(name)
+    whole_file = hashlib.sha256()
+    with open(target_path, 'wb') as out:
+        for digest in manifest['chunks']:
+            path = _chunk_path(digest)
+            if not os.path.exists(path):
+                raise BackupError(f"Snapshot '{name}' is missing chunk {digest}.")
+            with open(path, 'rb') as f:
+                chunk = zlib.decompress(f.read())
+            whole_file.update(chunk)
+            out.write(chunk)
+    if whole_file.hexdigest() != manifest['sha256']:
+        raise BackupError(f"Checksum mismatch for snapshot '{name}'.")
+
+
+def restore_snapshot(name, db_file=None):
+    """
+    Rebuilds the database file of a snapshot from its chunks and restores it.
+
+    Args:
+        name (str): The snapshot's manifest name.
+        db_file (str): The file to restore. Defaults to the one the snapshot
+                       was taken of: its shard, or the main database.
+
+    Raises:
+        BackupError: See extract_snapshot().
+    """
+    if db_file is None:
+        db_file = backup_target(name)
+
+    restore_tmp = db_file + '.restore.tmp'
+    try:
+        extract_snapshot(name, restore_tmp)
+        load_database_file(restore_tmp, db_file)
+    finally:
+        if os.path.exists(restore_tmp):
+            os.remove(restore_tmp)
+
+
+def _snapshot_time(name):
+    # 'snapshot_2024-06-01_12-00-00-250.json', or '..._shard<n>.json' for a
+    # shard. Snapshots taken before names had milliseconds stop at the seconds.
+    stamp = name[len('snapshot_'):].removesuffix('.json').split('_shard')[0]
+    if stamp.count('-') == 5:
+        return datetime.strptime(stamp, '%Y-%m-%d_%H-%M-%S-%f')
+    return datetime.strptime(stamp, '%Y-%m-%d_%H-%M-%S')
+
+
+def select_snapshots_to_keep(names, policy=None):
+    """
+    Applies a retention policy to snapshot names.
+
+    For each period in the policy ('hourly', 'daily', 'weekly') the newest
+    snapshot of each of the last N periods that have one is kept. The most
+    recent snapshot is always kept. The main database and each shard are
+    counted separately.
+
+    Returns:
+        set: The names to keep.
+    """
+    policy = RETENTION_POLICY if policy is None else policy
+    bucket_formats = {
+        'hourly': '%Y-%m-%d %H',
+        'daily': '%Y-%m-%d',
+        'weekly': '%G-W%V',
+    }
+    by_target = {}
+    for name in names:
+        by_target.setdefault(backup_shard(name), []).append(name)
+
+    keep = set()
+    for target_names in by_target.values():
+        newest_first = sorted(target_names, key=_snapshot_time, reverse=True)
+        keep.update(newest_first[:1])
+        for period, count in policy.items():
+            seen = set()
+            for name in newest_first:
+                if len(seen) >= count:
+                    break
+                bucket = _snapshot_time(name).strftime(bucket_formats[period])
+                if bucket not in seen:
+                    seen.add(bucket)
+                    keep.add(name)
+    return keep
+
+
+def prune_snapshots(policy=None):
+    """
+    Deletes snapshots outside the retention policy, then deletes every
+    chunk that no remaining snapshot refers to.
+
+    Returns:
+        tuple: (snapshots_deleted, chunks_deleted)
+    """
+    # Under the lock: a snapshot being written may reuse chunks no manifest lists yet.
+    with _chunk_store_lock:
+        names = list_snapshots()
+        keep = select_snapshots_to_keep(names, policy)
+        removed = [name for name in names if name not in keep]
+        for name in removed:
+            os.remove(os.path.join(SNAPSHOT_DIR, name))
+        forget_backups([_catalog_name(name) for name in removed])
+
+        chunks_removed = 0
+        if removed:
+            referenced = set()
+            for name in keep:
+                referenced.update(load_manifest(name)['chunks'])
+            for subdir in os.listdir(CHUNK_DIR):
+                for digest in os.listdir(os.path.join(CHUNK_DIR, subdir)):
+                    if digest not in referenced:
+                        os.remove(os.path.join(CHUNK_DIR, subdir, digest))
+                        chunks_removed += 1
+
+            print(f"Pruned {len(removed)} old snapshot(s) and {chunks_removed} unused chunk(s).")
+    return len(removed), chunks_removed
+
+
+def compare_with_full_backup(db_file=None):
+    """
+    Times a full backup against an incremental one of the same database.
+
+    Returns:
+        dict: 'full' and 'incremental' results, each with 'seconds' and
+              'bytes_written'.
+    """
+    start = time.perf_counter()
+    full_path = create_backup(db_file)
+    full_seconds = time.perf_counter() - start
+    incremental = create_incremental_backup(db_file)
+
+    result = {
+        'full': {'seconds': full_seconds,
+                 'bytes_written': os.path.getsize(full_path) if full_path else 0},
+        'incremental': {'seconds': incremental['seconds'] if incremental else 0,
+                        'bytes_written': incremental['bytes_written'] if incremental else 0},
+    }
+    print(f"Full backup:        {result['full']['seconds']:.2f}s, {result['full']['bytes_written']:,} bytes")
+    print(f"Incremental backup: {result['incremental']['seconds']:.2f}s, {result['incremental']['bytes_written']:,} bytes")
+    return result
+
+
+if __name__ == '__main__':
+    import sys
+
+    if '--compare' in sys.argv[1:]:
+        compare_with_full_backup()
+    elif '--prune' in sys.argv[1:]:
+        prune_snapshots()
+    else:
+        create_incremental_backup()
@@ -0,0 +1,267 @@
+# instrumentation.py
+## Optional timing and query profiling.
+##
+## Disabled by default. When disabled, connections are plain sqlite3
+## connections and the operation decorator costs a single flag check.
+## Enable it with enable() or by setting FINANCE_INSTRUMENT=1; set
+## FINANCE_SLOW_QUERY_MS (or pass slow_query_ms) to log slow statements
+## together with their EXPLAIN QUERY PLAN.
+
+import bisect
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+enabled = os.environ.get('FINANCE_INSTRUMENT') == '1'
+slow_query_ms = float(os.environ['FINANCE_SLOW_QUERY_MS']) if os.environ.get('FINANCE_SLOW_QUERY_MS') else None
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+HISTOGRAM_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# The progress handler fires every this many SQLite VM instructions. The count
+# is the closest thing to "rows scanned" that Python's sqlite3 exposes: a
+# full table scan runs many more instructions than an index lookup.
+VM_STEP_GRANULARITY = 100
+
+slow_query_log = logging.getLogger('finance.slow_query')
+
+_lock = threading.Lock()
+_queries = {}     # sql -> stats
+_operations = {}  # operation name -> stats
+_counters = {}    # name -> int
+slow_queries = deque(maxlen=100)
+
+
+def _new_stats():
+    return {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'histogram': [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)}
+
+
+def _record(table, key, elapsed_ms, **extra):
+    with _lock:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = _new_stats()
+            for name in extra:
+                stats[name] = 0
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        stats['histogram'][bisect.bisect_left(HISTOGRAM_BOUNDS_MS, elapsed_ms)] += 1
+        for name, value in extra.items():
+            stats[name] += value
+
+
+def count(name, amount=1):
+    """Adds to a named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+# --- Instrumented connections ---
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that records the latency, VM steps and rows returned per statement."""
+
+    _stats_key = None
+
+    def _timed(self, method, sql, params):
+        connection = self.connection
+        steps_before = connection.vm_steps
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._stats_key = sql
+            _record(_queries, sql, elapsed_ms,
+                    vm_steps=(connection.vm_steps - steps_before) * VM_STEP_GRANULARITY,
+                    rows_returned=0)
+            if slow_query_ms is not None and elapsed_ms >= slow_query_ms and method == self._execute:
+                _log_slow_query(connection, sql, params, elapsed_ms)
+
+    def _execute(self, sql, params):
+        return super().execute(sql, params)
+
+    def _executemany(self, sql, params):
+        return super().executemany(sql, params)
+
+    def execute(self, sql, params=()):
+        return self._timed(self._execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._timed(self._executemany, sql, params)
+
+    def _count_rows(self, rows):
+        if self._stats_key is not None and rows:
+            with _lock:
+                # reset() may have dropped the entry since the execute.
+                entry = _queries.get(self._stats_key)
+                if entry is not None:
+                    entry['rows_returned'] += rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count_rows(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count_rows(1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors are InstrumentedCursors and that counts VM steps."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vm_steps = 0
+        self.set_progress_handler(self._on_progress, VM_STEP_GRANULARITY)
+        count('connections_opened')
+
+    def _on_progress(self):
+        self.vm_steps += 1
+        return 0  # keep going
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+
+def _log_slow_query(connection, sql, params, elapsed_ms):
+    """Records a slow statement with its query plan."""
+    plan = None
+    if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'):
+        try:
+            # A plain cursor, so the EXPLAIN itself is not recorded.
+            rows = sqlite3.Cursor(connection).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan = [row[-1] for row in rows]
+        except sqlite3.Error:
+            pass
+    entry = {'sql': ' '.join(sql.split()), 'ms': elapsed_ms, 'plan': plan}
+    slow_queries.append(entry)
+    slow_query_log.warning("slow query (%.1f ms): %s | plan: %s", elapsed_ms, entry['sql'],
+                           '; '.join(plan) if plan else 'n/a')
+
+
+def connection_factory():
+    """The sqlite3 connection class to open new connections with."""
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+# --- Operations ---
+
+def timed_operation(name):
+    """
+    Decorator that records the latency of a high-level operation under `name`.
+
+    When instrumentation is disabled the wrapped function is called directly.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(_operations, name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+
+# --- Control and reporting ---
+
+def enable(slow_ms=None):
+    """
+    Turns instrumentation on. Pooled connections are reopened so they are
+    instrumented too.
+
+    Args:
+        slow_ms (float): Log statements slower than this many milliseconds.
+    """
+    global enabled, slow_query_ms
+    import database  # imported here: database uses this module when opening connections
+    enabled = True
+    if slow_ms is not None:
+        slow_query_ms = slow_ms
+    database.close_connections()
+
+
+def disable():
+    """Turns instrumentation off and goes back to plain connections."""
+    global enabled
+    import database
+    enabled = False
+    database.close_connections()
+
+
+def reset():
+    """Clears all recorded statistics."""
+    with _lock:
+        _queries.clear()
+        _operations.clear()
+        _counters.clear()
+        slow_queries.clear()
+
+
+def get_stats():
+    """
+    Returns a snapshot of everything recorded so far.
+
+    Returns:
+        dict: {'queries': {sql: stats}, 'operations': {name: stats},
+               'counters': {...}, 'slow_queries': [...],
+               'histogram_bounds_ms': HISTOGRAM_BOUNDS_MS}
+    """
+    with _lock:
+        return {
+            'queries': {sql: dict(stats, histogram=list(stats['histogram']))
+                        for sql, stats in _queries.items()},
+            'operations': {name: dict(stats, histogram=list(stats['histogram']))
+                           for name, stats in _operations.items()},
+            'counters': dict(_counters),
+            'slow_queries': list(slow_queries),
+            'histogram_bounds_ms': HISTOGRAM_BOUNDS_MS,
+        }
+
+
+def print_report(top=10):
+    """Prints operation latencies, counters and the `top` statements by total time."""
+    stats = get_stats()
+    print("\n--- Operations ---")
+    print(f"{'Operation':<24}{'Count':>8}{'Avg ms':>10}{'Max ms':>10}")
+    for name, s in sorted(stats['operations'].items()):
+        print(f"{name:<24}{s['count']:>8}{s['total_ms'] / s['count']:>10.3f}{s['max_ms']:>10.3f}")
+
+    print("\n--- Counters ---")
+    for name, value in sorted(stats['counters'].items()):
+        print(f"{name:<24}{value:>8}")
+
+    print(f"\n--- Top {top} Statements by Total Time ---")
+    print(f"{'Total ms':>10}{'Count':>8}{'Rows':>8}{'VM steps':>10}  SQL")
+    ranked = sorted(stats['queries'].items(), key=lambda item: item[1]['total_ms'], reverse=True)
+    for sql, s in ranked[:top]:
+        print(f"{s['total_ms']:>10.2f}{s['count']:>8}{s['rows_returned']:>8}{s['vm_steps']:>10}  "
+              f"{' '.join(sql.split())[:80]}")
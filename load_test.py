@@ -0,0 +1,144 @@
+# load_test.py
+## Local load-test driver for the asyncio service API.
+##
+## Simulates many concurrent user sessions against a scratch database. Each
+## session logs in and performs a random mix of actions; latencies are
+## reported per action together with overall throughput and the number of
+## group commits the writer needed.
+##
+## Usage: python load_test.py --sessions 2000 --actions 20 --users 200
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import date
+
+import auth
+import database
+from async_api import FinanceService
+from benchmark import BUDGET_CATEGORIES, PASSWORD, generate_dataset, percentile
+
+# (action, relative weight)
+ACTION_MIX = [
+    ('add_expense', 45),
+    ('view_page', 20),
+    ('monthly_summary', 15),
+    ('budgets', 10),
+    ('update', 5),
+    ('delete', 5),
+]
+
+
+async def run_session(service, rng, user_ids, actions, latencies):
+    """One simulated user: log in, then perform `actions` random actions."""
+    index = rng.randrange(len(user_ids))
+    start = time.perf_counter()
+    user_id = await service.login_user(f"bench_user_{index}", PASSWORD)
+    latencies['login'].append((time.perf_counter() - start) * 1000)
+
+    names = [name for name, _ in ACTION_MIX]
+    weights = [weight for _, weight in ACTION_MIX]
+    today = date.today()
+    my_ids = []
+
+    for _ in range(actions):
+        action = rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        if action == 'add_expense':
+            result = await service.add_transaction(user_id, 'expense', rng.choice(BUDGET_CATEGORIES),
+                                                   round(rng.uniform(1, 80), 2), 'load test')
+            my_ids.append(result['id'])
+        elif action == 'view_page':
+            await service.get_transactions_page(user_id)
+        elif action == 'monthly_summary':
+            await service.get_monthly_summary(user_id, today.year, today.month)
+        elif action == 'budgets':
+            await service.get_budgets_with_spending(user_id)
+        elif action == 'update' and my_ids:
+            await service.update_transaction(rng.choice(my_ids), user_id, 9.99,
+                                             rng.choice(BUDGET_CATEGORIES), 'updated')
+        elif action == 'delete' and my_ids:
+            await service.delete_transaction(my_ids.pop(), user_id)
+        else:
+            continue
+        latencies[action].append((time.perf_counter() - start) * 1000)
+
+
+async def run_load_test(sessions, actions, user_ids, readers, seed):
+    """Runs all sessions concurrently. Returns (latencies, seconds, service)."""
+    rng = random.Random(seed)
+    latencies = {name: [] for name, _ in ACTION_MIX}
+    latencies['login'] = []
+    async with FinanceService(readers=readers) as service:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_session(service, random.Random(rng.random()), user_ids, actions, latencies)
+            for _ in range(sessions)
+        ))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed, service
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate concurrent sessions against the async API.')
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--actions', type=int, default=20, help='actions per session')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=500, help='starting transactions per user')
+    parser.add_argument('--readers', type=int, default=4, help='reader threads')
+    parser.add_argument('--kdf-iterations', type=int, default=10_000,
+                        help='PBKDF2 iterations for the test accounts (kept low so setup is quick)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    auth.configure_kdf(algorithm='pbkdf2_sha256', pbkdf2_iterations=args.kdf_iterations)
+    with tempfile.TemporaryDirectory() as scratch:
+        database.set_database_path(os.path.join(scratch, 'load_test.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.initialize_database()
+            user_ids = generate_dataset(args.users, args.transactions, years=1, seed=args.seed)
+            latencies, elapsed, service = asyncio.run(
+                run_load_test(args.sessions, args.actions, user_ids, args.readers, args.seed))
+        database.close_connections()
+
+    operations = sum(len(values) for values in latencies.values())
+    summary = {
+        'sessions': args.sessions,
+        'operations': operations,
+        'seconds': elapsed,
+        'operations_per_second': operations / elapsed if elapsed > 0 else 0.0,
+        'write_batches': service.batches_committed,
+        'writes': service.writes_committed,
+        'actions': {},
+    }
+    for name, values in latencies.items():
+        values.sort()
+        if values:
+            summary['actions'][name] = {
+                'count': len(values),
+                'p50_ms': percentile(values, 50),
+                'p95_ms': percentile(values, 95),
+                'p99_ms': percentile(values, 99),
+            }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{args.sessions:,} sessions, {operations:,} operations in {elapsed:.2f}s "
+          f"({summary['operations_per_second']:,.0f} ops/sec)")
+    print(f"{service.writes_committed:,} writes in {service.batches_committed:,} group commits")
+    print(f"\n{'Action':<18}{'Count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in summary['actions'].items():
+        print(f"{name:<18}{s['count']:>8}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
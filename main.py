@@ -2,13 +2,21 @@
 
 from database import initialize_database
 from reports import get_monthly_summary # <-- Add this new import
+from reports import get_range_report, get_trend_report, get_year_to_date_report
 from auth import register_user, login_user
 from transactions import add_transaction # <-- Import this
 from transactions import add_transaction, view_transactions # <-- Add view_transactions
+from transactions import delete_transaction, update_transaction, get_transactions_page
 from budget import set_budget
 from budget import set_budget, get_budgets_with_spending
 from backup import create_backup
-from backup import create_backup, restore_from_backup
+from backup import create_backup, create_backup_set, restore_from_backup
+from incremental_backup import create_incremental_backup_set
+from backup_scheduler import start_from_environment
+import replica
+from replica import reporting
+from importer import import_csv, import_ofx
+from money import Money
 
 
 def handle_add_transaction(user_id, trans_type):
@@ -17,26 +25,67 @@ def handle_add_transaction(user_id, trans_type):
     """
     category = input(f"Enter {trans_type} category (e.g., Salary, Food, Rent): ")
     try:
-        amount = float(input(f"Enter amount: $"))
+        amount = Money.parse(input(f"Enter amount: $"))
     except ValueError:
         print("❌ Invalid amount. Please enter a number.")
         return
     description = input(f"Enter a brief description (optional): ")
     add_transaction(user_id, trans_type, category, amount, description)
 
+def handle_import_transactions(user_id):
+    """Handles the user input for importing transactions from a CSV or OFX file."""
+    path = input("Enter the path of the CSV or OFX file to import: ").strip()
+    try:
+        if path.lower().endswith(('.ofx', '.qfx')):
+            category = input("Enter a category for these transactions (default: Uncategorized): ").strip()
+            import_ofx(user_id, path, category=category or 'Uncategorized')
+        else:
+            import_csv(user_id, path)
+    except FileNotFoundError:
+        print(f"❌ Error: File '{path}' not found.")
+    except ValueError as e:
+        print(f"❌ Error: Invalid data in '{path}': {e}")
+
+def show_transactions_paged(user_id, title, show_description=False, include_archive=False):
+    """
+    Prints a user's transactions one page at a time, newest first.
+
+    After each page the user can press Enter for the next one or 'q' to stop.
+    Archived months are only listed with include_archive; the update and
+    delete pickers work on the open months.
+
+    Returns:
+        bool: False if the user has no transactions at all, otherwise True.
+    """
+    cursor = None
+    page = 1
+    while True:
+        transactions, cursor = get_transactions_page(user_id, cursor=cursor,
+                                                     include_archive=include_archive)
+        if not transactions and page == 1:
+            return False
+
+        if page == 1:
+            print(f"\n--- {title} ---")
+            header = f"{'ID':<5}{'Date':<12}{'Type':<10}{'Category':<15}{'Amount':>10}"
+            print(header + ("  Description" if show_description else ""))
+            print("-" * 65)
+        for t in transactions:
+            trans_id, date, trans_type, category, amount, desc = t
+            line = f"{trans_id:<5}{date:<12}{trans_type:<10}{category:<15}${amount:>9.2f}"
+            print(line + (f"  {desc}" if show_description else ""))
+
+        if cursor is None:
+            return True
+        if input(f"-- Page {page} -- Press Enter for more, or 'q' to stop: ").strip().lower() == 'q':
+            return True
+        page += 1
+
 def handle_delete_transaction(user_id):
     """Handles the user input for deleting a transaction."""
-    transactions = view_transactions(user_id)
-    if not transactions:
+    if not show_transactions_paged(user_id, "Select a Transaction to Delete"):
         print("\nNo transactions to delete.")
         return
-    
-    print("\n--- Select a Transaction to Delete ---")
-    print(f"{'ID':<5}{'Date':<12}{'Type':<10}{'Category':<15}{'Amount':>10}")
-    print("-" * 65)
-    for t in transactions:
-        trans_id, date, trans_type, category, amount, desc = t
-        print(f"{trans_id:<5}{date:<12}{trans_type:<10}{category:<15}${amount:>9.2f}")
 
     try:
         choice = int(input("\nEnter the ID of the transaction to delete (or 0 to cancel): "))
@@ -53,18 +102,10 @@ def handle_delete_transaction(user_id):
 
 def handle_update_transaction(user_id):
     """Handles the user input for updating a transaction."""
-    transactions = view_transactions(user_id)
-    if not transactions:
+    if not show_transactions_paged(user_id, "Select a Transaction to Update"):
         print("\nNo transactions to update.")
         return
 
-    print("\n--- Select a Transaction to Update ---")
-    print(f"{'ID':<5}{'Date':<12}{'Type':<10}{'Category':<15}{'Amount':>10}")
-    print("-" * 65)
-    for t in transactions:
-        trans_id, date, trans_type, category, amount, desc = t
-        print(f"{trans_id:<5}{date:<12}{trans_type:<10}{category:<15}${amount:>9.2f}")
-
     try:
         trans_id_to_update = int(input("\nEnter the ID of the transaction to update (or 0 to cancel): "))
         if trans_id_to_update == 0:
@@ -72,7 +113,7 @@ def handle_update_transaction(user_id):
 
         print("\nEnter the new details:")
         new_category = input("Enter new category: ")
-        new_amount = float(input("Enter new amount: $"))
+        new_amount = Money.parse(input("Enter new amount: $"))
         new_desc = input("Enter new description: ")
         
         if update_transaction(trans_id_to_update, user_id, new_amount, new_category, new_desc):
@@ -82,20 +123,8 @@ def handle_update_transaction(user_id):
     except ValueError:
         print("❌ Invalid input. Please enter numbers for ID and amount.")
 
-def handle_view_reports(user_id):
-    """Handles user input for viewing monthly financial reports."""
-    try:
-        year = int(input("Enter the year (e.g., 2025): "))
-        month = int(input("Enter the month (1-12): "))
-        if not 1 <= month <= 12:
-            print("❌ Invalid month. Please enter a number between 1 and 12.")
-            return
-    except ValueError:
-        print("❌ Invalid input. Please enter numbers for year and month.")
-        return
-
-    summary = get_monthly_summary(user_id, year, month)
-
+def print_monthly_summary(summary, year, month):
+    """Prints the report returned by get_monthly_summary()."""
     # --- Print Main Summary ---
     print(f"\n--- Monthly Summary for {year}-{month:02d} ---")
     print(f"Total Income:   ${summary['income']:>10,.2f}")
@@ -111,18 +140,92 @@ def handle_view_reports(user_id):
     else:
         print("\nNo expenses to break down for this month.")
 
+def print_range_report(report, title):
+    """Prints the columnar report returned by get_range_report()."""
+    print(f"\n--- {title} ({report['months'][0]} to {report['months'][-1]}) ---")
+    print(f"{'Month':<10}{'Income':>14}{'Expenses':>14}{'Savings':>14}")
+    print("-" * 52)
+    for year_month, income, expenses, savings in zip(
+            report['months'], report['income'], report['expenses'], report['savings']):
+        print(f"{year_month:<10}{income:>14,.2f}{expenses:>14,.2f}{savings:>14,.2f}")
+    print("-" * 52)
+    totals = report['totals']
+    print(f"{'Total':<10}{totals['income']:>14,.2f}{totals['expenses']:>14,.2f}{totals['savings']:>14,.2f}")
+
+    if totals['categories']:
+        print("\n--- Expense Breakdown by Category ---")
+        for category, amount in totals['categories']:
+            print(f"{category:<20} ${amount:>10,.2f}")
+    else:
+        print("\nNo expenses to break down for this period.")
+
+def _input_year_month(prompt):
+    """Asks for a year and month. Returns (year, month) or None on bad input."""
+    try:
+        year = int(input(f"Enter the {prompt}year (e.g., 2025): "))
+        month = int(input(f"Enter the {prompt}month (1-12): "))
+    except ValueError:
+        print("❌ Invalid input. Please enter numbers for year and month.")
+        return None
+    if not 1 <= month <= 12:
+        print("❌ Invalid month. Please enter a number between 1 and 12.")
+        return None
+    return year, month
+
+def _note_staleness(source):
+    """Warns when reports are served from a replica that is behind the live data."""
+    staleness = source.staleness() if source is not None else None
+    if staleness:
+        print(f"⚠️ Showing data from the reporting replica, {staleness:.0f}s behind recent changes.")
+
+def handle_view_reports(user_id):
+    """Handles user input for viewing monthly financial reports."""
+    with reporting() as source:
+        _note_staleness(source)
+        _view_reports(user_id)
+
+def _view_reports(user_id):
+    print("\n1. Single Month")
+    print("2. Last 12 Months")
+    print("3. Year to Date")
+    print("4. Custom Range")
+    choice = input("Please choose a report: ")
+
+    if choice == '1':
+        selected = _input_year_month("")
+        if selected:
+            year, month = selected
+            print_monthly_summary(get_monthly_summary(user_id, year, month), year, month)
+    elif choice == '2':
+        print_range_report(get_trend_report(user_id, 12), "12-Month Trend")
+    elif choice == '3':
+        print_range_report(get_year_to_date_report(user_id), "Year to Date")
+    elif choice == '4':
+        start = _input_year_month("start ")
+        end = start and _input_year_month("end ")
+        if not end:
+            return
+        if end < start:
+            print("❌ The end month must not be before the start month.")
+            return
+        print_range_report(get_range_report(user_id, *start, *end), "Custom Range")
+    else:
+        print("Invalid option.")
+
 def handle_set_budget(user_id):
     """Handles user input for setting a budget."""
     category = input("Enter the category to set a budget for (e.g., Food): ")
     try:
-        limit = float(input("Enter the budget limit amount: $"))
+        limit = Money.parse(input("Enter the budget limit amount: $"))
         set_budget(user_id, category, limit)
     except ValueError:
         print("❌ Invalid amount. Please enter a number.")
 
 def handle_view_budgets(user_id):
     """Handles the logic for viewing budget status."""
-    budgets = get_budgets_with_spending(user_id)
+    with reporting() as source:
+        _note_staleness(source)
+        budgets = get_budgets_with_spending(user_id)
 
     if not budgets:
         print("\nYou have not set any budgets yet.")
@@ -160,7 +263,8 @@ def logged_in_menu(user_id):
         print("6. View Financial Report") # <-- New option
         print("7. Set Budget")
         print("8. View Budget")
-        print("9. Logged Out")
+        print("9. Import Transactions (CSV/OFX)")
+        print("10. Logged Out")
 
         choice = input("Please choose an option: ")
 
@@ -169,17 +273,11 @@ def logged_in_menu(user_id):
         elif choice == '2':
             handle_add_transaction(user_id, 'expense')
         elif choice == '3':
-            # (This is your existing view logic)
-            transactions = view_transactions(user_id)
-            if not transactions:
-                print("\nNo transactions found.")
-            else:
-                print("\n--- Your Recent Transactions ---")
-                print(f"{'ID':<5}{'Date':<12}{'Type':<10}{'Category':<15}{'Amount':>10}  {'Description'}")
-                print("-" * 65)
-                for t in transactions:
-                    trans_id, date, trans_type, category, amount, desc = t
-                    print(f"{trans_id:<5}{date:<12}{trans_type:<10}{category:<15}${amount:>9.2f}  {desc}")
+            with reporting() as source:
+                _note_staleness(source)
+                if not show_transactions_paged(user_id, "Your Recent Transactions", show_description=True,
+                                               include_archive=True):
+                    print("\nNo transactions found.")
         elif choice == '4':
             handle_delete_transaction(user_id)
         elif choice == '5':
@@ -191,6 +289,8 @@ def logged_in_menu(user_id):
         elif choice == '8':
             handle_view_budgets(user_id)
         elif choice == '9':
+            handle_import_transactions(user_id)
+        elif choice == '10':
             print("You have been logged out.")
             break
         else:
@@ -205,13 +305,18 @@ def logged_in_menu(user_id):
 def main_menu():
     """Displays the main menu for login or registration."""
     initialize_database()
+    # Background backups, when FINANCE_BACKUP_INTERVAL is set.
+    scheduler = start_from_environment()
+    # Reports read from a refreshed copy, when FINANCE_REPLICA_INTERVAL is set.
+    reporting_replica = replica.start_from_environment()
     while True:
         print("\nWelcome to your Personal Finance Manager!")
         print("1. Register")
         print("2. Login")
         print("3. Create Backup")
-        print("4. Restore from Backup") # <-- New option
-        print("5. Exit")
+        print("4. Create Incremental Backup")
+        print("5. Restore from Backup") # <-- New option
+        print("6. Exit")
 
         choice = input("Please choose an option: ")
 
@@ -222,10 +327,16 @@ def main_menu():
             if user_id:
                 logged_in_menu(user_id)
         elif choice == '3':
-            create_backup()
+            create_backup_set()
         elif choice == '4':
-            restore_from_backup() # <-- Call the new handler
+            create_incremental_backup_set()
         elif choice == '5':
+            restore_from_backup() # <-- Call the new handler
+        elif choice == '6':
+            if scheduler is not None:
+                scheduler.stop()  # lets a backup in progress finish
+            if reporting_replica is not None:
+                reporting_replica.stop()
             print("Goodbye! 👋")
             break
         else:
@@ -0,0 +1,82 @@
+# money.py
+## Amounts of money as integer cents.
+##
+## The database stores every amount as an INTEGER number of cents, so sums
+## are exact. Money is an int subclass holding cents that formats itself in
+## dollars: f"{Money(123456):,.2f}" is '1,234.56'.
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+_CENT = Decimal('0.01')
+
+
+class Money(int):
+    """A number of cents. Adding or subtracting Money or ints gives Money."""
+
+    __slots__ = ()
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Reads an amount in dollars, e.g. '12.5', 12.5 or Decimal('12.50').
+
+        Strings and Decimals are converted exactly; floats are rounded to the
+        nearest cent (half away from zero) via their shortest repr.
+
+        Raises:
+            ValueError: If the value is not a number.
+        """
+        if isinstance(value, Money):
+            return value
+        try:
+            dollars = Decimal(value.strip().replace(',', '') if isinstance(value, str) else str(value))
+            cents = (dollars / _CENT).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"not an amount of money: {value!r}") from None
+        if not cents.is_finite():
+            raise ValueError(f"not an amount of money: {value!r}")
+        return cls(int(cents))
+
+    def dollars(self):
+        """The amount in dollars, as an exact Decimal."""
+        return Decimal(int(self)).scaleb(-2)
+
+    def __format__(self, spec):
+        return format(self.dollars(), spec or '.2f')
+
+    def __str__(self):
+        return format(self, '.2f')
+
+    def __repr__(self):
+        return f"Money({int(self)})"
+
+    def __add__(self, other):
+        if isinstance(other, int):
+            return Money(int(self) + other)
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, int):
+            return Money(int(self) - other)
+        return NotImplemented
+
+    def __rsub__(self, other):
+        if isinstance(other, int):
+            return Money(other - int(self))
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def __abs__(self):
+        return Money(abs(int(self)))
+
+
+def to_cents(amount):
+    """
+    Returns an amount as Money. Money passes through unchanged; anything
+    else (float, int, str, Decimal) is read as dollars.
+    """
+    return Money.parse(amount)
@@ -0,0 +1,228 @@
+# queries.py
+## Named SQL statements shared by auth.py, transactions.py, budget.py, reports.py
+## and batch_reports.py.
+##
+## Every fixed statement lives in QUERIES under a name and is run with
+## execute(db, name, params). Passing the same string each time lets
+## sqlite3's per-connection statement cache (sized from the registry, see
+## STATEMENT_CACHE_SIZE) prepare it once per connection and reuse it.
+## initialize_database() prepares the whole set against the schema with
+## validate_queries(), so a statement broken by a migration fails at
+## startup rather than on first use. With instrumentation on, their counts
+## and timings can be read per name (get_query_stats()), and
+## check_query_plans() runs EXPLAIN QUERY PLAN over all of them to catch
+## full table scans.
+##
+## Statements built at runtime (the filtered transaction pages, migrations)
+## stay with their callers.
+##
+## Usage: python queries.py  (prints each plan; exits with 1 on a full scan)
+
+import sqlite3
+import sys
+
+import instrumentation
+
+QUERIES = {
+    # --- auth.py, batch_reports.py ---
+    'users.insert':
+        "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+    'users.by_username':
+        "SELECT id, password_hash FROM users WHERE username = ?",
+    'users.set_password_hash':
+        "UPDATE users SET password_hash = ? WHERE id = ?",
+    'users.page':
+        "SELECT id, username FROM users WHERE id > ? ORDER BY id LIMIT ?",
+    'users.count':
+        "SELECT COUNT(*) FROM users",
+
+    # --- transactions.py ---
+    'transactions.insert':
+        """INSERT INTO transactions (user_id, type, category, amount, date, description)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+    'transactions.delete':
+        """DELETE FROM transactions WHERE id = ? AND user_id = ?
+           RETURNING type, category, amount, date""",
+    'transactions.get':
+        "SELECT type, category, amount, date FROM transactions WHERE id = ? AND user_id = ?",
+    'transactions.update':
+        """UPDATE transactions
+           SET amount = ?, category = ?, description = ?
+           WHERE id = ? AND user_id = ?""",
+
+    # --- budget.py ---
+    'budgets.upsert':
+        "INSERT OR REPLACE INTO budgets (user_id, category, limit_amount) VALUES (?, ?, ?)",
+    'budgets.limits':
+        "SELECT category, limit_amount FROM budgets WHERE user_id = ?",
+    'budgets.limit':
+        "SELECT limit_amount FROM budgets WHERE user_id = ? AND category = ?",
+    # A LEFT JOIN so budgets without any spending yet are listed with 0. The
+    # rollup has at most one row per category and month, so no GROUP BY.
+    'budgets.with_spending':
+        """SELECT b.category, b.limit_amount, COALESCE(m.total, 0) AS total_spent
+           FROM budgets b
+           LEFT JOIN monthly_totals m ON m.user_id = b.user_id
+               AND m.year_month = ?
+               AND m.type = 'expense'
+               AND m.category = b.category
+           WHERE b.user_id = ?
+           ORDER BY b.category""",
+
+    # --- monthly_totals rollup (budget.py, reports.py, batch_reports.py) ---
+    'monthly_totals.month_expenses':
+        """SELECT category, total FROM monthly_totals
+           WHERE user_id = ? AND year_month = ? AND type = 'expense'""",
+    'monthly_totals.category_expense':
+        """SELECT total FROM monthly_totals
+           WHERE user_id = ? AND year_month = ? AND type = 'expense' AND category = ?""",
+    'monthly_totals.month':
+        "SELECT type, category, total FROM monthly_totals WHERE user_id = ? AND year_month = ?",
+    'monthly_totals.range':
+        """SELECT year_month, type, category, total FROM monthly_totals
+           WHERE user_id = ? AND year_month >= ? AND year_month <= ?""",
+    'monthly_totals.month_all_users':
+        """SELECT user_id, type, category, total FROM monthly_totals
+           WHERE year_month = ? ORDER BY user_id""",
+}
+
+# Room in each connection's statement cache for statements built at runtime
+# (the paging variants, PRAGMAs, migrations), on top of the named ones.
+DYNAMIC_STATEMENT_SLOTS = 64
+STATEMENT_CACHE_SIZE = len(QUERIES) + DYNAMIC_STATEMENT_SLOTS
+
+# The registered names by SQL text, for reading the instrumentation's per-statement stats.
+_NAMES = {sql: name for name, sql in QUERIES.items()}
+
+
+def execute(db, name, params=()):
+    """
+    Runs the statement registered as `name`.
+
+    Timing is left to instrumentation.py, which records every statement run
+    on an instrumented connection; see get_query_stats().
+
+    Args:
+        db: A sqlite3 connection or cursor.
+        name (str): A key of QUERIES.
+        params (tuple): The statement's parameters.
+
+    Returns:
+        sqlite3.Cursor: The cursor the statement ran on, ready to fetch from.
+    """
+    return db.execute(QUERIES[name], params)
+
+
+def get_query_stats():
+    """
+    Returns the instrumentation's statistics of the registered statements, by name.
+
+    Empty unless instrumentation is enabled; instrumentation.reset() clears them.
+
+    Returns:
+        dict: name -> the statement's entry in instrumentation.get_stats()['queries'],
+              for statements run at least once.
+    """
+    return {_NAMES[sql]: stats for sql, stats in instrumentation.get_stats()['queries'].items()
+            if sql in _NAMES}
+
+
+def _explain_all(path, prefix):
+    """
+    Runs `prefix` + each registered statement. Returns name -> rows or sqlite3.Error.
+
+    A separate connection without a statement cache is used, so the EXPLAIN
+    statements neither take up room in the pooled connections' caches nor
+    get re-prepared there after a schema change.
+    """
+    if path is None:
+        import database  # imported here: database uses this module when opening connections
+        path = database.get_database_path()
+    db = sqlite3.connect(path, cached_statements=0)
+    results = {}
+    try:
+        for name, sql in QUERIES.items():
+            # Every placeholder is a plain '?', so the count gives the number
+            # of parameters; NULLs are enough to prepare and plan the statement.
+            try:
+                results[name] = db.execute(f"{prefix} {sql}", (None,) * sql.count('?')).fetchall()
+            except sqlite3.Error as e:
+                results[name] = e
+    finally:
+        db.close()
+    return results
+
+
+def validate_queries(path=None):
+    """
+    Prepares every registered statement against a database file's schema.
+
+    EXPLAIN compiles a statement without running it, so this catches
+    missing tables and columns without touching any data.
+
+    Args:
+        path (str): A migrated database file. Defaults to the main database.
+
+    Raises:
+        RuntimeError: Listing every statement that does not compile.
+    """
+    errors = [f"{name}: {result}" for name, result in _explain_all(path, 'EXPLAIN').items()
+              if isinstance(result, sqlite3.Error)]
+    if errors:
+        raise RuntimeError("invalid queries: " + '; '.join(errors))
+
+
+def explain_queries(path=None):
+    """
+    Returns the EXPLAIN QUERY PLAN of every registered statement.
+
+    Args:
+        path (str): The database file. Defaults to the main database.
+
+    Returns:
+        dict: name -> list of plan lines.
+
+    Raises:
+        sqlite3.Error: If a statement does not compile.
+    """
+    plans = {}
+    for name, result in _explain_all(path, 'EXPLAIN QUERY PLAN').items():
+        if isinstance(result, sqlite3.Error):
+            raise result
+        plans[name] = [row[-1] for row in result]
+    return plans
+
+
+def check_query_plans(path=None):
+    """
+    Finds registered statements that scan a whole table instead of using an index.
+
+    Returns:
+        dict: name -> the offending plan lines; empty when every statement
+              uses an index (or the primary key).
+    """
+    problems = {}
+    for name, plan in explain_queries(path).items():
+        scans = [line for line in plan if line.startswith('SCAN ') and ' USING ' not in line]
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+def main():
+    import database
+    database.initialize_database()
+    plans = explain_queries()
+    problems = check_query_plans()
+    for name, plan in plans.items():
+        print(f"{'❌' if name in problems else '✅'} {name}")
+        for line in plan:
+            print(f"      {line}")
+    if problems:
+        print(f"❌ {len(problems)} statement(s) scan a whole table.")
+        sys.exit(1)
+    print(f"✅ All {len(QUERIES)} statements use an index.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+# replica.py
+## A read-only reporting replica, refreshed in the background.
+##
+## Every `interval` seconds each database file (the main database and any
+## shards) that changed since its last copy is snapshotted with the SQLite
+## backup API into a new replica file next to it, e.g.
+## 'finance.replica-3.db'. Inside a `with reporting():` block, the calling
+## thread's get_connection() calls are served by read-only connections to
+## those files instead of the live database, so long reports and analytics
+## neither hold read transactions open on the live file (which keeps the
+## WAL from being checkpointed) nor compete with it for its page cache.
+## A block sees one replica generation from start to end, so a bulk report
+## is consistent even when a refresh lands half-way through it.
+##
+## staleness() reports how far behind the replica is: 0 while nothing has
+## been committed to the live file since the copy, otherwise the seconds
+## since the copy was taken.
+##
+## Start it from the application with FINANCE_REPLICA_INTERVAL=<seconds>.
+
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import instrumentation
+import queries
+from backup import snapshot_database
+from database import CONNECTION_PRAGMAS, database_paths, set_thread_reader
+
+DEFAULT_REFRESH_INTERVAL = 60
+
+log = logging.getLogger('finance.replica')
+
+
+def _replica_path(db_file, generation):
+    base, extension = os.path.splitext(db_file)
+    return f"{base}.replica-{generation}{extension or '.db'}"
+
+
+def _open_read_only(path):
+    """Opens a read-only connection to a replica file."""
+    db = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True,
+                         check_same_thread=False, factory=instrumentation.connection_factory(),
+                         cached_statements=queries.STATEMENT_CACHE_SIZE)
+    for name in ('cache_size', 'mmap_size'):
+        db.execute(f"PRAGMA {name} = {CONNECTION_PRAGMAS[name]}")
+    db.execute("PRAGMA query_only = 1")
+    return db
+
+
+class Replica:
+    """
+    Keeps a refreshed read-only copy of every database file.
+
+    Args:
+        interval (float): Seconds between refreshes.
+    """
+
+    def __init__(self, interval=DEFAULT_REFRESH_INTERVAL):
+        self.interval = interval
+        self.refreshes = 0
+        self._files = {}       # live path -> {'replica', 'as_of', 'data_version', 'seconds'}
+        self._watch = {}       # live path -> connection used to read data_version, under _lock
+        self._pins = {}        # replica path -> number of reporting blocks using it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()   # one refresh at a time
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Refreshing ---
+
+    def _data_version(self, path):
+        # The refresh thread and the UI thread (staleness()) both read it;
+        # the lock keeps stop() from closing a connection in use.
+        with self._lock:
+            db = self._watch.get(path)
+            if db is None:
+                db = self._watch[path] = sqlite3.connect(path, check_same_thread=False)
+            return db.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        """
+        Copies every database file that changed since its last copy.
+
+        Returns:
+            int: How many files were copied.
+        """
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self):
+        copied = 0
+        for path in database_paths():
+            if not os.path.exists(path):
+                continue
+            version = self._data_version(path)
+            with self._lock:
+                current = self._files.get(path)
+                if current is not None and current['data_version'] == version:
+                    continue
+                self._generation += 1
+                target = _replica_path(path, self._generation)
+
+            start = time.perf_counter()
+            as_of = time.time()
+            tmp_path = target + '.tmp'
+            try:
+                snapshot_database(path, tmp_path)
+                # The copy keeps the live file's WAL mode, whose readers need
+                # -wal and -shm files; a rollback journal lets them read it as is.
+                db = sqlite3.connect(tmp_path)
+                try:
+                    db.execute("PRAGMA journal_mode = DELETE")
+                finally:
+                    db.close()
+                os.replace(tmp_path, target)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with self._lock:
+                self._files[path] = {'replica': target, 'as_of': as_of, 'data_version': version,
+                                     'seconds': time.perf_counter() - start}
+            copied += 1
+        with self._lock:
+            self.refreshes += 1
+        self._remove_unused()
+        return copied
+
+    def _remove_unused(self):
+        """Deletes replica files that are neither current nor in use by a reporting block."""
+        with self._lock:
+            keep = {entry['replica'] for entry in self._files.values()}
+            keep.update(path for path, count in self._pins.items() if count)
+            live = list(self._files)
+        for path in live:
+            base, extension = os.path.splitext(path)
+            for old in glob.glob(f"{glob.escape(base)}.replica-*{extension or '.db'}*"):
+                if '.tmp' in old or old.removesuffix('-wal').removesuffix('-shm') in keep:
+                    continue
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass  # still open elsewhere (Windows); removed by a later refresh
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception("replica refresh failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Takes the first copy right away, then refreshes on a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='replica-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops refreshing and closes the connections used to watch for changes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            for db in self._watch.values():
+                db.close()
+            self._watch.clear()
+
+    # --- Status ---
+
+    def staleness(self, path=None):
+        """
+        Returns how many seconds the replica is behind the live database.
+
+        0 means nothing was committed since the copy was taken. With no
+        path, the largest value over all files. None before the first copy.
+        """
+        with self._lock:
+            files = dict(self._files)
+        if path is not None:
+            files = {path: files[path]} if path in files else {}
+        if not files:
+            return None
+        now = time.time()
+        return max(0.0 if self._data_version(live) == entry['data_version'] else now - entry['as_of']
+                   for live, entry in files.items())
+
+    def status(self):
+        """
+        Returns the state of every replicated file.
+
+        Returns:
+            dict: live path -> {'replica', 'as_of' (epoch seconds),
+                  'seconds' (how long the copy took), 'staleness'}.
+        """
+        with self._lock:
+            files = {path: dict(entry) for path, entry in self._files.items()}
+        for path, entry in files.items():
+            del entry['data_version']
+            entry['staleness'] = self.staleness(path)
+        return files
+
+    # --- Reading ---
+
+    def _connection(self, replicas, path):
+        """The calling thread's read-only connection for live `path` under a pinned generation."""
+        target = replicas.get(path)
+        if target is None:
+            raise RuntimeError(f"'{path}' has no replica yet")
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        db = connections.get(target)
+        if db is None:
+            db = connections[target] = _open_read_only(target)
+        return db
+
+    @contextmanager
+    def reading(self):
+        """Serves the calling thread's get_connection() calls from this replica."""
+        with self._lock:
+            replicas = {path: entry['replica'] for path, entry in self._files.items()}
+            for target in replicas.values():
+                self._pins[target] = self._pins.get(target, 0) + 1
+        previous = set_thread_reader(lambda path: self._connection(replicas, path))
+        try:
+            yield self
+        finally:
+            set_thread_reader(previous)
+            with self._lock:
+                for target in replicas.values():
+                    self._pins[target] -= 1
+                current = {entry['replica'] for entry in self._files.values()}
+            # Connections to generations that were replaced meanwhile are not needed again.
+            connections = getattr(self._local, 'connections', {})
+            for target in [target for target in connections if target not in current]:
+                connections.pop(target).close()
+
+
+_replica = None
+
+
+def get_replica():
+    """Returns the running replica, or None when reporting mode is not set up."""
+    return _replica
+
+
+def start_from_environment():
+    """
+    Starts the shared Replica when FINANCE_REPLICA_INTERVAL is set.
+
+    Returns:
+        Replica: The running replica, or None when not configured.
+    """
+    global _replica
+    interval = os.environ.get('FINANCE_REPLICA_INTERVAL')
+    if not interval:
+        return None
+    if _replica is None:
+        _replica = Replica(float(interval))
+    _replica.start()
+    return _replica
+
+
+@contextmanager
+def reporting(replica=None):
+    """
+    Reads inside the block come from the replica, when one is running.
+
+    Without a replica the block reads the live database as usual, so report
+    code can always be wrapped in it. With one, writes inside the block fail
+    with 'attempt to write a readonly database'.
+
+    Yields:
+        Replica: The replica in use, or None.
+    """
+    replica = replica or _replica
+    if replica is None:
+        yield None
+        return
+    with replica.reading():
+        yield replica
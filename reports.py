@@ -1,45 +1,54 @@
 # reports.py
 
-import sqlite3
+from datetime import date
+from database import get_connection
+import queries
+from instrumentation import timed_operation
+from money import Money
 
+@timed_operation('monthly_report')
 def get_monthly_summary(user_id, year, month):
     """
     Calculates total income, expenses, savings, and a breakdown
     of expenses by category for a specific month.
 
+    Everything is computed from a single read of the month's rows in the
+    monthly_totals rollup (one row per type and category).
+
     Returns:
-        dict: A dictionary containing all report data.
+        dict: A dictionary containing all report data, amounts as Money.
     """
-    db = sqlite3.connect('finance.db')
+    db = get_connection(user_id)
     cursor = db.cursor()
-    month_str = f"{year}-{month:02d}"
+    year_month = f"{year:04d}-{month:02d}"
 
-    # --- Totals (same as before) ---
-    cursor.execute(
-        "SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'income' AND strftime('%Y-%m', date) = ?",
-        (user_id, month_str)
-    )
-    total_income = cursor.fetchone()[0] or 0
+    queries.execute(cursor, 'monthly_totals.month', (user_id, year_month))
+    return summarize_month(cursor)
 
-    cursor.execute(
-        "SELECT SUM(amount) FROM transactions WHERE user_id = ? AND type = 'expense' AND strftime('%Y-%m', date) = ?",
-        (user_id, month_str)
-    )
-    total_expenses = cursor.fetchone()[0] or 0
-
-    # --- New: Expense Breakdown by Category ---
-    # The GROUP BY clause groups rows with the same category together,
-    # and SUM(amount) calculates the total for each group.
-    cursor.execute(
-        """SELECT category, SUM(amount) FROM transactions
-           WHERE user_id = ? AND type = 'expense' AND strftime('%Y-%m', date) = ?
-           GROUP BY category
-           ORDER BY SUM(amount) DESC""",
-        (user_id, month_str)
-    )
-    expense_breakdown = cursor.fetchall()
 
-    db.close()
+def summarize_month(rows):
+    """
+    Builds a get_monthly_summary() report from one user's rollup rows.
+
+    Args:
+        rows: (type, category, total) tuples for one month, totals in cents.
+
+    Returns:
+        dict: The same dictionary get_monthly_summary() returns.
+    """
+    # Totals are integer cents, so these sums are exact.
+    total_income = Money(0)
+    total_expenses = Money(0)
+    expense_breakdown = []
+    for trans_type, category, total in rows:
+        if trans_type == 'income':
+            total_income += total
+        else:
+            total_expenses += total
+            expense_breakdown.append((category, Money(total)))
+
+    # Largest spend first
+    expense_breakdown.sort(key=lambda item: item[1], reverse=True)
 
     savings = total_income - total_expenses
 
@@ -49,4 +58,95 @@ def get_monthly_summary(user_id, year, month):
         'expenses': total_expenses,
         'savings': savings,
         'expense_breakdown': expense_breakdown
-    }
\ No newline at end of file
+    }
+
+
+def _month_span(start_year, start_month, end_year, end_month):
+    """Returns every 'YYYY-MM' from the start month to the end month, inclusive."""
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+@timed_operation('range_report')
+def get_range_report(user_id, start_year, start_month, end_year, end_month):
+    """
+    Calculates income, expenses and savings for every month in a span.
+
+    All months are read with one range query over the monthly_totals
+    rollup, not one query per month. The result is columnar: every list
+    has one entry per month, lined up with 'months', and months without
+    any transactions are included as zeros. Amounts are Money.
+
+    Args:
+        user_id (int): The ID of the user.
+        start_year (int), start_month (int): The first month of the span.
+        end_year (int), end_month (int): The last month of the span (inclusive).
+
+    Returns:
+        dict: {
+            'months': ['YYYY-MM', ...],
+            'income': [...], 'expenses': [...], 'savings': [...],
+            'categories': {category: [expense per month, ...]},
+            'totals': {'income': ..., 'expenses': ..., 'savings': ...,
+                       'categories': [(category, total), ...] largest first},
+        }
+    """
+    months = _month_span(start_year, start_month, end_year, end_month)
+    index = {year_month: i for i, year_month in enumerate(months)}
+    income = [Money(0)] * len(months)
+    expenses = [Money(0)] * len(months)
+    categories = {}
+
+    if months:
+        db = get_connection(user_id)
+        cursor = db.cursor()
+        queries.execute(cursor, 'monthly_totals.range', (user_id, months[0], months[-1]))
+        for year_month, trans_type, category, total in cursor:
+            i = index[year_month]
+            if trans_type == 'income':
+                income[i] += total
+            else:
+                expenses[i] += total
+                if category not in categories:
+                    categories[category] = [Money(0)] * len(months)
+                categories[category][i] += total
+
+    savings = [inc - exp for inc, exp in zip(income, expenses)]
+    category_totals = sorted(
+        ((category, sum(values)) for category, values in categories.items()),
+        key=lambda item: item[1], reverse=True
+    )
+
+    return {
+        'months': months,
+        'income': income,
+        'expenses': expenses,
+        'savings': savings,
+        'categories': categories,
+        'totals': {
+            'income': sum(income),
+            'expenses': sum(expenses),
+            'savings': sum(savings),
+            'categories': category_totals,
+        },
+    }
+
+
+def get_trend_report(user_id, months=12, today=None):
+    """Returns get_range_report() for the last `months` months, ending with the current one."""
+    today = today or date.today()
+    # Count back (months - 1) months from the current one.
+    start = today.year * 12 + (today.month - 1) - (months - 1)
+    return get_range_report(user_id, start // 12, start % 12 + 1, today.year, today.month)
+
+
+def get_year_to_date_report(user_id, year=None, today=None):
+    """Returns get_range_report() from January up to the current month (or all of a past year)."""
+    today = today or date.today()
+    year = year or today.year
+    end_month = today.month if year == today.year else 12
+    return get_range_report(user_id, year, 1, year, end_month)
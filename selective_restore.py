@@ -0,0 +1,251 @@
+# selective_restore.py
+## Restores one user's data from a backup, leaving everyone else untouched.
+##
+## The backup is verified and unpacked into a temporary file, which is
+## attached read-only to a connection on the file holding the user (their
+## shard, with sharding on). Inside one write transaction the user's
+## current transactions, archived transactions and budgets are deleted and
+## the backup's copied back with INSERT ... SELECT, a batch at a time in
+## (date, id) order, so rows go straight from one file to the other without
+## passing through Python. The monthly_totals triggers keep the rollup
+## current as rows come and go. Other users keep writing to the other
+## shards meanwhile; on the same file they wait for the one commit.
+##
+## Usage: python selective_restore.py --user ID [--backup NAME | --before 'YYYY-MM-DD HH:MM:SS']
+
+import argparse
+import os
+import sqlite3
+import time
+from urllib.parse import quote
+
+from backup import BACKUP_DIR, BackupError, extract_backup
+from backup_catalog import backup_user_counts, backups_containing_user, get_backup, target_label
+from budget import invalidate_user_caches
+from database import get_database_path, migrate, shard_for_user, shard_path, connection_for_path
+from incremental_backup import extract_snapshot
+from instrumentation import timed_operation
+
+RESTORE_BATCH_SIZE = 5000
+
+_COLUMNS = 'user_id, type, category, amount, date, description'
+
+# Before migration 6 amounts were stored as REAL dollars.
+_CENTS_SCHEMA_VERSION = 6
+
+
+def find_backup(user_id, before=None):
+    """
+    Returns the catalog entry of the newest backup holding the user's data.
+
+    Args:
+        user_id (int): The user.
+        before (str): Only backups taken before 'YYYY-MM-DD HH:MM:SS'.
+
+    Returns:
+        dict: The catalog entry, or None if no backup has the user's data.
+    """
+    target = target_label(_user_database(user_id))
+    for entry in backups_containing_user(user_id, with_data=True):
+        if entry['target'] == target and (before is None or entry['created_at'] < before):
+            return entry
+    return None
+
+
+def _user_database(user_id):
+    index = shard_for_user(user_id)
+    return get_database_path() if index is None else shard_path(index)
+
+
+def _check_catalog(user_id, backup_path, db_file):
+    """
+    Refuses a cataloged backup of another database file, or one the catalog
+    says holds none of the user's rows. Uncataloged backups are checked
+    after unpacking, by _check_snapshot().
+
+    Raises:
+        BackupError: If the backup cannot hold the user's data.
+    """
+    name = os.path.relpath(backup_path, BACKUP_DIR)
+    entry = get_backup(name)
+    if entry is None:
+        return
+    target = target_label(db_file)
+    if entry['target'] != target:
+        raise BackupError(f"'{name}' is a backup of {entry['target']}, "
+                          f"but user {user_id}'s data is in {target}.")
+    counts = backup_user_counts(name, user_id)
+    if counts is not None and not any(counts):
+        raise BackupError(f"'{name}' holds no transactions or budgets of user {user_id}.")
+
+
+def _check_snapshot(db, user_id, tables, backup_path):
+    """Refuses an unpacked backup without any of the user's rows, before anything is deleted."""
+    for table in ('transactions', 'transactions_archive', 'budgets'):
+        if table in tables and db.execute(
+                f"SELECT 1 FROM snapshot.{table} WHERE user_id = ? LIMIT 1", (user_id,)).fetchone():
+            return
+    raise BackupError(f"'{backup_path}' holds no transactions or budgets of user {user_id}.")
+
+
+def _copy_rows(cursor, source, target, user_id, amount, batch_size, progress):
+    """
+    Copies the user's rows from snapshot.<source> into main.<target>, in
+    (date, id) batches. Returns (rows copied, rows that got a new id).
+
+    IDs are kept unless another user's row has taken them since the backup
+    (databases from before migration 8 handed out max(id) + 1, so a deleted
+    row's ID could come back). Those rows are inserted afterwards into the
+    hot table, which hands out IDs never used in either table; archived ones
+    among them move back to the archive on the next archive run.
+    """
+    taken = f"""(EXISTS (SELECT 1 FROM main.transactions t WHERE t.id = s.id AND t.user_id != s.user_id)
+                 OR EXISTS (SELECT 1 FROM main.transactions_archive a
+                            WHERE a.id = s.id AND a.user_id != s.user_id))"""
+    select = f"SELECT s.id, s.user_id, s.type, s.category, {amount}, s.date, s.description"
+    copied = 0
+    last = ('', 0)
+    while True:
+        # The key of the batch's last row; None when fewer than a batch remain.
+        end = cursor.execute(
+            f"""SELECT date, id FROM snapshot.{source}
+                WHERE user_id = ? AND (date, id) > (?, ?)
+                ORDER BY date, id LIMIT 1 OFFSET ?""",
+            (user_id, *last, batch_size - 1)
+        ).fetchone()
+        bounds = "AND (s.date, s.id) <= (?, ?)" if end else ""
+        cursor.execute(
+            f"""INSERT INTO main.{target} (id, {_COLUMNS})
+                {select} FROM snapshot.{source} s
+                WHERE s.user_id = ? AND (s.date, s.id) > (?, ?) {bounds} AND NOT {taken}""",
+            (user_id, *last) + (tuple(end) if end else ())
+        )
+        copied += cursor.rowcount
+        if progress:
+            progress(target, copied)
+        if end is None:
+            break
+        last = tuple(end)
+
+    # What is left are the rows whose IDs another user now has.
+    cursor.execute(
+        f"""INSERT INTO main.transactions ({_COLUMNS})
+            SELECT s.user_id, s.type, s.category, {amount}, s.date, s.description
+            FROM snapshot.{source} s
+            WHERE s.user_id = ? AND {taken}
+            ORDER BY s.date, s.id""",
+        (user_id,)
+    )
+    return copied + cursor.rowcount, cursor.rowcount
+
+
+@timed_operation('restore_user')
+def restore_user(user_id, backup_path=None, before=None, batch_size=RESTORE_BATCH_SIZE, progress=None):
+    """
+    Replaces one user's transactions and budgets with their copy in a backup.
+
+    Args:
+        user_id (int): The user to restore.
+        backup_path (str): A full backup file or 'snapshots/<name>.json'
+                           under BACKUP_DIR. Defaults to the newest backup
+                           in the catalog holding the user's data.
+        before (str): With no backup_path, use the newest backup taken
+                      before 'YYYY-MM-DD HH:MM:SS'.
+        batch_size (int): Rows copied per INSERT ... SELECT.
+        progress (callable): Called as progress(table, rows_so_far).
+
+    Returns:
+        dict: 'backup' used and the number of 'transactions', 'archived'
+              and 'budgets' rows restored, 'renumbered' (rows given new
+              IDs) and 'seconds' taken.
+
+    Raises:
+        BackupError: If there is no suitable backup, it fails verification,
+                     it is a backup of another database file (shard) or it
+                     holds none of the user's rows. Nothing is deleted then.
+    """
+    if backup_path is None:
+        entry = find_backup(user_id, before)
+        if entry is None:
+            raise BackupError(f"No backup holds data of user {user_id}.")
+        backup_path = os.path.join(BACKUP_DIR, entry['name'])
+
+    start = time.perf_counter()
+    db_file = _user_database(user_id)
+    _check_catalog(user_id, backup_path, db_file)
+    migrate(connection_for_path(db_file))
+    snapshot_tmp = db_file + f'.user{user_id}.restore.tmp'
+    db = None
+    try:
+        if backup_path.endswith('.json'):
+            extract_snapshot(os.path.basename(backup_path), snapshot_tmp)
+        else:
+            extract_backup(backup_path, snapshot_tmp)
+
+        # A connection of its own: URI names are needed to attach read-only,
+        # and the long transaction stays off the pooled connections.
+        db = sqlite3.connect(f"file:{quote(os.path.abspath(db_file))}", uri=True, timeout=30,
+                             isolation_level=None)
+        db.execute("ATTACH DATABASE ? AS snapshot",
+                   (f"file:{quote(os.path.abspath(snapshot_tmp))}?mode=ro",))
+        check = db.execute("PRAGMA snapshot.quick_check").fetchone()[0]
+        if check != 'ok':
+            raise BackupError(f"'{backup_path}' is corrupt: {check}")
+        version = db.execute("PRAGMA snapshot.user_version").fetchone()[0]
+        tables = {row[0] for row in db.execute("SELECT name FROM snapshot.sqlite_master WHERE type = 'table'")}
+        amount = 's.amount' if version >= _CENTS_SCHEMA_VERSION else 'CAST(round(s.amount * 100) AS INTEGER)'
+        limit = 'limit_amount' if version >= _CENTS_SCHEMA_VERSION else 'CAST(round(limit_amount * 100) AS INTEGER)'
+        _check_snapshot(db, user_id, tables, backup_path)
+
+        cursor = db.cursor()
+        result = {'backup': backup_path, 'transactions': 0, 'archived': 0, 'budgets': 0, 'renumbered': 0}
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ('transactions', 'transactions_archive', 'budgets'):
+                cursor.execute(f"DELETE FROM main.{table} WHERE user_id = ?", (user_id,))
+            for table, key in (('transactions', 'transactions'), ('transactions_archive', 'archived')):
+                if table in tables:
+                    result[key], renumbered = _copy_rows(cursor, table, table, user_id, amount,
+                                                         batch_size, progress)
+                    result['renumbered'] += renumbered
+            cursor.execute(
+                f"""INSERT INTO main.budgets (user_id, category, limit_amount)
+                    SELECT user_id, category, {limit} FROM snapshot.budgets WHERE user_id = ?""",
+                (user_id,)
+            )
+            result['budgets'] = cursor.rowcount
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        if db is not None:
+            db.close()
+        if os.path.exists(snapshot_tmp):
+            os.remove(snapshot_tmp)
+
+    # Drop this user's cached budget state and analytics arrays.
+    invalidate_user_caches(user_id)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Restore one user's data from a backup.")
+    parser.add_argument('--user', type=int, required=True)
+    parser.add_argument('--backup', help='backup file name under backups/ (default: the newest holding the user)')
+    parser.add_argument('--before', help="use the newest backup before 'YYYY-MM-DD HH:MM:SS'")
+    args = parser.parse_args()
+
+    backup_path = os.path.join(BACKUP_DIR, args.backup) if args.backup else None
+    try:
+        result = restore_user(args.user, backup_path, args.before)
+    except (BackupError, sqlite3.Error, OSError) as e:
+        print(f"❌ Restore failed: {e}")
+        return
+    print(f"✅ Restored user {args.user} from {result['backup']}: {result['transactions']:,} transactions, "
+          f"{result['archived']:,} archived, {result['budgets']} budgets in {result['seconds']:.2f}s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# sharding.py
+## Splits an existing single-file database into per-user shards.
+##
+## The users stay in the main database, which becomes the directory; each
+## user's transactions, budgets and import progress move to shard
+## user_id % N. Transaction and budget IDs are kept, and each shard's
+## monthly_totals rollup is rebuilt from the rows it received.
+##
+## Usage: python sharding.py --shards 4 [--keep-source-rows]
+## then run the application with FINANCE_SHARDS=4.
+
+import argparse
+import os
+
+import database
+from backup import create_backup
+
+# Per-user tables and the columns copied for each. 'year_month' is a
+# generated column and is left out; monthly_totals is rebuilt instead.
+SHARDED_TABLES = {
+    'transactions': 'id, user_id, type, category, amount, date, description',
+    'transactions_archive': 'id, user_id, type, category, amount, date, description',
+    'budgets': 'id, user_id, category, limit_amount',
+    'import_progress': 'source, user_id, rows_done, completed, updated_at',
+}
+
+
+def split_database(shard_count, keep_source_rows=False):
+    """
+    Moves every user's data from the main database into `shard_count` shards.
+
+    A backup of the main database is taken first. The shard files must not
+    exist yet. Sharding is switched on (set_shard_count()) once the split is done.
+
+    Args:
+        shard_count (int): How many shard files to create.
+        keep_source_rows (bool): Leave the moved rows in the main database
+                                 instead of deleting them and vacuuming.
+
+    Returns:
+        dict: Shard index -> number of transactions moved there.
+    """
+    if shard_count < 1:
+        raise ValueError("shard_count must be at least 1")
+    if database.get_shard_count():
+        raise ValueError("the database is already sharded")
+
+    source_path = database.get_database_path()
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+    # Shard paths depend only on the main database's path, not on the count.
+    existing = [database.shard_path(i) for i in range(shard_count)
+                if os.path.exists(database.shard_path(i))]
+    if existing:
+        raise FileExistsError(f"shard files already exist: {', '.join(existing)}")
+
+    if create_backup(source_path) is None:
+        raise RuntimeError("could not back up the database before splitting it")
+    source = database.get_connection()
+    database.migrate(source)
+
+    moved = {}
+    for index in range(shard_count):
+        shard = database.connection_for_path(database.shard_path(index))
+        database.migrate(shard)
+        shard.execute("ATTACH DATABASE ? AS source", (source_path,))
+        try:
+            shard.execute("BEGIN")
+            for table, columns in SHARDED_TABLES.items():
+                shard.execute(
+                    f"INSERT INTO main.{table} ({columns}) "
+                    f"SELECT {columns} FROM source.{table} WHERE user_id % ? = ?",
+                    (shard_count, index)
+                )
+            # The copy only moves the id counter up to the hot rows it received.
+            database.reseed_transaction_ids(shard)
+            shard.commit()
+        except Exception:
+            shard.rollback()
+            raise
+        finally:
+            shard.execute("DETACH DATABASE source")
+        database.rebuild_monthly_totals(shard)
+        moved[index] = shard.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    if not keep_source_rows:
+        try:
+            source.execute("BEGIN")
+            for table in list(SHARDED_TABLES) + ['monthly_totals']:
+                source.execute(f"DELETE FROM {table}")
+            source.commit()
+        except Exception:
+            source.rollback()
+            raise
+        source.execute("VACUUM")
+
+    database.set_shard_count(shard_count)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split finance.db into per-user shard files.')
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('--keep-source-rows', action='store_true',
+                        help='leave the moved rows in the main database')
+    args = parser.parse_args()
+
+    try:
+        moved = split_database(args.shards, args.keep_source_rows)
+    except (ValueError, OSError, RuntimeError) as e:
+        print(f"❌ Split failed: {e}")
+        return
+
+    for index, rows in moved.items():
+        print(f"Shard {index}: {rows:,} transactions -> {database.shard_path(index)}")
+    print(f"✅ Split into {args.shards} shards. Run with FINANCE_SHARDS={args.shards} from now on.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# conftest.py
+## Every test gets a freshly migrated database in its own temporary directory.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from budget import invalidate_budget_state
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Points the application at a new, migrated database and returns its path."""
+    path = str(tmp_path / 'finance.db')
+    database.set_shard_count(0)
+    database.set_database_path(path)
+    database.initialize_database()
+    invalidate_budget_state()
+    yield path
+    database.close_connections()
+    database.set_shard_count(0)
+    invalidate_budget_state()
+
+
+@pytest.fixture
+def user_id(db_path):
+    """A registered user in the test database."""
+    cursor = database.get_connection().cursor()
+    cursor.execute("INSERT INTO users (username, password_hash) VALUES ('alice', 'x')")
+    database.get_connection().commit()
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def backup_dir(tmp_path, monkeypatch):
+    """Runs the test from tmp_path, so backups/ and its catalog are created there."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'backups'
@@ -0,0 +1,18 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import analytics
+from transactions import add_transaction
+
+
+def test_find_anomalies_with_income_only_category_sorting_last(user_id):
+    # 'Salary' only ever has income and sorts after every expense category.
+    for amount in (20, 22, 21, 19, 23, 20, 400):
+        add_transaction(user_id, 'expense', 'Food', amount, '')
+    add_transaction(user_id, 'income', 'Salary', 3000, '')
+
+    anomalies = analytics.find_anomalies(user_id)
+
+    assert [a['amount'] for a in anomalies] == [400.0]
+    assert anomalies[0]['category'] == 'Food'
@@ -0,0 +1,30 @@
+from datetime import date, timedelta
+
+from archive import archive_closed_months
+from database import get_connection
+from transactions import add_transaction, delete_transaction
+
+
+def _all_ids(user_id):
+    return [row[0] for row in get_connection(user_id).execute(
+        "SELECT id FROM all_transactions WHERE user_id = ?", (user_id,))]
+
+
+def test_ids_are_not_reused_after_archiving_and_deleting(user_id):
+    for amount in (10, 20, 30):
+        add_transaction(user_id, 'expense', 'Food', amount, '')
+    # Months from now, every row so far is in a closed month.
+    result = archive_closed_months(keep_months=0, today=date.today() + timedelta(days=62))
+    assert result['rows'] == 3
+    archived = set(_all_ids(user_id))
+
+    add_transaction(user_id, 'expense', 'Food', 40, '')
+    (new_id,) = set(_all_ids(user_id)) - archived
+    assert new_id > max(archived)
+
+    # With the hot table empty again, the next id still must not come back.
+    delete_transaction(new_id, user_id)
+    add_transaction(user_id, 'expense', 'Food', 50, '')
+    ids = _all_ids(user_id)
+    assert len(ids) == len(set(ids)) == 4
+    assert max(ids) > new_id
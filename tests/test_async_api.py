@@ -0,0 +1,43 @@
+# test_async_api.py
+
+import asyncio
+import time
+
+from async_api import FinanceService
+
+
+def test_close_does_not_block_the_event_loop(user_id):
+    async def scenario():
+        service = FinanceService(readers=1)
+        await service.add_transaction(user_id, 'expense', 'Food', 12.5, 'Lunch')
+        # A read still running when close() is called keeps shutdown() waiting.
+        slow_read = asyncio.ensure_future(service._read(time.sleep, 0.3))
+        await asyncio.sleep(0)
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while not slow_read.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(service.close(), tick())
+        return ticks, service.writes_committed
+
+    ticks, writes = asyncio.run(scenario())
+    assert writes == 1
+    assert ticks > 5
+
+
+def test_register_and_login_through_the_hashing_pool(db_path):
+    async def scenario():
+        async with FinanceService() as service:
+            created = await service.register_user('bob', 'secret')
+            taken = await service.register_user('bob', 'other')
+            user_id = await service.login_user('bob', 'secret')
+            return created, taken, user_id
+
+    created, taken, user_id = asyncio.run(scenario())
+    assert created is True and taken is False
+    assert isinstance(user_id, int)
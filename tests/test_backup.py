@@ -0,0 +1,22 @@
+import os
+
+import backup_catalog
+from backup import create_backup
+
+
+def test_backups_in_the_same_second_keep_their_own_files(db_path, backup_dir):
+    first = create_backup()
+    second = create_backup()
+
+    assert first and second and first != second
+    assert os.path.exists(first) and os.path.exists(second)
+    assert len(backup_catalog.list_cataloged_backups()) == 2
+
+
+def test_an_existing_backup_is_not_overwritten(db_path, backup_dir):
+    path = create_backup(name='nightly')
+    before = os.path.getmtime(path), os.path.getsize(path)
+
+    assert create_backup(name='nightly') is None
+    assert (os.path.getmtime(path), os.path.getsize(path)) == before
+    assert len(backup_catalog.list_cataloged_backups()) == 1
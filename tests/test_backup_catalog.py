@@ -0,0 +1,31 @@
+import os
+
+import backup_catalog
+import database
+from backup import create_backup_set
+from incremental_backup import create_incremental_backup, select_snapshots_to_keep
+
+
+def test_rebuild_takes_the_target_from_the_shard_suffix(db_path, backup_dir):
+    database.set_shard_count(2)
+    database.initialize_database()
+    create_backup_set()
+    for path in database.database_paths():
+        create_incremental_backup(path, apply_retention=False)
+    expected = {entry['name']: entry['target'] for entry in backup_catalog.list_cataloged_backups()}
+    assert sorted(expected.values()) == ['main', 'main', 'shard0', 'shard0', 'shard1', 'shard1']
+
+    os.remove(backup_catalog.CATALOG_PATH)
+
+    rebuilt = {entry['name']: entry['target'] for entry in backup_catalog.list_cataloged_backups()}
+    assert rebuilt == expected
+
+
+def test_retention_keeps_the_newest_snapshot_of_every_file():
+    names = ['snapshot_2024-06-01_10-00-00_shard1.json',
+             'snapshot_2024-06-01_10-30-00_shard1.json',
+             'snapshot_2024-06-01_11-00-00.json']
+
+    keep = select_snapshots_to_keep(names, {'hourly': 1})
+
+    assert keep == {'snapshot_2024-06-01_10-30-00_shard1.json', 'snapshot_2024-06-01_11-00-00.json'}
@@ -0,0 +1,22 @@
+import database
+from backup import backup_shard
+from backup_scheduler import BackupScheduler
+from transactions import add_transaction
+
+
+def test_only_changed_files_are_backed_up(user_id, backup_dir):
+    database.set_shard_count(2)
+    database.initialize_database()
+    scheduler = BackupScheduler(max_read_bytes_per_sec=0)
+    try:
+        first = scheduler.run_once()
+        assert len(first['backups']) == 3 and not first['errors']
+
+        assert scheduler.run_once()['skipped']
+
+        add_transaction(user_id, 'expense', 'Food', 10, '')
+        third = scheduler.run_once()
+        assert [backup_shard(path) for path in third['backups']] == [user_id % 2]
+    finally:
+        scheduler.stop()
+    assert scheduler.skipped_runs == 1
@@ -0,0 +1,31 @@
+import os
+from datetime import date
+
+import database
+from batch_reports import generate_statements
+from transactions import add_transaction
+
+
+def test_statements_merge_users_from_every_shard(db_path, tmp_path):
+    database.set_shard_count(2)
+    database.initialize_database()
+    db = database.get_connection()
+    users = [db.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (name,)).lastrowid
+             for name in ('alice', 'bob', 'carol', 'dave')]
+    db.commit()
+    # dave has no transactions and still gets a statement.
+    for user_id, amount in zip(users[:3], (10, 20, 30)):
+        add_transaction(user_id, 'income', 'Salary', amount * 100, '')
+        add_transaction(user_id, 'expense', 'Food', amount, '')
+    month = date.today().strftime('%Y-%m')
+
+    stats = generate_statements([month], str(tmp_path / 'statements'), workers=2, chunk_size=1)
+
+    assert stats['statements'] == 4
+    month_dir = tmp_path / 'statements' / month
+    assert sorted(os.listdir(month_dir)) == sorted(f"user-{user_id}.txt" for user_id in users)
+    for user_id, amount in zip(users[:3], (10, 20, 30)):
+        text = (month_dir / f"user-{user_id}.txt").read_text()
+        assert f"Total Income:   ${amount * 100:>10,.2f}" in text
+        assert f"Food                 ${amount:>10,.2f}" in text
+    assert "No expenses this month." in (month_dir / f"user-{users[3]}.txt").read_text()
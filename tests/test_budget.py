@@ -0,0 +1,21 @@
+import budget
+from budget import check_spending_against_budget, set_budget
+from transactions import add_transaction
+
+
+def test_change_recorded_during_load_is_not_lost(user_id, monkeypatch):
+    set_budget(user_id, 'Food', 100)
+    budget.invalidate_budget_state(user_id)
+    load = budget._load_budget_state
+    writes = []
+
+    def load_racing_a_write(uid, year_month):
+        state = load(uid, year_month)
+        if not writes:
+            # Committed and recorded after the read, before the state is stored.
+            writes.append(1)
+            add_transaction(user_id, 'expense', 'Food', 150, '')
+        return state
+
+    monkeypatch.setattr(budget, '_load_budget_state', load_racing_a_write)
+    assert check_spending_against_budget(user_id, 'Food') == (True, 5000)
@@ -0,0 +1,67 @@
+import sys
+
+import pytest
+
+import analytics
+import columnar
+from columnar import ColumnarFile, export_user, import_columnar
+from database import get_connection
+from transactions import add_transaction
+
+
+@pytest.fixture
+def exported(user_id, tmp_path):
+    for trans_type, category, amount in [('income', 'Salary', 2500), ('expense', 'Food', 12.5),
+                                         ('expense', 'Food', 14), ('expense', 'Rent', 900),
+                                         ('expense', 'Food', 480)]:
+        add_transaction(user_id, trans_type, category, amount, None)
+    path = str(tmp_path / 'alice.fcol')
+    assert export_user(user_id, path) == 5
+    return path
+
+
+def test_analytics_read_a_columnar_export(user_id, exported):
+    pytest.importorskip('numpy')
+    with ColumnarFile(exported) as source:
+        arrays = source.to_arrays()
+        assert analytics.rolling_average_of_arrays(arrays) == analytics.rolling_average(user_id)
+        assert (analytics.category_month_deltas_of_arrays(arrays)
+                == analytics.category_month_deltas(user_id))
+        assert (analytics.expense_percentiles_of_arrays(arrays, category='Food')
+                == analytics.expense_percentiles(user_id, category='Food'))
+        assert (analytics.find_anomalies_of_arrays(arrays, threshold=1)
+                == analytics.find_anomalies(user_id, threshold=1))
+
+
+def test_reimporting_the_same_ids_is_reported(user_id, exported, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['columnar.py', 'import', exported])
+    columnar.main()
+    assert "❌ Import failed, nothing was imported" in capsys.readouterr().out
+
+    # Into another user the rows get new IDs.
+    db = get_connection()
+    other = db.execute("INSERT INTO users (username, password_hash) VALUES ('bob', 'x')").lastrowid
+    db.commit()
+    assert import_columnar(exported, other)['rows'] == 5
+
+
+def test_round_trip_into_another_user(user_id, exported):
+    db = get_connection()
+    other = db.execute("INSERT INTO users (username, password_hash) VALUES ('carol', 'x')").lastrowid
+    db.commit()
+    import_columnar(exported, other)
+
+    def rows(owner):
+        return get_connection(owner).execute(
+            """SELECT type, category, amount, date, description FROM all_transactions
+               WHERE user_id = ? ORDER BY id""", (owner,)).fetchall()
+
+    def totals(owner):
+        return get_connection(owner).execute(
+            """SELECT year_month, type, category, total, count FROM monthly_totals
+               WHERE user_id = ? ORDER BY year_month, type, category""", (owner,)).fetchall()
+
+    assert rows(other) == rows(user_id)
+    assert totals(other) == totals(user_id)
+    with ColumnarFile(exported) as source:
+        assert source.monthly_totals() == totals(user_id)
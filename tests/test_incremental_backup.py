@@ -0,0 +1,23 @@
+import backup_catalog
+import database
+from incremental_backup import create_incremental_backup_set, list_snapshots, select_snapshots_to_keep
+
+
+def test_snapshot_set_covers_every_shard(db_path, backup_dir):
+    database.set_shard_count(2)
+    database.initialize_database()
+
+    results = create_incremental_backup_set()
+
+    assert all(results) and len(results) == 3
+    assert len(list_snapshots()) == 3
+    targets = sorted(entry['target'] for entry in backup_catalog.list_cataloged_backups())
+    assert targets == ['main', 'shard0', 'shard1']
+
+
+def test_retention_orders_snapshots_within_a_second():
+    names = ['snapshot_2024-06-01_10-00-00.json',
+             'snapshot_2024-06-01_10-00-05-120.json',
+             'snapshot_2024-06-01_10-00-05-870.json']
+
+    assert select_snapshots_to_keep(names, {'hourly': 1}) == {'snapshot_2024-06-01_10-00-05-870.json'}
@@ -0,0 +1,15 @@
+import instrumentation
+from database import get_connection
+
+
+def test_reset_between_execute_and_fetch(user_id):
+    instrumentation.enable()
+    instrumentation.reset()
+    try:
+        cursor = get_connection().execute("SELECT id FROM users WHERE username = ?", ('alice',))
+        instrumentation.reset()
+        assert cursor.fetchall() == [(user_id,)]
+        assert instrumentation.get_stats()['queries'] == {}
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
@@ -0,0 +1,25 @@
+import instrumentation
+import queries
+from database import get_connection
+
+
+def test_every_statement_uses_an_index(db_path):
+    assert queries.check_query_plans(db_path) == {}
+
+
+def test_statements_compile_against_the_schema(db_path):
+    queries.validate_queries(db_path)
+
+
+def test_query_stats_come_from_instrumentation(user_id):
+    instrumentation.enable()
+    instrumentation.reset()
+    try:
+        queries.execute(get_connection(), 'users.by_username', ('alice',)).fetchall()
+        stats = queries.get_query_stats()
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+    assert stats['users.by_username']['count'] == 1
+    assert stats['users.by_username']['rows_returned'] == 1
@@ -0,0 +1,56 @@
+import pytest
+
+import database
+from backup import BackupError, create_backup, create_backup_set
+from selective_restore import restore_user
+from transactions import add_transaction
+
+
+def _add_user(name):
+    cursor = database.get_connection().cursor()
+    cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (name,))
+    database.get_connection().commit()
+    return cursor.lastrowid
+
+
+def _count(user_id):
+    return database.get_connection(user_id).execute(
+        "SELECT COUNT(*) FROM all_transactions WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def test_restore_brings_back_deleted_rows(user_id, backup_dir):
+    add_transaction(user_id, 'expense', 'Food', 10, '')
+    add_transaction(user_id, 'expense', 'Food', 20, '')
+    path = create_backup(quiet=True)
+    database.get_connection().execute("DELETE FROM transactions")
+    database.get_connection().commit()
+
+    result = restore_user(user_id, path)
+
+    assert result['transactions'] == 2
+    assert _count(user_id) == 2
+
+
+def test_backup_without_the_users_rows_is_refused(user_id, backup_dir):
+    other = _add_user('bob')
+    add_transaction(other, 'expense', 'Food', 10, '')
+    path = create_backup(quiet=True)   # before the user had any data
+    add_transaction(user_id, 'expense', 'Food', 20, '')
+
+    with pytest.raises(BackupError, match='holds no transactions'):
+        restore_user(user_id, path)
+    assert _count(user_id) == 1
+
+
+def test_backup_of_another_shard_is_refused(db_path, backup_dir):
+    database.set_shard_count(2)
+    database.initialize_database()
+    first, second = _add_user('alice'), _add_user('bob')
+    add_transaction(first, 'expense', 'Food', 10, '')
+    add_transaction(second, 'expense', 'Food', 20, '')
+    paths = create_backup_set()
+    other_shard = next(path for path in paths if f"_shard{database.shard_for_user(second)}" in path)
+
+    with pytest.raises(BackupError, match='is a backup of'):
+        restore_user(first, other_shard)
+    assert _count(first) == 1
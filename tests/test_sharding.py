@@ -0,0 +1,26 @@
+from datetime import date, timedelta
+
+from archive import archive_closed_months
+from database import get_connection
+from sharding import split_database
+from transactions import add_transaction
+
+
+def _all_ids(user_id):
+    return [row[0] for row in get_connection(user_id).execute(
+        "SELECT id FROM all_transactions WHERE user_id = ?", (user_id,))]
+
+
+def test_split_keeps_archived_ids_reserved(user_id, backup_dir):
+    for amount in (10, 20, 30):
+        add_transaction(user_id, 'expense', 'Food', amount, '')
+    later = date.today() + timedelta(days=62)
+    archive_closed_months(keep_months=0, today=later)
+
+    split_database(1)
+    add_transaction(user_id, 'expense', 'Food', 40, '')
+    ids = _all_ids(user_id)
+    assert len(ids) == len(set(ids)) == 4
+
+    assert archive_closed_months(keep_months=0, today=later)['rows'] == 1
+    assert sorted(_all_ids(user_id)) == sorted(ids)
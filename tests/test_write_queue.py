@@ -0,0 +1,44 @@
+import pytest
+
+import transactions
+import write_queue
+from write_queue import WriteQueue
+
+
+def test_writer_survives_a_failed_connection(user_id, monkeypatch):
+    queue = WriteQueue(batch_window=0)
+    real = write_queue.get_shard_connection
+    calls = []
+
+    def flaky(shard):
+        calls.append(shard)
+        if len(calls) == 1:
+            raise RuntimeError("disk went away")
+        return real(shard)
+
+    monkeypatch.setattr(write_queue, 'get_shard_connection', flaky)
+    try:
+        with pytest.raises(RuntimeError, match="disk went away"):
+            queue.add_transaction(user_id, 'expense', 'Food', 10, '').result(timeout=5)
+        # The same writer thread still serves later writes.
+        result = queue.add_transaction(user_id, 'expense', 'Food', 20, '').result(timeout=5)
+        assert result['id']
+    finally:
+        queue.close()
+
+
+def test_failing_change_listener_does_not_fail_the_write(user_id, monkeypatch):
+    seen = []
+
+    def broken(_):
+        raise ValueError("listener bug")
+
+    monkeypatch.setattr(transactions, '_change_listeners', [broken, seen.append])
+    queue = WriteQueue(batch_window=0)
+    try:
+        result = queue.add_transaction(user_id, 'expense', 'Food', 10, '').result(timeout=5)
+        assert result['id']
+        assert queue.delete_transaction(result['id'], user_id).result(timeout=5) is True
+    finally:
+        queue.close()
+    assert seen == [user_id, user_id]
@@ -1,9 +1,87 @@
 ## This file will handle all logic related to income and expenses.
 
-import sqlite3
+import logging
 from datetime import date
-from budget import check_spending_against_budget
+from database import get_connection
+import queries
+from instrumentation import timed_operation
+from budget import check_spending_against_budget, record_spending_change
+from money import Money, to_cents
 
+log = logging.getLogger('finance.transactions')
+
+# --- Write helpers ---
+# These run the SQL for one change on the given cursor without committing,
+# and return what the budget cache needs to know about it. The public
+# functions below commit, then pass the result to _apply_spending_changes().
+# Amounts are stored in cents; see money.to_cents() for what callers may pass.
+
+def _insert_transaction(cursor, user_id, trans_type, category, amount, description, trans_date=None):
+    """Inserts a row. Returns (new_id, spending_changes)."""
+    trans_date = trans_date or date.today().isoformat()
+    amount = to_cents(amount)
+    queries.execute(cursor, 'transactions.insert',
+                    (user_id, trans_type, category, amount, trans_date, description))
+    changes = []
+    if trans_type == 'expense':
+        changes.append((category, trans_date[:7], amount))
+    return cursor.lastrowid, changes
+
+
+def _delete_transaction(cursor, transaction_id, user_id):
+    """Deletes a row. Returns (success, spending_changes)."""
+    queries.execute(cursor, 'transactions.delete', (transaction_id, user_id))
+    old = cursor.fetchone()
+    if old is None:
+        return False, []
+    old_type, old_category, old_amount, old_date = old
+    changes = []
+    if old_type == 'expense':
+        changes.append((old_category, old_date[:7], -Money(old_amount)))
+    return True, changes
+
+
+def _update_transaction(cursor, transaction_id, user_id, new_amount, new_category, new_desc):
+    """Updates a row. Returns (success, spending_changes)."""
+    queries.execute(cursor, 'transactions.get', (transaction_id, user_id))
+    old = cursor.fetchone()
+    if old is None:
+        return False, []
+    new_amount = to_cents(new_amount)
+    queries.execute(cursor, 'transactions.update',
+                    (new_amount, new_category, new_desc, transaction_id, user_id))
+    old_type, old_category, old_amount, old_date = old
+    changes = []
+    if old_type == 'expense':
+        changes.append((old_category, old_date[:7], -Money(old_amount)))
+        changes.append((new_category, old_date[:7], new_amount))
+    return cursor.rowcount > 0, changes
+
+
+# Callables run with the user_id after each committed change to a user's
+# transactions, for caches other than the budget one (see analytics.py).
+_change_listeners = []
+
+
+def add_change_listener(callback):
+    """Registers callback(user_id) to run after every committed transaction change."""
+    _change_listeners.append(callback)
+
+
+def _apply_spending_changes(user_id, changes):
+    """Passes committed (category, year_month, delta) changes to the budget cache."""
+    for category, year_month, delta in changes:
+        record_spending_change(user_id, category, year_month, delta)
+    # The change is already committed; a failing listener must not turn it
+    # into an error for the caller or keep the other listeners from running.
+    for callback in _change_listeners:
+        try:
+            callback(user_id)
+        except Exception:
+            log.exception("change listener %r failed for user %s", callback, user_id)
+
+
+@timed_operation('add_transaction')
 def add_transaction(user_id, trans_type, category, amount, description):
     """
     Adds a new income or expense record to the transactions table.
@@ -12,78 +90,161 @@ def add_transaction(user_id, trans_type, category, amount, description):
         user_id (int): The ID of the user adding the transaction.
         trans_type (str): The type of transaction ('income' or 'expense').
         category (str): The category of the transaction (e.g., 'Salary', 'Food').
-        amount (float): The amount of the transaction.
+        amount (Money or float): The amount of the transaction; anything
+                                 but Money is read as dollars.
         description (str): A brief description of the transaction.
     """
-    db = sqlite3.connect('finance.db')
+    db = get_connection(user_id)
     cursor = db.cursor()
 
-    # Get the current date in YYYY-MM-DD format
-    current_date = date.today().isoformat()
-
-    cursor.execute(
-        """INSERT INTO transactions (user_id, type, category, amount, date, description)
-           VALUES (?, ?, ?, ?, ?, ?)""",
-        (user_id, trans_type, category, amount, current_date, description)
-    )
+    # The transaction is dated today (YYYY-MM-DD)
+    _, changes = _insert_transaction(cursor, user_id, trans_type, category, amount, description)
 
     db.commit()
-    db.close()
-    print(f"✅ {trans_type.capitalize()} of ${amount} added successfully.")
+    _apply_spending_changes(user_id, changes)
+    print(f"✅ {trans_type.capitalize()} of ${to_cents(amount)} added successfully.")
 
-     # --- NEW: Check budget after adding an expense ---
+     # --- NEW: Check budget after adding an expense (an in-memory lookup) ---
     if trans_type == 'expense':
         is_over, amount_over = check_spending_against_budget(user_id, category)
         if is_over:
             print(f"⚠️  Warning: You have exceeded your budget for '{category}' by ${amount_over:,.2f} this month.")
 
 
+DEFAULT_PAGE_SIZE = 20
+
+
+@timed_operation('transactions_page')
+def get_transactions_page(user_id, page_size=DEFAULT_PAGE_SIZE, cursor=None,
+                          start_date=None, end_date=None, trans_type=None, category=None,
+                          include_archive=False):
+    """
+    Retrieves one page of a user's transactions, newest first.
+
+    Pages are keyed on (date, id) rather than an OFFSET: each page starts
+    right after the last row of the previous one, so fetching page 100
+    costs the same as fetching page 1.
+
+    Args:
+        user_id (int): The ID of the user whose transactions to view.
+        page_size (int): The maximum number of rows to return.
+        cursor (tuple): The next_cursor returned with the previous page, or
+                        None for the first page.
+        start_date (str): Only include transactions on or after this
+                          'YYYY-MM-DD' date.
+        end_date (str): Only include transactions before this date.
+        trans_type (str): Only include 'income' or 'expense' rows.
+        category (str): Only include rows in this category.
+        include_archive (bool): Also page through closed months moved to
+                                transactions_archive (see archive.py).
+                                Without it only the hot table is read.
+
+    Returns:
+        tuple: (rows, next_cursor). Each row is (id, date, type, category,
+               amount, description), amount as Money. next_cursor is None
+               on the last page.
+    """
+    conditions = ["user_id = ?"]
+    params = [user_id]
+    if trans_type is not None:
+        conditions.append("type = ?")
+        params.append(trans_type)
+    if category is not None:
+        conditions.append("category = ?")
+        params.append(category)
+    if start_date is not None:
+        conditions.append("date >= ?")
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append("date < ?")
+        params.append(end_date)
+    if cursor is not None:
+        conditions.append("(date, id) < (?, ?)")
+        params.extend(cursor)
+
+    db = get_connection(user_id)
+    tables = ['transactions', 'transactions_archive'] if include_archive else ['transactions']
+    rows = []
+    for table in tables:
+        # Ask for one extra row to find out whether another page follows.
+        rows += db.execute(
+            f"""SELECT id, date, type, category, amount, description FROM {table}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY date DESC, id DESC
+                LIMIT ?""",
+            params + [page_size + 1]
+        ).fetchall()
+    if len(tables) > 1:
+        # Both tables are read with the same keyset, so merging their first
+        # rows gives the combined page.
+        rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+        rows = rows[:page_size + 1]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1][1], rows[-1][0])
+    rows = [(row_id, row_date, trans_type, row_category, Money(amount), description)
+            for row_id, row_date, trans_type, row_category, amount, description in rows]
+    return rows, next_cursor
+
+
+def iter_transactions(user_id, batch_size=500, **filters):
+    """
+    Yields a user's transactions one at a time, newest first.
+
+    Rows are fetched a page at a time, so only `batch_size` rows are held
+    in memory however long the history is. Accepts the same filters as
+    get_transactions_page().
+    """
+    cursor = None
+    while True:
+        rows, cursor = get_transactions_page(user_id, batch_size, cursor, **filters)
+        yield from rows
+        if cursor is None:
+            return
+
+
 def view_transactions(user_id):
     """
     Retrieves and returns all transactions for a specific user.
 
+    This loads the user's whole history, archived months included; prefer
+    get_transactions_page() or iter_transactions() for anything that may be large.
+
     Args:
         user_id (int): The ID of the user whose transactions to view.
 
     Returns:
-        list: A list of tuples, where each tuple is a transaction record.
+        list: A list of (id, date, type, category, amount, description) tuples.
     """
-    db = sqlite3.connect('finance.db')
-    cursor = db.cursor()
-    cursor.execute(
-        """SELECT date, type, category, amount, description FROM transactions
-           WHERE user_id = ? ORDER BY date DESC""",
-        (user_id,)
-    )
-    transactions = cursor.fetchall()
-    db.close()
-    return transactions
+    return list(iter_transactions(user_id, include_archive=True))
 
+@timed_operation('delete_transaction')
 def delete_transaction(transaction_id, user_id):
     """Deletes a specific transaction belonging to a user."""
-    db = sqlite3.connect('finance.db')
+    db = get_connection(user_id)
     cursor = db.cursor()
-    cursor.execute(
-        "DELETE FROM transactions WHERE id = ? AND user_id = ?",
-        (transaction_id, user_id)
-    )
-    success = cursor.rowcount > 0
+    success, changes = _delete_transaction(cursor, transaction_id, user_id)
     db.commit()
-    db.close()
+    _apply_spending_changes(user_id, changes)
     return success
 
 
+@timed_operation('update_transaction')
 def update_transaction(transaction_id, user_id, new_amount, new_category, new_desc):
     """Updates the details of a specific transaction."""
-    db = sqlite3.connect('finance.db')
+    db = get_connection(user_id)
     cursor = db.cursor()
-    cursor.execute(
-        """UPDATE transactions 
-           SET amount = ?, category = ?, description = ?
-           WHERE id = ? AND user_id = ?""",
-        (new_amount, new_category, new_desc, transaction_id, user_id)
-    )
-    success = cursor.rowcount > 0
-    db.commit()
-    db.close()
-    return success
\ No newline at end of file
+    # BEGIN IMMEDIATE takes the write lock up front, so the row read for the
+    # budget cache cannot change before the UPDATE runs.
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        success, changes = _update_transaction(cursor, transaction_id, user_id,
+                                               new_amount, new_category, new_desc)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    _apply_spending_changes(user_id, changes)
+    return success
@@ -0,0 +1,304 @@
+# write_queue.py
+## Single-writer queue that group-commits mutations.
+##
+## Callers on any thread submit writes and get a concurrent.futures.Future
+## back. One writer thread takes whatever has queued up (up to max_batch
+## operations, waiting at most batch_window seconds for more to arrive) and
+## commits it as one transaction, so N concurrent writers cost one commit
+## and never fight each other for the database lock. With sharding on there
+## is one writer thread per shard, so shards commit in parallel.
+##
+## Usage:
+##   future = submit_add_transaction(user_id, 'expense', 'Food', 12.5, 'Lunch')
+##   future.result()   # {'id': ..., 'over_budget': ..., 'amount_over': ...}
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from budget import check_spending_against_budget, invalidate_budget_state, record_budget_limit
+from money import to_cents
+from database import get_shard_connection, shard_for_user
+import queries
+from transactions import (_apply_spending_changes, _delete_transaction, _insert_transaction,
+                          _update_transaction)
+
+DEFAULT_MAX_BATCH = 128
+# How long the writer waits for more writes to join a batch, in seconds.
+DEFAULT_BATCH_WINDOW = 0.002
+
+log = logging.getLogger('finance.write_queue')
+
+
+# --- Write operations ---
+# Each runs on the writer thread inside the batch's transaction and returns
+# (user_id, spending_changes, after_commit), with user_id None when no
+# transactions changed. Once the batch has been committed the spending
+# changes of the whole batch are applied to the budget cache first, then
+# every after_commit callable is called for the caller's result.
+# Applying them all before any after_commit matters: a budget check can load
+# a user's state from the database, which already includes the whole batch.
+
+def _op_add_transaction(cursor, user_id, trans_type, category, amount, description):
+    transaction_id, changes = _insert_transaction(cursor, user_id, trans_type, category,
+                                                  amount, description)
+
+    def after_commit():
+        result = {'id': transaction_id, 'over_budget': False, 'amount_over': 0}
+        if trans_type == 'expense':
+            is_over, amount_over = check_spending_against_budget(user_id, category)
+            result.update(over_budget=is_over, amount_over=amount_over)
+        return result
+    return user_id, changes, after_commit
+
+
+def _op_delete_transaction(cursor, transaction_id, user_id):
+    success, changes = _delete_transaction(cursor, transaction_id, user_id)
+    return user_id, changes, lambda: success
+
+
+def _op_update_transaction(cursor, transaction_id, user_id, new_amount, new_category, new_desc):
+    success, changes = _update_transaction(cursor, transaction_id, user_id,
+                                           new_amount, new_category, new_desc)
+    return user_id, changes, lambda: success
+
+
+def _op_set_budget(cursor, user_id, category, limit):
+    limit = to_cents(limit)
+    queries.execute(cursor, 'budgets.upsert', (user_id, category, limit))
+
+    def after_commit():
+        record_budget_limit(user_id, category, limit)
+        return True
+    return None, [], after_commit
+
+
+def _op_register_user(cursor, username, password_hash):
+    try:
+        queries.execute(cursor, 'users.insert', (username, password_hash))
+    except sqlite3.IntegrityError:
+        return None, [], lambda: False
+    return None, [], lambda: True
+
+
+def _run_write_batch(batch, shard=None):
+    """
+    Runs a list of (operation, args) in one transaction on a writer thread.
+
+    Every operation gets its own savepoint, so one failing operation is
+    rolled back on its own without affecting the others in the batch.
+
+    Args:
+        batch (list): The operations to run.
+        shard (int): The shard they all belong to (None for the main database).
+
+    Returns:
+        list: One (ok, result_or_exception) pair per operation.
+    """
+    db = None
+    outcomes = []
+    try:
+        db = get_shard_connection(shard)
+        cursor = db.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        for operation, args in batch:
+            cursor.execute("SAVEPOINT batch_op")
+            try:
+                outcomes.append((True, operation(cursor, *args)))
+                cursor.execute("RELEASE batch_op")
+            except Exception as e:
+                cursor.execute("ROLLBACK TO batch_op")
+                cursor.execute("RELEASE batch_op")
+                outcomes.append((False, e))
+        db.commit()
+    except Exception as e:
+        if db is not None:
+            db.rollback()
+        return [(False, e)] * len(batch)
+
+    for ok, value in outcomes:
+        if ok and value[0] is not None:
+            try:
+                _apply_spending_changes(value[0], value[1])
+            except Exception:
+                # Committed either way; drop the user's cached budget state
+                # rather than leave it missing this change.
+                log.exception("could not apply committed changes for user %s", value[0])
+                invalidate_budget_state(value[0])
+
+    results = []
+    for ok, value in outcomes:
+        if not ok:
+            results.append((False, value))
+            continue
+        try:
+            results.append((True, value[2]()))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class WriteQueue:
+    """
+    Writer threads that commit queued mutations in groups.
+
+    Writes are grouped into batches of up to `max_batch` operations, waiting
+    at most `batch_window` seconds for a batch to fill. Each database file
+    (the main one, or each shard) gets its own queue and writer thread,
+    started on its first submit().
+    """
+
+    def __init__(self, max_batch=DEFAULT_MAX_BATCH, batch_window=DEFAULT_BATCH_WINDOW):
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.batches_committed = 0
+        self.writes_committed = 0
+        self._writers = {}  # shard (None for the main database) -> (queue, thread)
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, operation, *args, user_id=None):
+        """
+        Queues `operation(cursor, *args)`; see the _op_* functions.
+
+        Args:
+            user_id (int): Whose data the operation changes; picks the shard.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the operation's result, or
+                                       to the exception it raised.
+        """
+        future = Future()
+        shard = shard_for_user(user_id)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write queue is closed")
+            writer = self._writers.get(shard)
+            if writer is None:
+                name = 'finance-writer' if shard is None else f'finance-writer-shard{shard}'
+                writes = queue.Queue()
+                thread = threading.Thread(target=self._run, args=(writes, shard), name=name, daemon=True)
+                writer = self._writers[shard] = (writes, thread)
+                thread.start()
+            writer[0].put((operation, args, future))
+        return future
+
+    def close(self, wait=True):
+        """Stops accepting writes; the writers finish what is already queued."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            writers = list(self._writers.values())
+            for writes, _ in writers:
+                writes.put(None)
+        if wait:
+            for _, thread in writers:
+                thread.join()
+
+    # --- Mutations ---
+
+    def add_transaction(self, user_id, trans_type, category, amount, description):
+        """
+        Queues a transaction dated today.
+
+        Returns:
+            Future: Resolves to {'id', 'over_budget', 'amount_over'}, the new
+                    row's ID and the category's budget status afterwards.
+        """
+        return self.submit(_op_add_transaction, user_id, trans_type, category, amount, description,
+                           user_id=user_id)
+
+    def delete_transaction(self, transaction_id, user_id):
+        """Returns a Future resolving to True if the transaction existed and was deleted."""
+        return self.submit(_op_delete_transaction, transaction_id, user_id, user_id=user_id)
+
+    def update_transaction(self, transaction_id, user_id, new_amount, new_category, new_desc):
+        """Returns a Future resolving to True if the transaction existed and was updated."""
+        return self.submit(_op_update_transaction, transaction_id, user_id,
+                           new_amount, new_category, new_desc, user_id=user_id)
+
+    def set_budget(self, user_id, category, limit):
+        """Returns a Future resolving to True once the budget is saved."""
+        return self.submit(_op_set_budget, user_id, category, limit, user_id=user_id)
+
+    def register_user(self, username, password_hash):
+        """Returns a Future resolving to True, or False if the username is taken."""
+        return self.submit(_op_register_user, username, password_hash)
+
+    # --- Writer thread ---
+
+    def _next_batch(self, writes):
+        """Blocks for the next batch from the queue `writes`. Returns (batch, stopping)."""
+        item = writes.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = writes.get(timeout=timeout) if timeout > 0 else writes.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, writes, shard):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch(writes)
+            # Drop writes whose callers cancelled them before they ran.
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = _run_write_batch([(operation, args) for operation, args, _ in batch], shard)
+            except Exception as e:
+                # Whatever went wrong, the callers hear about it and the thread
+                # stays up for the writes queued behind this batch.
+                log.exception("write batch on shard %s failed", shard)
+                results = [(False, e)] * len(batch)
+            with self._lock:
+                self.batches_committed += 1
+                self.writes_committed += len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """Returns the shared WriteQueue, creating it on first use."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue()
+        return _write_queue
+
+
+def submit_add_transaction(user_id, trans_type, category, amount, description):
+    """Queues add_transaction() on the shared write queue. Returns a Future."""
+    return get_write_queue().add_transaction(user_id, trans_type, category, amount, description)
+
+
+def submit_delete_transaction(transaction_id, user_id):
+    """Queues delete_transaction() on the shared write queue. Returns a Future."""
+    return get_write_queue().delete_transaction(transaction_id, user_id)
+
+
+def submit_update_transaction(transaction_id, user_id, new_amount, new_category, new_desc):
+    """Queues update_transaction() on the shared write queue. Returns a Future."""
+    return get_write_queue().update_transaction(transaction_id, user_id,
+                                                new_amount, new_category, new_desc)